@@ -0,0 +1,198 @@
+import os
+import argparse
+import numpy as np
+import pandas as pd
+
+from generate_failure_logs import COMPONENT_LIFESPANS, MONTHLY_SENSOR_COLUMNS
+from generate_synthetic_data import FAILURE_WINDOW_HOURS, SAMPLE_DTYPES, write_fleet
+
+# Turns the daily logs written by generate_failure_logs.py into the monthly schema that mae_403.py trains on.
+# Each chunk of the daily export is reduced to partial aggregates per (tractor, month) in one groupby pass.
+# The partials are mergeable (sums, counts, mins, maxes and the value at the latest date), so exports
+# larger than memory can be streamed with `chunksize` and only the small monthly partials are kept.
+# Each daily sensor with a monthly counterpart (MONTHLY_SENSOR_COLUMNS) becomes that column, holding the month's
+# mean reading, so the output has the columns of the synthetic monthly data (SAMPLE_DTYPES, in that order) and
+# trains like it. The month's lowest and highest readings follow each mean as <column>_min and <column>_max.
+# Monthly columns the daily logs have no data for are left out rather than written empty, since training drops
+# every row with a missing value; the other daily sensors are not read.
+
+TELEMETRY_COLUMNS = [f"telemetry_{param_name}" for param_name in MONTHLY_SENSOR_COLUMNS]
+
+# Failed components are encoded like `type_of_failure` in the synthetic data: an integer index
+COMPONENT_INDEX = {component_name: i for i, component_name in enumerate(COMPONENT_LIFESPANS)}
+
+DAILY_COLUMNS = [
+    "tractor_id", "date", "operating_hours_today", "cumulative_operating_hours",
+    "is_failure", "failed_component", "time_until_next_failure_hours"
+] + TELEMETRY_COLUMNS
+
+DEFAULT_CHUNKSIZE = 500_000
+
+
+def _partial_monthly_aggregates(daily_df):
+    """Reduces a chunk of daily records to one row of mergeable aggregates per (tractor_id, period)."""
+    daily_df = daily_df.copy()
+    daily_df["date"] = pd.to_datetime(daily_df["date"])
+    daily_df["period"] = daily_df["date"].dt.to_period("M")
+    daily_df = daily_df.sort_values(["tractor_id", "date"], kind="stable")
+    # Only failure days carry a component; first() below skips the NaNs of the other days
+    daily_df["failed_component"] = daily_df["failed_component"].where(daily_df["is_failure"] == 1)
+
+    aggregations = {
+        "first_date": ("date", "min"),
+        "last_date": ("date", "max"),
+        "days": ("date", "size"),
+        "monthly_operating_hours": ("operating_hours_today", "sum"),
+        "cumulative_hours": ("cumulative_operating_hours", "last"),
+        "time_until_next_failure_hours": ("time_until_next_failure_hours", "last"),
+        "failure_count": ("is_failure", "sum"),
+        "failed_component": ("failed_component", "first"),
+    }
+    for column in TELEMETRY_COLUMNS:
+        sensor = column[len("telemetry_"):]
+        aggregations[f"{sensor}_sum"] = (column, "sum")
+        aggregations[f"{sensor}_count"] = (column, "count")
+        aggregations[f"{sensor}_min"] = (column, "min")
+        aggregations[f"{sensor}_max"] = (column, "max")
+
+    return daily_df.groupby(["tractor_id", "period"], sort=False).agg(**aggregations).reset_index()
+
+
+def _merge_partials(partials):
+    """Merges partial aggregates of the same (tractor_id, period) coming from different chunks."""
+    combined = pd.concat(partials, ignore_index=True)
+    # Chunks may split a month; order partials by time so "last"/"first" refer to the right days
+    combined = combined.sort_values(["tractor_id", "period", "last_date"], kind="stable")
+
+    aggregations = {
+        "first_date": ("first_date", "min"),
+        "last_date": ("last_date", "max"),
+        "days": ("days", "sum"),
+        "monthly_operating_hours": ("monthly_operating_hours", "sum"),
+        "cumulative_hours": ("cumulative_hours", "last"),
+        "time_until_next_failure_hours": ("time_until_next_failure_hours", "last"),
+        "failure_count": ("failure_count", "sum"),
+        "failed_component": ("failed_component", "first"),
+    }
+    for column in TELEMETRY_COLUMNS:
+        sensor = column[len("telemetry_"):]
+        aggregations[f"{sensor}_sum"] = (f"{sensor}_sum", "sum")
+        aggregations[f"{sensor}_count"] = (f"{sensor}_count", "sum")
+        aggregations[f"{sensor}_min"] = (f"{sensor}_min", "min")
+        aggregations[f"{sensor}_max"] = (f"{sensor}_max", "max")
+
+    return combined.groupby(["tractor_id", "period"], sort=True).agg(**aggregations).reset_index()
+
+
+def _finalize_monthly(merged):
+    """
+    Turns merged partial aggregates into the monthly training schema (the SAMPLE_DTYPES columns the daily logs
+    provide, each sensor mean followed by its monthly min and max) with a failure-aligned RUL label.
+    """
+    monthly = pd.DataFrame({
+        "sample_id": merged["tractor_id"],
+        "date": merged["period"].dt.start_time.dt.strftime("%Y-%m-%d"),
+        "month": merged["period"].dt.month.astype("int64"),
+        "year": merged["period"].dt.year.astype("int64"),
+        "cumulative_hours": merged["cumulative_hours"].round(2),
+        "monthly_operating_hours": merged["monthly_operating_hours"].round(2),
+    })
+
+    # Monthly mean, min and max of every sensor, each in one array operation; months without a reading stay NaN
+    sensors = list(MONTHLY_SENSOR_COLUMNS)
+    sensor_columns = list(MONTHLY_SENSOR_COLUMNS.values())
+    counts = merged[[f"{sensor}_count" for sensor in sensors]].to_numpy(dtype="float64")
+    counts[counts == 0] = np.nan
+    means = merged[[f"{sensor}_sum" for sensor in sensors]].to_numpy(dtype="float64") / counts
+    monthly[sensor_columns] = np.round(means, 2)
+    for statistic in ("min", "max"):
+        values = merged[[f"{sensor}_{statistic}" for sensor in sensors]].to_numpy(dtype="float64")
+        monthly[[f"{column}_{statistic}" for column in sensor_columns]] = np.round(values, 2)
+
+    failure_occurred = (merged["failure_count"] > 0).astype("int64")
+
+    # RUL at the end of the month, measured in operating hours like the synthetic data:
+    #   - 0 in a month with a failure (the synthetic data's failure row)
+    #   - otherwise the last day's time_until_next_failure_hours
+    #   - NaN when no failure follows (-1 in the daily logs), so the row is right-censored and dropped in training
+    rul = merged["time_until_next_failure_hours"].astype("float64")
+    rul = rul.where(rul >= 0)
+    rul = rul.mask(failure_occurred == 1, 0.0)
+
+    # The failure a month is counting down to is the first failure in a later month of the same tractor
+    component_code = merged["failed_component"].map(COMPONENT_INDEX)
+    next_component_code = component_code.groupby(merged["tractor_id"]).shift(-1).groupby(merged["tractor_id"]).bfill()
+    type_of_failure = component_code.where(failure_occurred == 1, next_component_code)
+
+    monthly["failure_imminent"] = ((failure_occurred == 0) & (rul <= FAILURE_WINDOW_HOURS)).astype("int64")
+    monthly["failure_occurred"] = failure_occurred
+    monthly["type_of_failure"] = type_of_failure.astype("Int64")
+    monthly["remaining_useful_life_hours"] = rul.round(2)
+    columns = []
+    for column in SAMPLE_DTYPES:
+        if column in monthly.columns:
+            columns.append(column)
+            if column in sensor_columns:
+                columns.extend([f"{column}_min", f"{column}_max"])
+    return monthly[columns]
+
+
+def aggregate_daily_dataframe(daily_df):
+    """Aggregates an in-memory DataFrame of daily records into the monthly training schema."""
+    return _finalize_monthly(_merge_partials([_partial_monthly_aggregates(daily_df)]))
+
+
+def aggregate_daily_logs(input_paths, chunksize=DEFAULT_CHUNKSIZE, verbose=True):
+    """
+    Streams one or more daily telemetry CSV exports in chunks of `chunksize` rows and returns the
+    monthly training DataFrame. Memory use is bounded by the chunk size plus one row per tractor-month.
+    """
+    if isinstance(input_paths, str):
+        input_paths = [input_paths]
+
+    partials = []
+    total_rows = 0
+    for input_path in input_paths:
+        reader = pd.read_csv(input_path, usecols=lambda c: c in DAILY_COLUMNS, chunksize=chunksize)
+        for chunk in reader:
+            partials.append(_partial_monthly_aggregates(chunk))
+            total_rows += len(chunk)
+        if verbose:
+            print(f"Aggregated {input_path} ({total_rows} daily rows so far).")
+
+    if not partials:
+        return None
+
+    monthly = _finalize_monthly(_merge_partials(partials))
+    if verbose:
+        print(f"Built {len(monthly)} monthly rows for {monthly['sample_id'].nunique()} tractors from {total_rows} daily rows.")
+    return monthly
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Aggregate daily failure logs into the monthly training schema.")
+    parser.add_argument("inputs", nargs="+", help="Daily telemetry CSV files or folders containing them.")
+    parser.add_argument("--output-dir", default="training_data_csv", help="Folder for the per-tractor monthly files.")
+    parser.add_argument("--format", default="csv", choices=["csv", "parquet"], help="Output file format.")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE, help="Daily rows read per chunk.")
+    args = parser.parse_args(argv)
+
+    input_paths = []
+    for path in args.inputs:
+        if os.path.isdir(path):
+            input_paths.extend(sorted(
+                os.path.join(path, filename) for filename in os.listdir(path) if filename.endswith(".csv")
+            ))
+        else:
+            input_paths.append(path)
+
+    monthly = aggregate_daily_logs(input_paths, chunksize=args.chunksize)
+    if monthly is None:
+        print("No daily records found.")
+        return
+
+    write_fleet([monthly], args.output_dir, file_format=args.format)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,106 +1,803 @@
+import os
+import re
+import sys
+import atexit
+import threading
+from collections import OrderedDict
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 import joblib
 import numpy as np
 import pandas as pd
+import xgboost
 
 app = Flask(__name__)
 CORS(app)
 
+# Paths default to the repository layout and can be overridden for other deployments and benchmarks
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL_PATH = os.environ.get('RUL_MODEL_PATH', os.path.join(REPO_ROOT, 'mae_403.joblib'))
+HISTORY_CSV_PATH = os.environ.get('RUL_HISTORY_CSV', os.path.join(REPO_ROOT, 'frontend', 'public', 'sample_0_data.csv'))
+COMPONENT_MODELS_PATH = os.environ.get('RUL_COMPONENT_MODELS_PATH', os.path.join(REPO_ROOT, 'component_models.joblib'))
+# Directory shared by the worker processes of one deployment, where each one publishes its live sensor sketches
+DRIFT_DIR = os.environ.get('RUL_DRIFT_DIR')
+# Config written by cascade_scorer.py; when set, /predict_batch skips the model for tractors that pass its first tier
+CASCADE_CONFIG_PATH = os.environ.get('RUL_CASCADE_CONFIG')
+TRAJECTORY_INDEX_PATH = os.environ.get('RUL_TRAJECTORY_INDEX_PATH', os.path.join(REPO_ROOT, 'trajectory_index.joblib'))
+# Folder of a telemetry arena shared by the worker processes (see telemetry_arena.py); unset keeps appended
+# telemetry in this process's memory
+TELEMETRY_ARENA_PATH = os.environ.get('RUL_TELEMETRY_ARENA')
+# Folder of daily telemetry logs written by generate_failure_logs.py, charted by /series
+DAILY_TELEMETRY_DIR = os.environ.get('RUL_DAILY_TELEMETRY_DIR')
+# Folder of per-product-line or per-segment models (<route>.joblib plus sidecars, see model_registry.py), loaded on
+# first use into an LRU cache of RUL_MODEL_CACHE_MB; requests without a matching model use MODEL_PATH
+MODEL_DIR = os.environ.get('RUL_MODEL_DIR')
+MODEL_CACHE_MB = float(os.environ.get('RUL_MODEL_CACHE_MB', 1024))
+# RUL_PREDICTOR=compiled scores with the flattened trees of compiled_trees.py instead of XGBoost's predict;
+# RUL_PREDICTOR=inplace skips predict's DMatrix construction with the booster's inplace_predict (same results)
+PREDICTOR = os.environ.get('RUL_PREDICTOR', 'booster')
+
+# Features are engineered by the training code itself, so serving always matches what the model was trained on
+sys.path.insert(0, REPO_ROOT)
+from mae_403 import (
+    COLUMNS_TO_DROP, COMPACT_FLOAT_DTYPE, feature_family, load_feature_params, load_quantile_model, predict_quantiles,
+    preprocess_and_engineer_features
+)
+from component_models import predict_components, rank_components
+from drift_monitor import SensorSketches, drift_reference_path, drift_scores, most_drifted
+from cascade_scorer import load_cascade_config, tier_one
+from trajectory_index import DEFAULT_NEIGHBORS, TRAJECTORY_MONTHS, TrajectoryIndex, trajectory_features
+from telemetry_arena import ArenaWriter, TelemetryArena, arena_columns, arena_exists, create_arena
+from compiled_trees import compile_booster, validate_parity
+from model_registry import ModelRegistry, route_name
+from generate_synthetic_data import SENSOR_BASELINES
+from timeseries import (
+    DEFAULT_SERIES_POINTS, DOWNSAMPLING_ALGORITHMS, MAX_SERIES_POINTS, daily_log_paths, sensor_series, series_frame
+)
+
+# RUL_COMPACT=1 engineers float32 features (see mae_403.to_compact_dtypes), roughly halving per-request memory
+COMPACT_MODE = os.environ.get('RUL_COMPACT', '0') == '1'
+
+# /explain group of the features that are not engineered from a sensor (age, hours, weather, operator, ...)
+OPERATING_GROUP = 'operating'
+
+# Reported as the component when no component models are loaded
+DEFAULT_COMPONENT = 'Engine'
+
+# Priority levels of the frontend and the upper edge (hours until failure) of each
+PRIORITY_BANDS = [('High', 200.0), ('Medium', 1000.0), ('Low', np.inf)]
+
+# Months of history used to engineer features for a prediction (the longest rolling window is 20)
+HISTORY_WINDOW_MONTHS = 30
+
+# Sensors listed per tractor by /explain unless the request asks for another number
+DEFAULT_EXPLAIN_TOP = 5
+
+# Monthly telemetry appended through /telemetry, keyed by sample_id (unless it goes to the telemetry arena)
+telemetry_store = {}
+telemetry_store_lock = threading.Lock()
+
+# With RUL_TELEMETRY_ARENA, every worker maps the arena read-only and appends through its writer, which holds
+# the arena's writer lock only for the duration of an append
+telemetry_arena = arena_writer = None
+arena_writer_lock = threading.Lock()
+if TELEMETRY_ARENA_PATH:
+    if not arena_exists(TELEMETRY_ARENA_PATH):
+        # Same numeric columns (and date) as the monthly schema of the sample history
+        create_arena(TELEMETRY_ARENA_PATH, arena_columns(pd.read_csv(HISTORY_CSV_PATH, nrows=1)))
+    telemetry_arena = TelemetryArena(TELEMETRY_ARENA_PATH)
+    arena_writer = ArenaWriter(TELEMETRY_ARENA_PATH)
+
+# Latest scoring of each tractor from /predict_batch or /explain: its result, aligned feature row and (once
+# requested) explanation. An entry is reused while no telemetry has been appended for the tractor since.
+prediction_cache = {}
+prediction_cache_lock = threading.Lock()
+
+# Live sensor sketches of the telemetry rows this process has scored (see drift_monitor.py), and how many
+# records of each tractor they already include
+live_sketches = SensorSketches()
+sketched_versions = {}
+live_sketches_lock = threading.Lock()
+
+# Scored rows between two publications of this process's live sketches to DRIFT_DIR
+DRIFT_PUBLISH_ROWS = 500
+
+# Downsampled series served by /series, keyed by (tractor, sensor, range, resolution, algorithm, history version),
+# and the parsed histories of the tractors charted last; the least recently used entries are evicted first
+SERIES_CACHE_ENTRIES = 2048
+SERIES_FRAME_CACHE_ENTRIES = 32
+series_cache = OrderedDict()
+series_frames = OrderedDict()
+series_cache_lock = threading.Lock()
+
 # Load your trained model
-def preprocess_and_engineer_features(df, columns_to_drop, lags=3, rolling_windows=[5, 10, 20], diff_periods=[1, 3], ewma_spans=[10, 20]):
-    processed_df = df.copy()
-    if 'sample_id' not in processed_df.columns:
-        temp_sample_id_present = False
-    else:
-        temp_sample_id_present = True
-        processed_df = processed_df.sort_values(by=['sample_id']).reset_index(drop=True)
-
-    numerical_cols_for_fe = [
-        col for col in processed_df.columns
-        if pd.api.types.is_numeric_dtype(processed_df[col]) and
-           col not in ['sample_id', 'remaining_useful_life_hours']
-    ]
-    for col in numerical_cols_for_fe:
-        for i in range(1, lags + 1):
-            if temp_sample_id_present:
-                processed_df[f'{col}_lag_{i}'] = processed_df.groupby('sample_id')[col].shift(i)
-            else:
-                processed_df[f'{col}_lag_{i}'] = processed_df[col].shift(i)
-        for window in rolling_windows:
-            if temp_sample_id_present:
-                processed_df[f'{col}_rolling_mean_{window}'] = processed_df.groupby('sample_id')[col].rolling(window=window).mean().reset_index(level=0, drop=True)
-                processed_df[f'{col}_rolling_std_{window}'] = processed_df.groupby('sample_id')[col].rolling(window=window).std().reset_index(level=0, drop=True)
-            else:
-                processed_df[f'{col}_rolling_mean_{window}'] = processed_df[col].rolling(window=window).mean()
-                processed_df[f'{col}_rolling_std_{window}'] = processed_df[col].rolling(window=window).std()
-        for period in diff_periods:
-            if temp_sample_id_present:
-                processed_df[f'{col}_diff_{period}'] = processed_df.groupby('sample_id')[col].diff(periods=period)
-            else:
-                processed_df[f'{col}_diff_{period}'] = processed_df[col].diff(periods=period)
-        for span in ewma_spans:
-            if temp_sample_id_present:
-                processed_df[f'{col}_ewma_{span}'] = processed_df.groupby('sample_id')[col].ewm(span=span, adjust=False).mean().reset_index(level=0, drop=True)
+model = joblib.load(MODEL_PATH)
+
+# Feature config saved next to the model at training time (a pruned one skips the features the model does not use)
+feature_params = load_feature_params(MODEL_PATH)
+
+
+def load_compiled_predictor(model, feature_params):
+    """The model compiled by compiled_trees.py, checked against the booster on the sample history; None if that fails."""
+    try:
+        compiled = compile_booster(model)
+        X, _ = preprocess_and_engineer_features(pd.read_csv(HISTORY_CSV_PATH), COLUMNS_TO_DROP, **feature_params)
+        difference = validate_parity(compiled, model, X)
+    except ValueError as e:
+        print(f"Using the booster's predict: the compiled predictor is unavailable ({e})")
+        return None
+    print(f"Compiled predictor enabled ({len(compiled.roots)} trees, max difference {difference:.5f} hours)")
+    return compiled
+
+
+def load_component_models(path):
+    """Component model bundle (see component_models.py) if it shares the fleet model's features, otherwise None."""
+    if not os.path.exists(path):
+        return None
+    bundle = joblib.load(path)
+    if 'objective' not in bundle:
+        print(f"Ignoring {path}: its models were trained before censoring and cannot be ranked; retrain them")
+        return None
+    if bundle['feature_params'] != feature_params:
+        print(f"Ignoring {path}: its models use a different feature config than {MODEL_PATH}")
+        return None
+    return bundle
+
+
+# Flattened trees of the model when RUL_PREDICTOR=compiled and they reproduce its predictions; None uses predict
+compiled_model = load_compiled_predictor(model, feature_params) if PREDICTOR == 'compiled' else None
+
+# RUL quantiles exported with the model (see mae_403.train_quantile_model); None for older models
+quantile_model = load_quantile_model(MODEL_PATH)
+
+# Per-component models run on the features engineered for the fleet model (no extra feature pass)
+component_models = load_component_models(COMPONENT_MODELS_PATH)
+
+
+def sensor_groups(booster_model):
+    """
+    (sensor names, one-hot matrix features x sensors) rolling every engineered feature of a sensor up to its input
+    column and every other feature (age, hours, weather, operator, ...) up to OPERATING_GROUP.
+    """
+    columns = [feature_family(name)[0] for name in booster_model.get_booster().feature_names]
+    sensors_of_features = [column if column in SENSOR_BASELINES else OPERATING_GROUP for column in columns]
+    sensors = list(dict.fromkeys(sensors_of_features))
+    groups = np.zeros((len(sensors_of_features), len(sensors)))
+    groups[np.arange(len(sensors_of_features)), [sensors.index(sensor) for sensor in sensors_of_features]] = 1.0
+    return sensors, groups
+
+
+# Everything that scores a request with the fleet model; routed models are served by bundles of the same shape
+fleet_serving = {
+    'route': None,
+    'model': model,
+    'feature_params': feature_params,
+    'compiled': compiled_model,
+    'quantile_model': quantile_model,
+    'component_models': component_models,
+    # e.g. oil_pressure_psi_lag_1 and oil_pressure_psi_rolling_mean_5 both count towards oil_pressure_psi
+    'sensor_groups': sensor_groups(model)
+}
+
+
+def load_routed_model(path):
+    """Serving bundle (like fleet_serving) of a product-line or segment model in RUL_MODEL_DIR."""
+    routed = joblib.load(path)
+    params = load_feature_params(path)
+    return {
+        'route': os.path.splitext(os.path.basename(path))[0],
+        'model': routed,
+        'feature_params': params,
+        'compiled': load_compiled_predictor(routed, params) if PREDICTOR == 'compiled' else None,
+        'quantile_model': load_quantile_model(path),
+        # Component models only read the fleet model's features, so a route gets them only if it shares those
+        'component_models': component_models if params == feature_params else None,
+        'sensor_groups': sensor_groups(routed)
+    }
+
+
+# Routed models, loaded on their first request and evicted least recently used beyond RUL_MODEL_CACHE_MB
+model_registry = ModelRegistry(MODEL_DIR, loader=load_routed_model, max_bytes=int(MODEL_CACHE_MB * 1024 ** 2))
+
+# Sensor sketches of the training data exported with the model; None for older models
+drift_reference = None
+if os.path.exists(drift_reference_path(MODEL_PATH)):
+    drift_reference = SensorSketches.load(drift_reference_path(MODEL_PATH))
+
+# Similar-trajectory index of historical tractor-months (see trajectory_index.py); None without one. Labelled
+# months appended through /telemetry are added to this process's copy, which is not saved: rebuild the file offline
+# with trajectory_index.py to keep them. With a telemetry arena (several workers) the index is left as loaded.
+trajectory_index = TrajectoryIndex.load(TRAJECTORY_INDEX_PATH) if os.path.exists(TRAJECTORY_INDEX_PATH) else None
+trajectory_index_lock = threading.Lock()
+
+# Daily log file of every tractor in DAILY_TELEMETRY_DIR, by tractor_id
+daily_logs = daily_log_paths(DAILY_TELEMETRY_DIR)
+
+# First tier of cascade scoring (see cascade_scorer.py); None scores every tractor with the model
+cascade_config = load_cascade_config(CASCADE_CONFIG_PATH) if CASCADE_CONFIG_PATH else None
+
+
+def requested_routes(payload):
+    """Routes a request asks for: its 'segment', then its 'product_line'."""
+    return [route_name(payload[key]) for key in ('segment', 'product_line') if payload.get(key)]
+
+
+def serving_for(payload):
+    """Serving bundle of a request: the model of its 'segment' or else 'product_line' in RUL_MODEL_DIR, or the fleet's."""
+    for route in requested_routes(payload):
+        if route in model_registry:
+            return model_registry.get(route)
+    return fleet_serving
+
+
+def unknown_routes(payload, serving):
+    """The routes a request asked for when none of them has a model and `serving` fell back to the fleet model."""
+    return requested_routes(payload) if serving is fleet_serving else []
+
+
+def align_to_model(X, serving=fleet_serving):
+    """Reorders X to the model's feature columns (missing ones filled with 0), keeping float32 in compact mode."""
+    X = X.reindex(columns=serving['model'].get_booster().feature_names, fill_value=0)
+    return X.astype(COMPACT_FLOAT_DTYPE, copy=False) if COMPACT_MODE else X
+
+
+def predict_rul(X, serving=fleet_serving):
+    """RUL predictions of the served model for the aligned rows of X."""
+    if serving['compiled'] is not None:
+        return serving['compiled'].predict(X)
+    if PREDICTOR == 'inplace':
+        return serving['model'].get_booster().inplace_predict(np.ascontiguousarray(X.to_numpy(dtype=np.float32)))
+    return serving['model'].predict(X)
+
+
+def component_rankings(X, serving=fleet_serving):
+    """Per row of X: the components ranked by predicted RUL (most urgent first), or None without component models."""
+    if serving['component_models'] is None:
+        return [None] * len(X)
+    return [rank_components(serving['component_models'], hours)
+            for hours in predict_components(serving['component_models'], X)]
+
+
+def priority_band(hours):
+    for name, upper_edge in PRIORITY_BANDS:
+        if hours < upper_edge:
+            return name
+    return PRIORITY_BANDS[-1][0]
+
+
+def uncertainty_fields(X, predictions, serving=fleet_serving):
+    """
+    Per row of X: the calibrated prediction interval, the probability of every priority band and, as 'priority',
+    the band of the point prediction with its probability as 'confidence'. The band probabilities interpolate the
+    RUL distribution between the predicted quantiles. Without a quantile model (or rows) confidence is None.
+    """
+    quantile_model = serving['quantile_model']
+    if quantile_model is None or not len(X):
+        return [{'priority': priority_band(prediction), 'confidence': None, 'interval': None} for prediction in predictions]
+
+    alphas = np.asarray(quantile_model['quantiles'])
+    edges = np.array([upper_edge for _, upper_edge in PRIORITY_BANDS[:-1]])
+    fields = []
+    # All quantiles come from a single predict call on the rows the fleet model scored
+    for values, prediction in zip(predict_quantiles(quantile_model, X), predictions):
+        below_edges = np.interp(edges, values, alphas, left=0.0, right=1.0)
+        probabilities = np.diff(np.concatenate([[0.0], below_edges, [1.0]]))
+        # The priority always agrees with the hours reported next to it
+        band = [name for name, _ in PRIORITY_BANDS].index(priority_band(prediction))
+        fields.append({
+            'priority': PRIORITY_BANDS[band][0],
+            'confidence': float(probabilities[band]),
+            'priority_probabilities': {name: float(p) for (name, _), p in zip(PRIORITY_BANDS, probabilities)},
+            'interval': {'lower': float(values[0]), 'upper': float(values[-1]), 'level': quantile_model['level']}
+        })
+    return fields
+
+
+def sensor_contributions(X, serving=fleet_serving):
+    """
+    Per row of X: the bias of the serving bundle's model and every sensor's contribution in hours (the SHAP values
+    of its engineered features summed; non-sensor features as OPERATING_GROUP), largest magnitude first. Bias plus
+    contributions add up to the prediction. All rows are explained by one pred_contribs call.
+    """
+    explained_sensors, sensor_group_matrix = serving['sensor_groups']
+    contributions = serving['model'].get_booster().predict(xgboost.DMatrix(X), pred_contribs=True)
+    by_sensor = contributions[:, :-1] @ sensor_group_matrix
+    explanations = []
+    for bias, row in zip(contributions[:, -1], by_sensor):
+        order = np.argsort(-np.abs(row))
+        explanations.append({
+            'base_value': float(bias),
+            'sensors': [{'sensor': explained_sensors[i], 'contribution_hours': float(row[i])} for i in order]
+        })
+    return explanations
+
+
+def get_history(sample_id):
+    """Latest HISTORY_WINDOW_MONTHS of appended telemetry for `sample_id`, or None if nothing was appended."""
+    return get_versioned_history(sample_id)[0]
+
+
+def get_versioned_history(sample_id):
+    """(latest HISTORY_WINDOW_MONTHS of telemetry as a DataFrame, records appended so far), or (None, 0)."""
+    if telemetry_arena is not None:
+        return telemetry_arena.history_frame(sample_id, HISTORY_WINDOW_MONTHS)
+    with telemetry_store_lock:
+        records = telemetry_store.get(sample_id)
+        if not records:
+            return None, 0
+        version = len(records)
+        records = list(records[-HISTORY_WINDOW_MONTHS:])
+    return pd.DataFrame.from_records(records), version
+
+
+WORKER_SKETCH_PATTERN = re.compile(r'^worker-(\d+)\.drift\.json$')
+
+
+def worker_sketch_path(pid=None):
+    return os.path.join(DRIFT_DIR, f'worker-{pid or os.getpid()}.drift.json')
+
+
+def process_alive(pid):
+    """Whether a process with this pid runs on this host (workers sharing DRIFT_DIR run on the same node)."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def remove_own_sketches():
+    """Deletes this process's published sketches at exit, so the other workers stop merging them."""
+    if DRIFT_DIR is not None:
+        try:
+            os.remove(worker_sketch_path())
+        except FileNotFoundError:
+            pass
+
+
+atexit.register(remove_own_sketches)
+
+
+def publish_live_sketches():
+    """Writes this process's live sketches to DRIFT_DIR, where the other workers merge them into their /drift."""
+    if DRIFT_DIR is None:
+        return
+    os.makedirs(DRIFT_DIR, exist_ok=True)
+    with live_sketches_lock:
+        snapshot = SensorSketches.from_dict(live_sketches.to_dict())
+    snapshot.save(worker_sketch_path())
+
+
+def observe_scored_rows(sample_id, history, version):
+    """Adds the rows of `history` (a tractor's latest records, `version` in total) not yet in the live sketches."""
+    with live_sketches_lock:
+        new_rows = min(version - sketched_versions.get(sample_id, 0), len(history))
+        if new_rows <= 0:
+            return
+        sketched_versions[sample_id] = version
+        rows_before = live_sketches.rows()
+        live_sketches.update(history.tail(new_rows))
+        publish = rows_before // DRIFT_PUBLISH_ROWS != live_sketches.rows() // DRIFT_PUBLISH_ROWS
+    if publish:
+        publish_live_sketches()
+
+
+def fleet_live_sketches():
+    """
+    This process's live sketches merged with those the other workers published to DRIFT_DIR. Files of workers that
+    are no longer running (exited without cleaning up, or killed) are deleted instead of merged.
+    """
+    with live_sketches_lock:
+        merged = SensorSketches.from_dict(live_sketches.to_dict())
+    workers = 1
+    if DRIFT_DIR is not None and os.path.isdir(DRIFT_DIR):
+        own_pid = os.getpid()
+        for filename in sorted(os.listdir(DRIFT_DIR)):
+            match = WORKER_SKETCH_PATTERN.match(filename)
+            if match is None or int(match.group(1)) == own_pid:
+                continue
+            path = os.path.join(DRIFT_DIR, filename)
+            try:
+                if not process_alive(int(match.group(1))):
+                    os.remove(path)
+                    continue
+                merged.merge(SensorSketches.load(path))
+            except FileNotFoundError:
+                # Removed by its worker at exit or by another worker pruning it
+                continue
+            workers += 1
+    return merged, workers
+
+
+def score_tractors(sample_ids, full_model=False, serving=fleet_serving):
+    """
+    Latest-month scoring of `sample_ids` through prediction_cache. Tractors whose telemetry changed since they were
+    last scored share one feature pass and one model call. Returns (cache entries by sample_id, missing ids);
+    an entry's 'result' is None when its history is too short to engineer features.
+    With a cascade config, tractors passing its first tier get their RUL lower bound instead of a model call
+    ('tier': 'healthy'), unless `full_model` asks for model scores (and features) for every tractor.
+    `serving` is the routed model (see serving_for); entries scored by another model are rescored.
+    """
+    entries, stale, missing = {}, [], []
+    for sample_id in dict.fromkeys(sample_ids):
+        history, version = get_versioned_history(sample_id)
+        if history is None:
+            missing.append(sample_id)
+            continue
+        with prediction_cache_lock:
+            entry = prediction_cache.get(sample_id)
+        if (entry is not None and entry['version'] == version and entry['route'] == serving['route']
+                and not (full_model and entry['tier'] == 'healthy')):
+            entries[sample_id] = entry
+        else:
+            stale.append((sample_id, version, history))
+            observe_scored_rows(sample_id, history, version)
+    if not stale:
+        return entries, missing
+
+    # Positional group ids keep the concatenated frame sorted, so the per-sample sort inside
+    # preprocess_and_engineer_features leaves every history in time order
+    combined_df = pd.concat([history.assign(sample_id=group_id) for group_id, (_, _, history) in enumerate(stale)],
+                            ignore_index=True)
+    scored = {}
+    if cascade_config is not None and not full_model:
+        checks = tier_one(combined_df, cascade_config)
+        for group_id, bound in checks.loc[checks['healthy'], 'rul_lower_bound'].items():
+            scored[group_id] = {'tier': 'healthy', 'result': {
+                'hours_until_failure': int(bound),
+                'component': DEFAULT_COMPONENT,
+                'components': None,
+                'priority': priority_band(bound),
+                'confidence': None,
+                'interval': None,
+                'tier': 'healthy',
+                'model': serving['route'] or 'fleet'
+            }}
+        combined_df = combined_df[~combined_df['sample_id'].isin(scored)].reset_index(drop=True)
+
+    if len(combined_df):
+        X_processed, _ = preprocess_and_engineer_features(combined_df, COLUMNS_TO_DROP, **serving['feature_params'],
+                                                          compact=COMPACT_MODE)
+        group_ids = combined_df.loc[X_processed.index, 'sample_id']
+        latest_index = group_ids.index.to_series().groupby(group_ids.values).max()
+
+        X_latest = align_to_model(X_processed.loc[latest_index.values], serving)
+        predictions = predict_rul(X_latest, serving) if len(X_latest) else []
+        rankings = component_rankings(X_latest, serving)
+        uncertainties = uncertainty_fields(X_latest, predictions, serving)
+
+        for position, (group_id, prediction, ranking, uncertainty) in enumerate(
+                zip(latest_index.index, predictions, rankings, uncertainties)):
+            scored[group_id] = {
+                'features': X_latest.iloc[[position]],
+                'result': {
+                    'hours_until_failure': int(prediction),
+                    'component': ranking[0]['component'] if ranking else DEFAULT_COMPONENT,
+                    'components': ranking,
+                    **uncertainty,
+                    'tier': 'model',
+                    'model': serving['route'] or 'fleet'
+                }
+            }
+    for group_id, (sample_id, version, _) in enumerate(stale):
+        entry = {'version': version, 'route': serving['route'], 'tier': 'model', 'features': None, 'result': None,
+                 'explanation': None, **scored.get(group_id, {})}
+        entries[sample_id] = entry
+        with prediction_cache_lock:
+            prediction_cache[sample_id] = entry
+    return entries, missing
+
+
+def series_source(sample_id):
+    """
+    (version, loader) of the history charted for `sample_id`: appended telemetry, else its daily log, else (without
+    a sample_id) the sample CSV. The loader returns the raw records; the version changes whenever they do.
+    Returns (None, None) for an unknown tractor.
+    """
+    if sample_id is None:
+        return ('sample', os.path.getmtime(HISTORY_CSV_PATH)), lambda: pd.read_csv(HISTORY_CSV_PATH)
+    if telemetry_arena is not None:
+        version = telemetry_arena.version(sample_id)
+        if version:
+            return ('telemetry', version), lambda: telemetry_arena.history_frame(sample_id)[0]
+    candidates = [sample_id] + ([int(sample_id)] if sample_id.lstrip('-').isdigit() else [])
+    with telemetry_store_lock:
+        for key in candidates:
+            records = telemetry_store.get(key)
+            if records:
+                version = len(records)
+                return ('telemetry', version), lambda: pd.DataFrame.from_records(records[:version])
+    path = daily_logs.get(sample_id)
+    if path is not None:
+        return ('daily', os.path.getmtime(path)), lambda: pd.read_csv(path)
+    return None, None
+
+
+def cached_lookup(cache, key):
+    with series_cache_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+    return value
+
+
+def cache_store(cache, key, value, max_entries):
+    with series_cache_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > max_entries:
+            cache.popitem(last=False)
+
+
+@app.route('/series', methods=['GET'])
+def series():
+    """
+    Sensor series of one tractor, downsampled server-side for the charts:
+    /series?sample_id=7&sensors=oil_pressure_psi,engine_temp_c&start=2021-01-01&end=2023-12-31&points=500&algorithm=lttb
+    Every series has at most `points` samples (timestamps in epoch milliseconds) whatever the history length.
+    Without a sample_id the sample CSV is charted.
+    """
+    try:
+        sample_id = request.args.get('sample_id')
+        sensors = [sensor for sensor in request.args.get('sensors', '').split(',') if sensor]
+        start, end = request.args.get('start'), request.args.get('end')
+        points = min(int(request.args.get('points', DEFAULT_SERIES_POINTS)), MAX_SERIES_POINTS)
+        algorithm = request.args.get('algorithm', 'lttb')
+        if algorithm not in DOWNSAMPLING_ALGORITHMS:
+            return jsonify({'error': f"Unknown algorithm {algorithm!r}", 'algorithms': list(DOWNSAMPLING_ALGORITHMS)}), 400
+
+        version, load = series_source(sample_id)
+        if version is None:
+            return jsonify({'error': f"No telemetry found for sample_id {sample_id}"}), 404
+
+        results, uncached = {}, []
+        for sensor in dict.fromkeys(sensors):
+            result = cached_lookup(series_cache, (sample_id, sensor, start, end, points, algorithm, version))
+            if result is None:
+                uncached.append(sensor)
             else:
-                processed_df[f'{col}_ewma_{span}'] = processed_df[col].ewm(span=span, adjust=False).mean()
-    if 'remaining_useful_life_hours' in processed_df.columns:
-        y = processed_df['remaining_useful_life_hours']
-    else:
-        y = None
-    existing_columns_to_drop = [col for col in columns_to_drop if col in processed_df.columns]
-    X = processed_df.drop(columns=existing_columns_to_drop, axis=1)
-    for col in X.columns:
-        if X[col].dtype == 'object':
-            X = X.drop(columns=[col])
-    initial_rows = X.shape[0]
-    if y is not None:
-        X_aligned, y_aligned = X.align(y, join='inner', axis=0)
-        combined_for_dropna = pd.concat([X_aligned, y_aligned], axis=1)
-        combined_for_dropna.dropna(inplace=True)
-        X = combined_for_dropna.drop(columns=['remaining_useful_life_hours'])
-        y = combined_for_dropna['remaining_useful_life_hours']
+                results[sensor] = result
+
+        if uncached or not sensors:
+            frame = cached_lookup(series_frames, (sample_id, version))
+            if frame is None:
+                frame = series_frame(load())
+                cache_store(series_frames, (sample_id, version), frame, SERIES_FRAME_CACHE_ENTRIES)
+            unknown = [sensor for sensor in uncached if sensor not in frame.columns]
+            if unknown or not sensors:
+                return jsonify({'error': f"Unknown sensors: {unknown}" if unknown else "Expected 'sensors'",
+                                'sensors': list(frame.columns)}), 400
+            for sensor in uncached:
+                results[sensor] = sensor_series(frame, sensor, start, end, points, algorithm)
+                cache_store(series_cache, (sample_id, sensor, start, end, points, algorithm, version), results[sensor],
+                            SERIES_CACHE_ENTRIES)
+
+        return jsonify({'sample_id': sample_id, 'start': start, 'end': end, 'points': points, 'algorithm': algorithm,
+                        'series': {sensor: results[sensor] for sensor in dict.fromkeys(sensors)}})
+
+    except Exception as e:
+        print(f"Error in series: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/telemetry', methods=['POST'])
+def append_telemetry():
+    """Appends monthly records: {"sample_id": ..., "records": [{...}, ...]}."""
+    payload = request.get_json(silent=True) or {}
+    sample_id = payload.get('sample_id')
+    records = payload.get('records')
+    if sample_id is None or not isinstance(records, list):
+        return jsonify({'error': "Expected 'sample_id' and a list of 'records'"}), 400
+
+    # The new months with the months their trajectory features look back on
+    window_months = len(records) + TRAJECTORY_MONTHS - 1
+    if arena_writer is not None:
+        try:
+            with arena_writer_lock, arena_writer:
+                total = arena_writer.append(sample_id, records)
+        except ValueError as e:
+            # e.g. a sample_id longer than the arena's keys
+            print(f"Error appending telemetry of {sample_id}: {str(e)}")
+            return jsonify({'error': str(e)}), 400
     else:
-        X.dropna(inplace=True)
-    return X, y
+        with telemetry_store_lock:
+            history = telemetry_store.setdefault(sample_id, [])
+            history.extend(dict(record, sample_id=sample_id) for record in records)
+            total = len(history)
+            window = list(history[-window_months:])
+
+    # Workers sharing an arena all serve the offline-built index unchanged, so their /similar answers agree
+    indexed = 0
+    if (trajectory_index is not None and arena_writer is None
+            and any(record.get('remaining_useful_life_hours') is not None for record in records)):
+        # The records are stored either way; a month that cannot be indexed only misses from /similar
+        try:
+            window_df = pd.DataFrame.from_records(window)
+            features = trajectory_features(window_df)
+            with trajectory_index_lock:
+                indexed_before = len(trajectory_index)
+                trajectory_index.add(window_df.tail(len(records)), features[-len(records):])
+                indexed = len(trajectory_index) - indexed_before
+        except Exception as e:
+            print(f"Error indexing telemetry of {sample_id}: {str(e)}")
+    return jsonify({'sample_id': sample_id, 'appended': len(records), 'total_records': total,
+                    'indexed_months': indexed})
+
+
+@app.route('/predict_batch', methods=['POST'])
+def predict_batch():
+    """
+    Scores the latest month of several tractors with one feature pass and one model call: {"sample_ids": [...]}.
+    An optional "product_line" or "segment" routes the batch to that model of RUL_MODEL_DIR.
+    """
+    try:
+        payload = request.get_json(silent=True) or {}
+        serving = serving_for(payload)
+        entries, missing = score_tractors(payload.get('sample_ids') or [], serving=serving)
+        if not entries:
+            return jsonify({'error': 'No telemetry found for the requested sample_ids', 'missing': missing}), 404
+
+        results = {str(sample_id): entry['result'] for sample_id, entry in entries.items() if entry['result'] is not None}
+        not_enough_history = [sample_id for sample_id, entry in entries.items() if entry['result'] is None]
+        return jsonify({'predictions': results, 'missing': missing, 'not_enough_history': not_enough_history,
+                        'unknown_routes': unknown_routes(payload, serving)})
+
+    except Exception as e:
+        print(f"Error in batch prediction: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/explain', methods=['POST'])
+def explain():
+    """
+    Top sensors behind the latest prediction of several tractors: {"sample_ids": [...], "top": 5}.
+    Scores come from prediction_cache like /predict_batch; explanations missing from the cache are computed for
+    all requested tractors in one batch and cached with their prediction.
+    """
+    try:
+        payload = request.get_json(silent=True) or {}
+        top = int(payload.get('top', DEFAULT_EXPLAIN_TOP))
+        # Explanations need the model's features, also for tractors the cascade passed as healthy
+        serving = serving_for(payload)
+        entries, missing = score_tractors(payload.get('sample_ids') or [], full_model=True, serving=serving)
+        if not entries:
+            return jsonify({'error': 'No telemetry found for the requested sample_ids', 'missing': missing}), 404
+
+        scored = {sample_id: entry for sample_id, entry in entries.items() if entry['result'] is not None}
+        unexplained = [entry for entry in scored.values() if entry['explanation'] is None]
+        if unexplained:
+            explanations = sensor_contributions(pd.concat([entry['features'] for entry in unexplained]), serving)
+            for entry, explanation in zip(unexplained, explanations):
+                entry['explanation'] = explanation
+
+        results = {
+            str(sample_id): {
+                'hours_until_failure': entry['result']['hours_until_failure'],
+                'base_value': entry['explanation']['base_value'],
+                'top_sensors': entry['explanation']['sensors'][:top]
+            }
+            for sample_id, entry in scored.items()
+        }
+        not_enough_history = [sample_id for sample_id, entry in entries.items() if entry['result'] is None]
+        return jsonify({'explanations': results, 'missing': missing, 'not_enough_history': not_enough_history,
+                        'explained_now': len(unexplained), 'unknown_routes': unknown_routes(payload, serving)})
+
+    except Exception as e:
+        print(f"Error in explanation: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/similar', methods=['POST'])
+def similar():
+    """
+    Historical tractors whose sensor trajectories were closest to this tractor's latest months, with how long they
+    had left: {"sample_id": ..., "k": 5}. Without a sample_id the sample CSV is matched.
+    """
+    try:
+        if trajectory_index is None:
+            return jsonify({'error': f"No trajectory index found at {TRAJECTORY_INDEX_PATH}; "
+                                     "build one with trajectory_index.py"}), 404
+        payload = request.get_json(silent=True) or {}
+        sample_id = payload.get('sample_id')
+        k = int(payload.get('k', DEFAULT_NEIGHBORS))
+        if sample_id is not None:
+            history = get_history(sample_id)
+            if history is None:
+                return jsonify({'error': f"No telemetry found for sample_id {sample_id}"}), 404
+        else:
+            history = pd.read_csv(HISTORY_CSV_PATH).head(HISTORY_WINDOW_MONTHS)
+
+        with trajectory_index_lock:
+            neighbors = trajectory_index.query(history, k=k, exclude_sample_id=sample_id)
+        outcomes = [neighbor['remaining_useful_life_hours'] for neighbor in neighbors]
+        return jsonify({
+            'sample_id': sample_id,
+            'neighbors': neighbors,
+            'neighbor_rul_hours': {
+                'median': float(np.median(outcomes)), 'min': min(outcomes), 'max': max(outcomes)
+            } if outcomes else None,
+            'indexed_months': len(trajectory_index)
+        })
+
+    except Exception as e:
+        print(f"Error in similar trajectories: {str(e)}")
+        return jsonify({'error': str(e)}), 400
+
+
+@app.route('/drift', methods=['GET'])
+def drift():
+    """
+    Drift of the scored telemetry from the training data, per sensor and per age cohort ('fleet' = all rows):
+    population stability index over the baseline-range histogram, median shift and out-of-range share.
+    Live sketches of every worker process publishing to RUL_DRIFT_DIR are merged in.
+    """
+    if drift_reference is None:
+        return jsonify({'error': f"No drift reference found next to {MODEL_PATH}; retrain to export one"}), 404
+    publish_live_sketches()
+    live, workers = fleet_live_sketches()
+    scores = drift_scores(drift_reference, live)
+    return jsonify({
+        'live_rows': live.rows(),
+        'workers': workers,
+        'most_drifted': [{'cohort': cohort, 'sensor': sensor, 'psi': psi} for cohort, sensor, psi in most_drifted(scores)],
+        'cohorts': scores
+    })
+
+
+@app.route('/models', methods=['GET'])
+def models():
+    """Routes of RUL_MODEL_DIR and the model cache: what is loaded, its memory and per-route hits and load times."""
+    return jsonify({'fleet_model': MODEL_PATH, 'routes': model_registry.routes(), **model_registry.stats()})
 
-model = joblib.load('/Users/R3WFWYW/predictive_maintenance_uirp_hackathon/mae_403.joblib')
 
 @app.route('/predict', methods=['POST'])
 def predict():
     try:
-        # --- 1. Load Model and the FULL Historical Data for the sample ---
-        full_history_df = pd.read_csv('/Users/R3WFWYW/predictive_maintenance_uirp_hackathon/frontend/public/sample_0_data.csv')
-        full_history_df = full_history_df.head(30)
+        # --- 1. Load the Historical Data for the sample ---
+        # Telemetry appended for the requested sample_id takes precedence over the sample CSV
+        payload = request.get_json(silent=True) or {}
+        serving = serving_for(payload)
+        full_history_df = None
+        if 'sample_id' in payload:
+            full_history_df, version = get_versioned_history(payload['sample_id'])
+            if full_history_df is not None:
+                observe_scored_rows(payload['sample_id'], full_history_df, version)
+                # Same positional id as score_tractors, so /predict and /predict_batch engineer identical groups
+                full_history_df = full_history_df.assign(sample_id=0)
+        if full_history_df is None:
+            full_history_df = pd.read_csv(HISTORY_CSV_PATH)
+            full_history_df = full_history_df.head(HISTORY_WINDOW_MONTHS)
 
         # --- 2. Process the ENTIRE History to Generate Features Correctly ---
-        columns_to_drop = [
-            'sample_id', 'date', 'type_of_failure', 'failure_imminent',
-            'failure_occurred', 'remaining_useful_life_hours'
-        ]
-
         print("Processing full history to engineer features for prediction...")
-        X_processed, y_processed = preprocess_and_engineer_features(full_history_df, columns_to_drop)
+        X_processed, y_processed = preprocess_and_engineer_features(full_history_df, COLUMNS_TO_DROP,
+                                                                    **serving['feature_params'], compact=COMPACT_MODE)
 
         # --- 3. Select the Final Rows for Prediction ---
         X_to_predict = X_processed.tail(5)
         y_actual = y_processed.tail(5) if y_processed is not None else None
 
         # --- 4. Align Columns and Predict ---
-        model_features = model.get_booster().feature_names
-        X_to_predict_aligned = X_to_predict.reindex(columns=model_features, fill_value=0)
+        X_to_predict_aligned = align_to_model(X_to_predict, serving)
 
-        print("\nMaking predictions on the last 5 time steps...")
-        predictions = model.predict(X_to_predict_aligned)
+        print(f"\nMaking predictions on the last 5 time steps with the {serving['route'] or 'fleet'} model...")
+        predictions = predict_rul(X_to_predict_aligned, serving)
 
         # --- 5. Return JSON Response ---
         # Convert numpy array to Python types and return proper JSON
         current_prediction = float(predictions[-1]) if len(predictions) > 0 else 50.0
+        ranking = component_rankings(X_to_predict_aligned.tail(1), serving)[0] if len(X_to_predict_aligned) else None
+        uncertainty = uncertainty_fields(X_to_predict_aligned.tail(1), [current_prediction], serving)[0]
 
         return jsonify({
             'hours_until_failure': int(current_prediction),
-            'component': 'Engine',
-            'confidence': 0.85,
+            'component': ranking[0]['component'] if ranking else DEFAULT_COMPONENT,
+            'components': ranking,
+            **uncertainty,
+            'model': serving['route'] or 'fleet',
+            'unknown_routes': unknown_routes(payload, serving),
             'all_predictions': [float(p) for p in predictions],  # Optional: include all predictions
             'actual_values': [float(a) for a in y_actual.values] if y_actual is not None else None
         })
@@ -116,4 +813,8 @@ def predict():
         return jsonify({'error': str(e)}), 400
 
 if __name__ == '__main__':
-    app.run(debug=True, port=5000)
\ No newline at end of file
+    app.run(
+        debug=os.environ.get('RUL_DEBUG', '1') == '1',
+        port=int(os.environ.get('PORT', 5000)),
+        threaded=True
+    )
\ No newline at end of file
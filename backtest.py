@@ -0,0 +1,215 @@
+import os
+import io
+import json
+import time
+import argparse
+import warnings
+import contextlib
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from mae_403 import (
+    preprocess_and_engineer_features, load_feature_params, COLUMNS_TO_DROP, FEATURE_PARAMS, MODEL_FILENAME
+)
+from evaluate_fleet import (
+    DEFAULT_FILES_PER_TASK, DEFAULT_RUL_BUCKETS, engineer_fleet, list_history_files,
+    read_history_file, rul_bucket_labels
+)
+
+# Walk-forward backtest: what would the model have predicted at the end of every month of a tractor's life?
+# Every engineered feature (lags, rolling windows, diffs, EWMA with adjust=False) only looks backwards,
+# so the feature row for month k computed from the full history equals the one computed from the first k
+# months. Features are therefore built once per tractor and every cutoff month is scored in one batch,
+# instead of re-running feature engineering on each growing prefix (O(n^2) per tractor).
+
+BACKTEST_METADATA_COLUMNS = ['sample_id', 'date', 'type_of_failure', 'failure_occurred']
+
+# A tractor is "alerted" the first month its predicted RUL drops below this many hours
+DEFAULT_ALERT_THRESHOLD_HOURS = 500
+
+# Lead-time curve is reported for this many months before failure
+DEFAULT_MAX_LEAD_MONTHS = 24
+
+
+def verify_causality(df, cutoffs, atol=1e-6, feature_params=FEATURE_PARAMS):
+    """
+    Spot-checks the walk-forward shortcut on one tractor: for each cutoff k, features computed (with
+    `feature_params`) from the first k rows must match row k of the features computed from the full history.
+    Returns the cutoffs that differ.
+    """
+    with warnings.catch_warnings(), contextlib.redirect_stdout(io.StringIO()):
+        warnings.simplefilter('ignore', pd.errors.PerformanceWarning)
+        X_full, _ = preprocess_and_engineer_features(df, COLUMNS_TO_DROP, **feature_params)
+        mismatches = []
+        for cutoff in cutoffs:
+            X_prefix, _ = preprocess_and_engineer_features(df.head(cutoff), COLUMNS_TO_DROP, **feature_params)
+            last_index = cutoff - 1
+            if last_index not in X_prefix.index:
+                # Not enough history yet for every rolling window; the full run drops this row too
+                if last_index in X_full.index:
+                    mismatches.append(cutoff)
+                continue
+            full_row = X_full.loc[last_index, X_prefix.columns].to_numpy(dtype=float)
+            prefix_row = X_prefix.loc[last_index].to_numpy(dtype=float)
+            if not np.allclose(full_row, prefix_row, atol=atol, equal_nan=True):
+                mismatches.append(cutoff)
+    return mismatches
+
+
+def _curve(frame, key):
+    """MAE, RMSE and bias (mean of predicted - actual) for each value of `key`."""
+    errors = frame['predicted'] - frame['actual']
+    grouped = errors.groupby(frame[key], observed=True, sort=True)
+    curve = pd.DataFrame({
+        'rows': grouped.size(),
+        'mae': grouped.apply(lambda e: float(np.abs(e).mean())),
+        'rmse': grouped.apply(lambda e: float(np.sqrt((e ** 2).mean()))),
+        'bias': grouped.mean()
+    })
+    return {str(k): {col: (int(v) if col == 'rows' else float(v)) for col, v in row.items()}
+            for k, row in curve.iterrows()}
+
+
+def summarize_backtest(results, alert_threshold=DEFAULT_ALERT_THRESHOLD_HOURS,
+                       max_lead_months=DEFAULT_MAX_LEAD_MONTHS, rul_buckets=DEFAULT_RUL_BUCKETS):
+    """Builds the lead-time curves and alert statistics from per-cutoff backtest predictions."""
+    results = results.copy()
+    tractor_keys = ['source_file', 'sample_id']
+
+    # Months before failure only make sense for tractors whose history ends in a failure
+    results['months_before_end'] = results.groupby(tractor_keys, sort=False).cumcount(ascending=False)
+    failed = results.groupby(tractor_keys, sort=False)['failure_occurred'].transform('max') == 1
+    failed_results = results[failed & (results['months_before_end'] <= max_lead_months)]
+
+    results['rul_bucket'] = rul_bucket_labels(results['actual'], rul_buckets)
+
+    # First cutoff where the model would have raised an alert, and how many hours were actually left then
+    alerts = results[failed & (results['predicted'] < alert_threshold)]
+    first_alerts = alerts.groupby(tractor_keys, sort=False).head(1)
+    failed_tractors = results[failed].groupby(tractor_keys, sort=False).ngroups
+    alert_lead_hours = first_alerts['actual'].to_numpy(dtype=float)
+
+    return {
+        'lead_time_curve_months': _curve(failed_results, 'months_before_end'),
+        'rul_bucket_curve': _curve(results, 'rul_bucket'),
+        'alerts': {
+            'threshold_hours': alert_threshold,
+            'failed_tractors': int(failed_tractors),
+            'alerted_tractors': int(len(first_alerts)),
+            'missed_tractors': int(failed_tractors - len(first_alerts)),
+            'median_lead_hours': float(np.median(alert_lead_hours)) if len(alert_lead_hours) else None,
+            'min_lead_hours': float(alert_lead_hours.min()) if len(alert_lead_hours) else None
+        }
+    }
+
+
+def run_backtest(model, paths, workers=None, files_per_task=DEFAULT_FILES_PER_TASK,
+                 alert_threshold=DEFAULT_ALERT_THRESHOLD_HOURS, max_lead_months=DEFAULT_MAX_LEAD_MONTHS,
+                 feature_params=FEATURE_PARAMS):
+    """
+    Scores every cutoff month of every tractor under `paths` and returns (per-cutoff results DataFrame, report).
+    Feature engineering (with the model's `feature_params`, see mae_403.load_feature_params) runs once per batch
+    of files in parallel worker processes; prediction is one batch.
+    """
+    files = list_history_files(paths)
+    if not files:
+        raise ValueError(f"No .csv or .parquet files found in {paths}")
+
+    start_time = time.perf_counter()
+    X_all, y_all, results, _, errors = engineer_fleet(
+        files, BACKTEST_METADATA_COLUMNS, feature_params, workers=workers, files_per_task=files_per_task
+    )
+    feature_seconds = time.perf_counter() - start_time
+
+    model_features = model.get_booster().feature_names
+    X_all = X_all.reindex(columns=model_features, fill_value=0)
+    predict_start = time.perf_counter()
+    predictions = model.predict(X_all)
+    predict_seconds = time.perf_counter() - predict_start
+
+    results['actual'] = y_all.to_numpy(dtype=float)
+    results['predicted'] = predictions
+
+    report = summarize_backtest(results, alert_threshold, max_lead_months)
+    report.update({
+        'files': len(files),
+        'tractors': int(results.groupby(['source_file', 'sample_id']).ngroups),
+        'cutoffs_scored': int(len(results)),
+        'timing': {
+            'feature_seconds': feature_seconds,
+            'predict_seconds': predict_seconds,
+            'cutoffs_per_second': len(results) / (time.perf_counter() - start_time)
+        },
+        'errors': errors
+    })
+    return results, report
+
+
+def print_backtest_report(report):
+    print(f"Scored {report['cutoffs_scored']} cutoff months for {report['tractors']} tractors "
+          f"in {report['timing']['feature_seconds'] + report['timing']['predict_seconds']:.2f} s.")
+
+    print("\n--- Error vs. months before failure (failed tractors) ---")
+    print(f"{'months':>6} {'rows':>6} {'MAE':>10} {'bias':>10}")
+    for months, row in sorted(report['lead_time_curve_months'].items(), key=lambda item: int(item[0])):
+        print(f"{months:>6} {row['rows']:>6} {row['mae']:>10.1f} {row['bias']:>10.1f}")
+
+    print("\n--- Error by actual RUL bucket (hours) ---")
+    for bucket, row in report['rul_bucket_curve'].items():
+        print(f"{bucket}: MAE {row['mae']:.1f}, bias {row['bias']:.1f} over {row['rows']} rows")
+
+    alerts = report['alerts']
+    print(f"\n--- Alerts (predicted RUL < {alerts['threshold_hours']} hours) ---")
+    print(f"Alerted {alerts['alerted_tractors']} of {alerts['failed_tractors']} failed tractors "
+          f"({alerts['missed_tractors']} missed).")
+    if alerts['median_lead_hours'] is not None:
+        print(f"Median actual RUL at first alert: {alerts['median_lead_hours']:.1f} hours "
+              f"(minimum {alerts['min_lead_hours']:.1f}).")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Walk-forward backtest of RUL predictions across a fleet.")
+    parser.add_argument('paths', nargs='+', help="Folders of per-tractor .csv/.parquet files, or individual files.")
+    parser.add_argument('--model', default=MODEL_FILENAME, help="Path of the joblib model to backtest.")
+    parser.add_argument('--workers', type=int, default=None, help="Feature engineering processes (default: all cores).")
+    parser.add_argument('--files-per-task', type=int, default=DEFAULT_FILES_PER_TASK,
+                        help="History files feature-engineered together by one worker task.")
+    parser.add_argument('--alert-threshold', type=float, default=DEFAULT_ALERT_THRESHOLD_HOURS,
+                        help="Predicted RUL (hours) below which a tractor counts as alerted.")
+    parser.add_argument('--max-lead-months', type=int, default=DEFAULT_MAX_LEAD_MONTHS,
+                        help="Months before failure covered by the lead-time curve.")
+    parser.add_argument('--verify', type=int, default=0,
+                        help="Re-check the walk-forward shortcut against prefix recomputation on this many files.")
+    parser.add_argument('--report', default='backtest_report.json', help="Where to write the JSON report.")
+    parser.add_argument('--predictions', default=None, help="Optional CSV with every per-cutoff prediction.")
+    args = parser.parse_args(argv)
+
+    feature_params = load_feature_params(args.model)
+    if args.verify:
+        for file_path in list_history_files(args.paths)[:args.verify]:
+            df = read_history_file(file_path)
+            mismatches = verify_causality(df, range(1, len(df) + 1), feature_params=feature_params)
+            status = 'OK' if not mismatches else f'MISMATCH at cutoffs {mismatches}'
+            print(f"Causality check {os.path.basename(file_path)}: {status}")
+
+    model = joblib.load(args.model)
+    results, report = run_backtest(
+        model, args.paths, workers=args.workers, files_per_task=args.files_per_task,
+        alert_threshold=args.alert_threshold, max_lead_months=args.max_lead_months, feature_params=feature_params
+    )
+    report['model'] = args.model
+    print_backtest_report(report)
+
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.report}")
+
+    if args.predictions:
+        results.to_csv(args.predictions, index=False)
+        print(f"Per-cutoff predictions written to {args.predictions}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,448 @@
+import os
+import io
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import warnings
+import subprocess
+import contextlib
+import importlib.util
+
+import numpy as np
+import pandas as pd
+import joblib
+import sklearn
+import xgboost
+from xgboost import XGBRegressor
+
+from generate_synthetic_data import generate_fleet, write_fleet
+from mae_403 import (
+    preprocess_and_engineer_features, load_data_folder, COLUMNS_TO_DROP, FEATURE_PARAMS, evaluate_interval,
+    predict_quantiles, quantile_model_path, train_quantile_model
+)
+from stage_profiler import StageProfiler
+from evaluate_fleet import compute_metrics
+
+# Times the pipeline on deterministic synthetic fleets of several sizes and writes a JSON baseline:
+#   generate -> write CSV -> ingest (load_data_folder) -> features -> fit -> batch predict -> single /predict.
+# Run it on two commits and pass the older result to --compare to see regressions.
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+BACKEND_PATH = os.path.join(REPO_ROOT, 'backend', 'backend.py')
+
+DEFAULT_SIZES = [10, 100, 1000]
+DEFAULT_SEED = 42
+DEFAULT_PREDICT_REQUESTS = 50
+
+# Fixed hyperparameters so fit time only changes when the code (or data size) does
+BENCHMARK_MODEL_PARAMS = {
+    'n_estimators': 200,
+    'max_depth': 6,
+    'learning_rate': 0.1,
+    'subsample': 0.9,
+    'colsample_bytree': 0.9,
+    'random_state': 42,
+    'n_jobs': -1
+}
+
+# A stage counts as regressed when it is this many times slower than in the baseline
+DEFAULT_REGRESSION_TOLERANCE = 1.25
+
+
+def _quiet():
+    """Silences the pipeline's print output and pandas fragmentation warnings inside a timed stage."""
+    stack = contextlib.ExitStack()
+    stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+    stack.enter_context(warnings.catch_warnings())
+    warnings.simplefilter('ignore', pd.errors.PerformanceWarning)
+    return stack
+
+
+# Backend settings read at import that would otherwise come from the caller's environment or the repo: the
+# optional features stay off (None unsets the variable) and sidecar artifacts are looked up next to the benchmark's
+# model, where there are none, instead of the repo's component_models.joblib and trajectory_index.joblib
+UNSET_BACKEND_SETTINGS = [
+    'RUL_DRIFT_DIR', 'RUL_CASCADE_CONFIG', 'RUL_TELEMETRY_ARENA', 'RUL_DAILY_TELEMETRY_DIR', 'RUL_MODEL_DIR',
+    'RUL_MODEL_CACHE_MB', 'RUL_PREDICTOR', 'RUL_COMPACT'
+]
+BACKEND_SIDECAR_SETTINGS = {
+    'RUL_COMPONENT_MODELS_PATH': 'component_models.joblib',
+    'RUL_TRAJECTORY_INDEX_PATH': 'trajectory_index.joblib'
+}
+
+
+@contextlib.contextmanager
+def _environment(settings):
+    """Sets (or, for None, unsets) the environment variables of `settings` and restores the previous values."""
+    previous = {name: os.environ.get(name) for name in settings}
+    try:
+        for name, value in settings.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def load_backend(model_path, history_csv_path):
+    """
+    Imports backend/backend.py as a fresh module serving `model_path` and `history_csv_path` and nothing else
+    (see UNSET_BACKEND_SETTINGS); the caller's environment is left as it was.
+    """
+    model_dir = os.path.dirname(os.path.abspath(model_path))
+    settings = dict.fromkeys(UNSET_BACKEND_SETTINGS)
+    settings.update({name: os.path.join(model_dir, filename) for name, filename in BACKEND_SIDECAR_SETTINGS.items()})
+    settings.update({'RUL_MODEL_PATH': model_path, 'RUL_HISTORY_CSV': history_csv_path})
+    with _environment(settings):
+        spec = importlib.util.spec_from_file_location(f'rul_backend_{time.monotonic_ns()}', BACKEND_PATH)
+        backend = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(backend)
+    return backend
+
+
+def _latency_summary(latencies_seconds):
+    latencies_ms = np.asarray(latencies_seconds) * 1000
+    return {
+        'requests': int(len(latencies_ms)),
+        'mean_ms': float(latencies_ms.mean()),
+        'p50_ms': float(np.percentile(latencies_ms, 50)),
+        'p95_ms': float(np.percentile(latencies_ms, 95)),
+        'max_ms': float(latencies_ms.max())
+    }
+
+
+def benchmark_fleet_size(num_tractors, seed=DEFAULT_SEED, predict_requests=DEFAULT_PREDICT_REQUESTS,
+                         track_allocations=False, work_dir=None):
+    """Runs every benchmarked stage on one fleet size and returns the stage records."""
+    profiler = StageProfiler(track_allocations=track_allocations)
+    work_dir = tempfile.mkdtemp(prefix=f'rul_bench_{num_tractors}_', dir=work_dir)
+    try:
+        with profiler.stage('generate') as record:
+            fleet_df = next(generate_fleet(num_tractors, seed=seed, batch_size=num_tractors))
+            record['rows'] = len(fleet_df)
+
+        csv_dir = os.path.join(work_dir, 'fleet_csv')
+        with profiler.stage('write_csv') as record:
+            write_fleet([fleet_df], csv_dir, file_format='csv', verbose=False)
+            record['files'] = num_tractors
+
+        with profiler.stage('ingest') as record, _quiet():
+            ingested_df = load_data_folder(csv_dir, 'benchmark')
+            record['rows'] = len(ingested_df)
+        del ingested_df
+
+        with profiler.stage('features') as record, _quiet():
+            X, y = preprocess_and_engineer_features(fleet_df, COLUMNS_TO_DROP, **FEATURE_PARAMS)
+            record['rows'], record['features'] = X.shape
+
+        with profiler.stage('fit') as record:
+            model = XGBRegressor(**BENCHMARK_MODEL_PARAMS)
+            model.fit(X, y)
+            record['rows'] = len(X)
+
+        with profiler.stage('predict_batch') as record:
+            model.predict(X)
+            record['rows'] = len(X)
+        record['rows_per_second'] = len(X) / record['wall_seconds'] if record['wall_seconds'] > 0 else None
+
+        model_path = os.path.join(work_dir, 'model.joblib')
+        joblib.dump(model, model_path)
+        history_path = os.path.join(work_dir, 'history.csv')
+        fleet_df[fleet_df['sample_id'] == fleet_df['sample_id'].iloc[0]].to_csv(history_path, index=False)
+
+        backend = load_backend(model_path, history_path)
+        client = backend.app.test_client()
+        with _quiet():
+            client.post('/predict', json={})  # warm-up: first request pays Flask/XGBoost lazy initialisation
+        with profiler.stage('predict_request') as record, _quiet():
+            latencies = []
+            for _ in range(predict_requests):
+                request_start = time.perf_counter()
+                response = client.post('/predict', json={})
+                latencies.append(time.perf_counter() - request_start)
+                if response.status_code != 200:
+                    raise RuntimeError(f"/predict failed: {response.get_json()}")
+            record.update(_latency_summary(latencies))
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return profiler.stages
+
+
+def compare_compact_mode(num_tractors, seed=DEFAULT_SEED, test_fraction=0.2):
+    """
+    Trains BENCHMARK_MODEL_PARAMS models on default float64 and on compact float32 features of the same fleet,
+    scores held-out tractors with both and returns per-mode memory/time records plus the accuracy difference.
+    Python allocation peaks are tracked (numpy buffers included), since RSS never shrinks within one process.
+    """
+    fleet_df = next(generate_fleet(num_tractors, seed=seed, batch_size=num_tractors))
+    sample_ids = fleet_df['sample_id'].unique()
+    test_ids = sample_ids[len(sample_ids) - max(1, int(len(sample_ids) * test_fraction)):]
+    is_test = fleet_df['sample_id'].isin(test_ids)
+    train_df, test_df = fleet_df[~is_test], fleet_df[is_test]
+
+    modes = {}
+    predictions = {}
+    for mode, compact in (('float64', False), ('float32', True)):
+        profiler = StageProfiler(track_allocations=True)
+        with profiler.stage('features') as record, _quiet():
+            X_train, y_train = preprocess_and_engineer_features(train_df, COLUMNS_TO_DROP, **FEATURE_PARAMS, compact=compact)
+            record['matrix_bytes'] = int(X_train.memory_usage(index=False).sum())
+        with _quiet():
+            X_test, y_test = preprocess_and_engineer_features(test_df, COLUMNS_TO_DROP, **FEATURE_PARAMS, compact=compact)
+
+        with profiler.stage('fit') as record:
+            model = XGBRegressor(**BENCHMARK_MODEL_PARAMS)
+            model.fit(X_train, y_train)
+            record['rows'] = len(X_train)
+        with profiler.stage('predict') as record:
+            predictions[mode] = model.predict(X_test)
+            record['rows'] = len(X_test)
+
+        modes[mode] = {
+            'stages': {record['stage']: record for record in profiler.stages},
+            'test': compute_metrics(y_test, predictions[mode])
+        }
+
+    float64_features = modes['float64']['stages']['features']
+    float32_features = modes['float32']['stages']['features']
+    return {
+        'modes': modes,
+        'features_peak_ratio': float32_features['python_peak_bytes'] / float64_features['python_peak_bytes'],
+        'matrix_bytes_ratio': float32_features['matrix_bytes'] / float64_features['matrix_bytes'],
+        'test_mae_difference': modes['float32']['test']['mae'] - modes['float64']['test']['mae'],
+        'max_abs_prediction_difference': float(np.max(np.abs(predictions['float32'] - predictions['float64'])))
+    }
+
+
+def print_compact_parity(num_tractors, parity):
+    print(f"  compact parity ({num_tractors} tractors):")
+    for mode, result in parity['modes'].items():
+        stages = result['stages']
+        print(f"    {mode}: features {stages['features']['wall_seconds']:.2f} s, "
+              f"peak {stages['features']['python_peak_bytes'] / 1e6:.1f} MB, "
+              f"matrix {stages['features']['matrix_bytes'] / 1e6:.1f} MB, fit {stages['fit']['wall_seconds']:.2f} s, "
+              f"test MAE {result['test']['mae']:.2f} h")
+    print(f"    float32/float64 feature peak {parity['features_peak_ratio']:.2f}x, "
+          f"MAE difference {parity['test_mae_difference']:+.2f} h, "
+          f"max prediction difference {parity['max_abs_prediction_difference']:.2f} h")
+
+
+def _time_calls(function, repeats):
+    """Median seconds of `repeats` calls of function() after one warm-up call."""
+    function()
+    timings = []
+    for _ in range(repeats):
+        call_start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - call_start)
+    return float(np.median(timings))
+
+
+def _predict_latencies(backend, predict_requests):
+    client = backend.app.test_client()
+    latencies = []
+    with _quiet():
+        client.post('/predict', json={})  # warm-up
+        for _ in range(predict_requests):
+            request_start = time.perf_counter()
+            response = client.post('/predict', json={})
+            latencies.append(time.perf_counter() - request_start)
+            if response.status_code != 200:
+                raise RuntimeError(f"/predict failed: {response.get_json()}")
+    return _latency_summary(latencies)
+
+
+def measure_uncertainty_overhead(num_tractors, seed=DEFAULT_SEED, predict_requests=DEFAULT_PREDICT_REQUESTS,
+                                 work_dir=None):
+    """
+    Trains a BENCHMARK_MODEL_PARAMS model and its quantile model (calibrated on one held-out half of the test
+    tractors, scored on the other) and measures what the intervals add to serving: the quantile predict call
+    next to the point prediction for 1 and for all test rows, and /predict latency with and without the quantile model.
+    """
+    fleet_df = next(generate_fleet(num_tractors, seed=seed, batch_size=num_tractors))
+    sample_ids = fleet_df['sample_id'].unique()
+    held_out = max(2, int(len(sample_ids) * 0.4))
+    calibration_ids = sample_ids[len(sample_ids) - held_out:len(sample_ids) - held_out // 2]
+    test_ids = sample_ids[len(sample_ids) - held_out // 2:]
+    is_calibration, is_test = fleet_df['sample_id'].isin(calibration_ids), fleet_df['sample_id'].isin(test_ids)
+
+    with _quiet():
+        X_train, y_train = preprocess_and_engineer_features(fleet_df[~is_calibration & ~is_test], COLUMNS_TO_DROP, **FEATURE_PARAMS)
+        X_calibration, y_calibration = preprocess_and_engineer_features(fleet_df[is_calibration], COLUMNS_TO_DROP, **FEATURE_PARAMS)
+        X_test, y_test = preprocess_and_engineer_features(fleet_df[is_test], COLUMNS_TO_DROP, **FEATURE_PARAMS)
+        model = XGBRegressor(**BENCHMARK_MODEL_PARAMS).fit(X_train, y_train)
+        tuned_params = {key: value for key, value in BENCHMARK_MODEL_PARAMS.items() if key not in ('random_state', 'n_jobs')}
+        quantile_model = train_quantile_model(X_train, y_train, X_calibration, y_calibration, tuned_params)
+        interval = evaluate_interval(quantile_model, X_test, y_test, 'test tractors')
+
+    repeats = max(predict_requests, 1)
+    X_one = X_test.tail(1)
+    calls = {
+        'point_1_row_ms': _time_calls(lambda: model.predict(X_one), repeats) * 1000,
+        'quantiles_1_row_ms': _time_calls(lambda: predict_quantiles(quantile_model, X_one), repeats) * 1000,
+        'point_batch_ms': _time_calls(lambda: model.predict(X_test), 5) * 1000,
+        'quantiles_batch_ms': _time_calls(lambda: predict_quantiles(quantile_model, X_test), 5) * 1000
+    }
+
+    work_dir = tempfile.mkdtemp(prefix=f'rul_uncertainty_{num_tractors}_', dir=work_dir)
+    try:
+        model_path = os.path.join(work_dir, 'model.joblib')
+        joblib.dump(model, model_path)
+        history_path = os.path.join(work_dir, 'history.csv')
+        fleet_df[fleet_df['sample_id'] == test_ids[0]].to_csv(history_path, index=False)
+        without_intervals = _predict_latencies(load_backend(model_path, history_path), predict_requests)
+        joblib.dump(quantile_model, quantile_model_path(model_path))
+        with_intervals = _predict_latencies(load_backend(model_path, history_path), predict_requests)
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        'test_interval': interval,
+        'batch_rows': int(len(X_test)),
+        'predict_calls': calls,
+        'request_without_intervals': without_intervals,
+        'request_with_intervals': with_intervals,
+        'request_p50_overhead_ms': with_intervals['p50_ms'] - without_intervals['p50_ms'],
+        'request_p50_overhead_ratio': with_intervals['p50_ms'] / without_intervals['p50_ms'] - 1
+    }
+
+
+def print_uncertainty_overhead(num_tractors, overhead):
+    calls, interval = overhead['predict_calls'], overhead['test_interval']
+    print(f"  uncertainty ({num_tractors} tractors): {interval['level']:.0%} interval covers "
+          f"{interval['coverage']:.1%} of test rows (mean width {interval['mean_width']:.0f} h)")
+    print(f"    1 row: point {calls['point_1_row_ms']:.2f} ms, quantiles {calls['quantiles_1_row_ms']:.2f} ms; "
+          f"{overhead['batch_rows']} rows: point {calls['point_batch_ms']:.1f} ms, quantiles {calls['quantiles_batch_ms']:.1f} ms")
+    print(f"    /predict p50 {overhead['request_without_intervals']['p50_ms']:.1f} ms -> "
+          f"{overhead['request_with_intervals']['p50_ms']:.1f} ms ({overhead['request_p50_overhead_ratio']:+.1%})")
+
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], cwd=REPO_ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(sizes=DEFAULT_SIZES, seed=DEFAULT_SEED, predict_requests=DEFAULT_PREDICT_REQUESTS,
+                   track_allocations=False, compact_parity=False, uncertainty_overhead=False):
+    results = {
+        'commit': _git_commit(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'environment': {
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'xgboost': xgboost.__version__,
+            'sklearn': sklearn.__version__
+        },
+        'config': {
+            'seed': seed,
+            'predict_requests': predict_requests,
+            'model_params': BENCHMARK_MODEL_PARAMS,
+            'feature_params': FEATURE_PARAMS,
+            'tracemalloc': track_allocations
+        },
+        'sizes': {}
+    }
+    if compact_parity:
+        results['compact_parity'] = {}
+    if uncertainty_overhead:
+        results['uncertainty_overhead'] = {}
+    for num_tractors in sizes:
+        print(f"Benchmarking fleet of {num_tractors} tractors...")
+        stages = benchmark_fleet_size(num_tractors, seed, predict_requests, track_allocations)
+        results['sizes'][str(num_tractors)] = {record['stage']: record for record in stages}
+        for record in stages:
+            print(f"  {record['stage']:<16} {record['wall_seconds']:>9.3f} s  "
+                  f"rss peak {(record.get('rss_peak_bytes') or 0) / 1e6:>8.1f} MB")
+        if compact_parity:
+            parity = compare_compact_mode(num_tractors, seed)
+            results['compact_parity'][str(num_tractors)] = parity
+            print_compact_parity(num_tractors, parity)
+        if uncertainty_overhead:
+            overhead = measure_uncertainty_overhead(num_tractors, seed, predict_requests)
+            results['uncertainty_overhead'][str(num_tractors)] = overhead
+            print_uncertainty_overhead(num_tractors, overhead)
+    return results
+
+
+def compare_results(current, baseline, tolerance=DEFAULT_REGRESSION_TOLERANCE):
+    """Prints wall-time and peak-RSS ratios against a baseline; returns the list of regressed (size, stage)."""
+    regressions = []
+    print(f"\n--- Compared with baseline {baseline.get('commit') or '(unknown commit)'} ---")
+    print(f"{'size':>7} {'stage':<16} {'base s':>9} {'now s':>9} {'ratio':>7} {'rss ratio':>10}")
+    for size, stages in current['sizes'].items():
+        baseline_stages = baseline.get('sizes', {}).get(size)
+        if baseline_stages is None:
+            continue
+        for stage, record in stages.items():
+            baseline_record = baseline_stages.get(stage)
+            if baseline_record is None or not baseline_record.get('wall_seconds'):
+                continue
+            ratio = record['wall_seconds'] / baseline_record['wall_seconds']
+            rss_ratio = None
+            if record.get('rss_peak_bytes') and baseline_record.get('rss_peak_bytes'):
+                rss_ratio = record['rss_peak_bytes'] / baseline_record['rss_peak_bytes']
+            flag = '  REGRESSION' if ratio > tolerance else ''
+            rss_text = f"{rss_ratio:>10.2f}" if rss_ratio is not None else f"{'-':>10}"
+            print(f"{size:>7} {stage:<16} {baseline_record['wall_seconds']:>9.3f} {record['wall_seconds']:>9.3f} "
+                  f"{ratio:>7.2f} {rss_text}{flag}")
+            if ratio > tolerance:
+                regressions.append((size, stage))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, features, training and serving.")
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help="Comma-separated fleet sizes in tractors (e.g. 10,1000,100000).")
+    parser.add_argument('--seed', type=int, default=DEFAULT_SEED, help="Seed of the synthetic fleets.")
+    parser.add_argument('--predict-requests', type=int, default=DEFAULT_PREDICT_REQUESTS,
+                        help="Single /predict requests timed per fleet size.")
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help="Also record Python allocation peaks with tracemalloc (slows allocation-heavy stages down).")
+    parser.add_argument('--compact-parity', action='store_true',
+                        help="Also train on float64 and compact float32 features and report memory and accuracy parity.")
+    parser.add_argument('--uncertainty-overhead', action='store_true',
+                        help="Also train a quantile model and measure what prediction intervals add to serving.")
+    parser.add_argument('--output', default='benchmark_results.json', help="Where to write the JSON results.")
+    parser.add_argument('--compare', default=None, help="Baseline JSON from an earlier run to compare against.")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_REGRESSION_TOLERANCE,
+                        help="Slowdown ratio reported as a regression.")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(',') if size]
+    results = run_benchmarks(sizes, args.seed, args.predict_requests, args.tracemalloc, args.compact_parity,
+                             args.uncertainty_overhead)
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} stage(s) slower than {args.tolerance}x the baseline.")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
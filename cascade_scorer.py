@@ -0,0 +1,249 @@
+import io
+import json
+import time
+import argparse
+import warnings
+import contextlib
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from mae_403 import COLUMNS_TO_DROP, MODEL_FILENAME, load_feature_params, preprocess_and_engineer_features
+from generate_synthetic_data import SENSOR_BASELINES, generate_fleet
+
+# Two-tier cascade scoring. The first tier is a vectorized check over the raw telemetry of every tractor, with no
+# feature engineering and no booster:
+#   - RUL lower bound: the low LIFE_QUANTILE of the ages (cumulative hours) at which training tractors failed,
+#     minus the tractor's current age;
+#   - range check: every sensor of the last RANGE_MONTHS months inside its SENSOR_BASELINES range, give or take
+#     RANGE_TOLERANCE of the range width (the simulated sensor noise);
+#   - trend check: no sensor's least-squares trend over the last TREND_MONTHS months moving more than MAX_TREND
+#     range widths.
+# A tractor passing all three with a bound of at least HEALTHY_MIN_RUL hours is reported healthy with that bound;
+# only the others are feature-engineered and scored by the full model. `python cascade_scorer.py` calibrates
+# the bound on one synthetic fleet and measures throughput and missed alerts on another.
+
+CASCADE_CONFIG_FILENAME = 'cascade_config.json'
+
+LIFE_QUANTILE = 0.01
+RANGE_MONTHS = 3
+RANGE_TOLERANCE = 0.05
+TREND_MONTHS = 6
+MAX_TREND = 1.0
+
+# Healthy tractors must be guaranteed this far from failure: the frontend's Low priority band
+HEALTHY_MIN_RUL = 1000.0
+
+# Months of history scored per tractor, as in the backend, and the least the full model can engineer features from
+HISTORY_WINDOW_MONTHS = 30
+MIN_HISTORY_MONTHS = 21
+
+DEFAULT_SNAPSHOTS = 5
+
+SENSORS = list(SENSOR_BASELINES)
+_SENSOR_LOWS = np.array([SENSOR_BASELINES[sensor][0] for sensor in SENSORS])
+_SENSOR_WIDTHS = np.array([SENSOR_BASELINES[sensor][1] - SENSOR_BASELINES[sensor][0] for sensor in SENSORS])
+
+
+def calibrate_cascade(training_df, life_quantile=LIFE_QUANTILE):
+    """Cascade config whose RUL bound comes from the failure ages (cumulative hours + RUL) of `training_df`."""
+    labelled = training_df.dropna(subset=['remaining_useful_life_hours'])
+    failure_ages = (labelled['cumulative_hours'] + labelled['remaining_useful_life_hours']).groupby(
+        labelled['sample_id']).median()
+    return {
+        'life_hours_lower_bound': float(np.quantile(failure_ages, life_quantile)),
+        'life_quantile': life_quantile,
+        'calibration_tractors': int(len(failure_ages)),
+        'range_months': RANGE_MONTHS,
+        'range_tolerance': RANGE_TOLERANCE,
+        'trend_months': TREND_MONTHS,
+        'max_trend': MAX_TREND,
+        'healthy_min_rul': HEALTHY_MIN_RUL
+    }
+
+
+def save_cascade_config(config, path=CASCADE_CONFIG_FILENAME):
+    with open(path, 'w') as f:
+        json.dump(config, f, indent=2)
+
+
+def load_cascade_config(path=CASCADE_CONFIG_FILENAME):
+    with open(path) as f:
+        return json.load(f)
+
+
+def tier_one(histories, config):
+    """
+    First-tier check of every tractor in `histories` (monthly records with sample_id, in time order per tractor).
+    Returns a DataFrame indexed by sample_id with rul_lower_bound, range_excess (largest distance outside a
+    baseline range, in range widths), trend (largest trend over the trend window, in range widths) and healthy.
+    """
+    groups = histories['sample_id'].to_numpy()
+    months_from_end = histories.groupby('sample_id', sort=False).cumcount(ascending=False).to_numpy()
+    sensors = [sensor for sensor in SENSORS if sensor in histories.columns]
+    sensor_index = [SENSORS.index(sensor) for sensor in sensors]
+    # Readings as positions in their baseline range: 0 = low end, 1 = high end
+    positions = (histories[sensors].to_numpy(dtype=np.float64) - _SENSOR_LOWS[sensor_index]) / _SENSOR_WIDTHS[sensor_index]
+
+    recent = months_from_end < config['range_months']
+    excess = np.maximum(-positions, positions - 1).max(axis=1)
+    range_excess = pd.Series(excess[recent]).groupby(groups[recent]).max()
+
+    # Least-squares slope of every sensor over the trend window, from per-tractor sums
+    window = months_from_end < config['trend_months']
+    t = -months_from_end[window].astype(np.float64)
+    x = positions[window]
+    sums = pd.DataFrame(np.column_stack([np.ones_like(t), t, t * t, x, x * t[:, None]])).groupby(groups[window]).sum()
+    n, sum_t, sum_tt = sums[0].to_numpy(), sums[1].to_numpy(), sums[2].to_numpy()
+    sum_x = sums.iloc[:, 3:3 + len(sensors)].to_numpy()
+    sum_tx = sums.iloc[:, 3 + len(sensors):].to_numpy()
+    denominator = n * sum_tt - sum_t ** 2
+    with np.errstate(divide='ignore', invalid='ignore'):
+        slopes = (n[:, None] * sum_tx - sum_t[:, None] * sum_x) / denominator[:, None]
+    trend = pd.Series(np.nan_to_num(np.abs(slopes) * (config['trend_months'] - 1)).max(axis=1), index=sums.index)
+
+    latest_hours = histories.groupby('sample_id', sort=False)['cumulative_hours'].last()
+    result = pd.DataFrame({'rul_lower_bound': config['life_hours_lower_bound'] - latest_hours})
+    result['range_excess'] = range_excess.reindex(result.index)
+    result['trend'] = trend.reindex(result.index)
+    result['healthy'] = (
+        (result['rul_lower_bound'] >= config['healthy_min_rul'])
+        & (result['range_excess'] <= config['range_tolerance'])
+        & (result['trend'] <= config['max_trend'])
+    )
+    return result
+
+
+def score_full(model, feature_params, histories):
+    """Full-model RUL of every tractor's latest month (NaN without enough history), in one feature pass."""
+    if not len(histories):
+        return pd.Series(dtype=np.float64)
+    # Positional group ids keep every history in time order through the sort inside feature engineering
+    sample_ids = pd.unique(histories['sample_id'])
+    positional = histories.assign(sample_id=pd.factorize(histories['sample_id'])[0]).reset_index(drop=True)
+    with warnings.catch_warnings(), contextlib.redirect_stdout(io.StringIO()):
+        warnings.simplefilter('ignore', pd.errors.PerformanceWarning)
+        X, _ = preprocess_and_engineer_features(positional, COLUMNS_TO_DROP, **feature_params)
+    group_ids = positional.loc[X.index, 'sample_id']
+    latest_index = group_ids.index.to_series().groupby(group_ids.values).max()
+    X_latest = X.loc[latest_index.values].reindex(columns=model.get_booster().feature_names, fill_value=0)
+    predictions = pd.Series(model.predict(X_latest), index=sample_ids[latest_index.index])
+    return predictions.reindex(sample_ids)
+
+
+def score_cascade(model, feature_params, histories, config):
+    """
+    Cascade scoring: tier_one for every tractor, the full model only for the flagged ones.
+    Returns a DataFrame indexed by sample_id with hours_until_failure (the lower bound for healthy tractors) and tier.
+    """
+    checks = tier_one(histories, config)
+    flagged = checks.index[~checks['healthy']]
+    predictions = score_full(model, feature_params, histories[histories['sample_id'].isin(flagged)])
+    result = pd.DataFrame({'hours_until_failure': checks['rul_lower_bound'], 'tier': 'healthy'})
+    result.loc[flagged, 'hours_until_failure'] = predictions.reindex(flagged).to_numpy()
+    result.loc[flagged, 'tier'] = 'model'
+    return result
+
+
+def fleet_snapshots(fleet_df, snapshots, seed):
+    """
+    `snapshots` views of the fleet at random moments: every tractor cut at a random month with enough history,
+    keeping its last HISTORY_WINDOW_MONTHS months. Yields (histories, true RUL per sample_id).
+    """
+    rng = np.random.default_rng(seed)
+    month_index = fleet_df.groupby('sample_id', sort=False).cumcount().to_numpy()
+    lengths = fleet_df.groupby('sample_id', sort=False)['sample_id'].transform('size').to_numpy()
+    for _ in range(snapshots):
+        cuts = {sample_id: rng.integers(MIN_HISTORY_MONTHS - 1, length)
+                for sample_id, length in fleet_df.groupby('sample_id', sort=False).size().items()
+                if length >= MIN_HISTORY_MONTHS}
+        cut = fleet_df['sample_id'].map(cuts).to_numpy(dtype=np.float64)
+        keep = (month_index <= cut) & (month_index > cut - HISTORY_WINDOW_MONTHS) & (lengths >= MIN_HISTORY_MONTHS)
+        histories = fleet_df[keep].reset_index(drop=True)
+        true_rul = histories.groupby('sample_id', sort=False)['remaining_useful_life_hours'].last()
+        yield histories, true_rul
+
+
+def evaluate_cascade(model, feature_params, config, fleet_df, snapshots=DEFAULT_SNAPSHOTS, seed=0):
+    """Times full and cascade scoring of the same fleet snapshots and counts alerts the cascade misses."""
+    full_seconds = cascade_seconds = 0.0
+    tractors = healthy = missed = full_missed = cascade_missed = alerts = 0
+    for histories, true_rul in fleet_snapshots(fleet_df, snapshots, seed):
+        start = time.perf_counter()
+        full = score_full(model, feature_params, histories)
+        full_seconds += time.perf_counter() - start
+
+        start = time.perf_counter()
+        cascade = score_cascade(model, feature_params, histories, config)
+        cascade_seconds += time.perf_counter() - start
+
+        # An alert is due when the tractor is within HEALTHY_MIN_RUL hours of failure
+        due = true_rul.reindex(cascade.index) < config['healthy_min_rul']
+        is_healthy = cascade['tier'] == 'healthy'
+        tractors += len(cascade)
+        healthy += int(is_healthy.sum())
+        alerts += int(due.sum())
+        missed += int((due & is_healthy).sum())
+        full_missed += int((due & (full.reindex(cascade.index) >= config['healthy_min_rul'])).sum())
+        cascade_missed += int((due & (cascade['hours_until_failure'] >= config['healthy_min_rul'])).sum())
+
+    return {
+        'snapshots': snapshots,
+        'tractors_scored': tractors,
+        'healthy_share': healthy / tractors if tractors else None,
+        'full_tractors_per_second': tractors / full_seconds if full_seconds else None,
+        'cascade_tractors_per_second': tractors / cascade_seconds if cascade_seconds else None,
+        'speedup': full_seconds / cascade_seconds if cascade_seconds else None,
+        'alerts_due': alerts,
+        # Tractors within HEALTHY_MIN_RUL hours of failure that the first tier passed as healthy
+        'missed_by_first_tier': missed,
+        'missed_alert_rate_first_tier': missed / alerts if alerts else None,
+        # For context: due alerts missed end to end, by the full model alone and by the cascade
+        'missed_alert_rate_full_model': full_missed / alerts if alerts else None,
+        'missed_alert_rate_cascade': cascade_missed / alerts if alerts else None
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calibrate the cascade scorer and measure its throughput and missed alerts.")
+    parser.add_argument('--model', default=MODEL_FILENAME, help="Full model the flagged tractors are scored with.")
+    parser.add_argument('--calibration-tractors', type=int, default=500,
+                        help="Synthetic tractors whose failure ages calibrate the RUL lower bound.")
+    parser.add_argument('--tractors', type=int, default=200, help="Synthetic tractors in the evaluated fleet.")
+    parser.add_argument('--snapshots', type=int, default=DEFAULT_SNAPSHOTS,
+                        help="Random moments at which the evaluated fleet is scored.")
+    parser.add_argument('--seed', type=int, default=42, help="Seed of the calibration fleet (the evaluated one uses seed + 1).")
+    parser.add_argument('--output', default=CASCADE_CONFIG_FILENAME, help="Where to write the cascade config.")
+    parser.add_argument('--report', default='cascade_report.json', help="Where to write the JSON report.")
+    args = parser.parse_args(argv)
+
+    calibration_df = next(generate_fleet(args.calibration_tractors, seed=args.seed, batch_size=args.calibration_tractors))
+    config = calibrate_cascade(calibration_df)
+    save_cascade_config(config, args.output)
+    print(f"RUL lower bound: {config['life_hours_lower_bound']:.0f} hours minus current age "
+          f"({config['life_quantile']:.0%} of {config['calibration_tractors']} failure ages); config written to {args.output}")
+
+    model = joblib.load(args.model)
+    fleet_df = next(generate_fleet(args.tractors, seed=args.seed + 1, batch_size=args.tractors))
+    report = evaluate_cascade(model, load_feature_params(args.model), config, fleet_df, args.snapshots, args.seed)
+    report['config'] = config
+
+    print(f"Scored {report['tractors_scored']} tractors over {report['snapshots']} snapshots; "
+          f"{report['healthy_share']:.1%} passed the first tier as healthy.")
+    print(f"Throughput: full model {report['full_tractors_per_second']:.1f} tractors/s, "
+          f"cascade {report['cascade_tractors_per_second']:.1f} tractors/s ({report['speedup']:.2f}x).")
+    if report['alerts_due']:
+        print(f"Alerts due (RUL < {config['healthy_min_rul']:.0f} h): {report['alerts_due']}; "
+              f"passed as healthy by the first tier: {report['missed_by_first_tier']} "
+              f"({report['missed_alert_rate_first_tier']:.2%}).")
+        print(f"Missed end to end: full model {report['missed_alert_rate_full_model']:.2%}, "
+              f"cascade {report['missed_alert_rate_cascade']:.2%}.")
+
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.report}")
+
+
+if __name__ == '__main__':
+    main()
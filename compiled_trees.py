@@ -0,0 +1,218 @@
+import io
+import json
+import time
+import argparse
+import warnings
+import contextlib
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from mae_403 import COLUMNS_TO_DROP, MODEL_FILENAME, load_feature_params, preprocess_and_engineer_features
+
+# Compiled tree-ensemble predictor for small batches. XGBoost's predict has a fixed cost per call (DataFrame
+# validation, DMatrix construction, thread dispatch) that dwarfs evaluating a few hundred trees for one tractor.
+# compile_booster flattens every tree of a trained booster into shared node arrays (split feature, threshold,
+# children, default direction for missing values, leaf value), and CompiledTrees.predict walks all trees of all
+# rows at once: one vectorized NumPy step per tree level. Leaves point to themselves, so rows that reach a leaf
+# early stay there. XGBoost allocates the two children of a split next to each other, so for inputs without
+# missing or infinite values a level is one comparison and `left + went_right` (leaves get an infinite
+# threshold to stay put); other inputs take the general path with default directions. Splits compare float32
+# values like XGBoost does; validate_parity checks the predictions against the original model before the
+# backend uses it.
+
+# Objectives whose prediction is the raw margin (the sum of leaf values plus the base score)
+IDENTITY_OBJECTIVES = {'reg:squarederror', 'reg:absoluteerror', 'reg:pseudohubererror', 'reg:quantileerror',
+                       'reg:squaredlogerror'}
+
+# Largest difference from the booster's predictions accepted by validate_parity, in float32 ULPs (spacings) of the
+# largest prediction: both sum hundreds of float32 leaf values, in a different order, so their rounding differs by
+# a few ULPs of the prediction scale (about 8 for 200 trees around 5000 hours) and grows with the number of trees
+PARITY_TOLERANCE_ULPS = 256
+
+BENCHMARK_BATCH_SIZES = [1, 10, 100]
+
+
+def _parse_float(value):
+    """XGBoost JSON stores some floats as strings, and vector-valued ones as '[v]'."""
+    return float(str(value).strip('[]'))
+
+
+class CompiledTrees:
+    """Flattened tree ensemble: parallel node arrays plus the root node of every tree."""
+
+    def __init__(self, feature_names, base_score, roots, feature, threshold, left, right, default_left, value, depth,
+                 paired_children):
+        self.feature_names = feature_names
+        self.base_score = base_score
+        self.roots = roots
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.default_left = default_left
+        self.value = value
+        self.depth = depth
+        # Every split's right child directly follows its left child
+        self.paired_children = paired_children
+        # Leaves compare against +inf, so finite values never leave them on the fast path
+        self.fast_threshold = np.where(left == np.arange(len(left)), np.float32(np.inf), threshold)
+
+    def _values(self, X):
+        """X as a contiguous float32 array in the model's feature order."""
+        if isinstance(X, pd.DataFrame):
+            X = X.reindex(columns=self.feature_names, fill_value=0).to_numpy(dtype=np.float32)
+        return np.ascontiguousarray(X, dtype=np.float32)
+
+    def predict(self, X):
+        """Predictions for every row of X (a DataFrame, aligned by feature name, or an array in feature order)."""
+        X = self._values(X)
+        nodes = np.broadcast_to(self.roots, (len(X), len(self.roots)))
+        if self.paired_children and np.isfinite(X).all():
+            flat = X.ravel()
+            row_starts = (np.arange(len(X)) * X.shape[1])[:, None]
+            for _ in range(self.depth):
+                went_right = flat[row_starts + self.feature[nodes]] >= self.fast_threshold[nodes]
+                nodes = self.left[nodes] + went_right
+            return (self.value[nodes].sum(axis=1, dtype=np.float64) + self.base_score).astype(np.float32)
+
+        rows = np.arange(len(X))[:, None]
+        for _ in range(self.depth):
+            x = X[rows, self.feature[nodes]]
+            go_left = np.where(np.isnan(x), self.default_left[nodes], x < self.threshold[nodes])
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        return (self.value[nodes].sum(axis=1, dtype=np.float64) + self.base_score).astype(np.float32)
+
+
+def compile_booster(model):
+    """CompiledTrees of a fitted XGBRegressor (or Booster) with a single target and an identity objective."""
+    booster = model.get_booster() if hasattr(model, 'get_booster') else model
+    config = json.loads(booster.save_raw('json'))['learner']
+    objective = config['objective']['name']
+    if objective not in IDENTITY_OBJECTIVES:
+        raise ValueError(f"Cannot compile objective {objective!r}; supported: {sorted(IDENTITY_OBJECTIVES)}")
+    if int(config['learner_model_param'].get('num_target', 1)) != 1:
+        raise ValueError("Cannot compile a multi-target booster")
+    if config['gradient_booster']['name'] != 'gbtree':
+        raise ValueError(f"Cannot compile booster {config['gradient_booster']['name']!r}; only gbtree")
+
+    trees = config['gradient_booster']['model']['trees']
+    # predict() of a model trained with early stopping uses the trees up to the best iteration
+    best_iteration = booster.attr('best_iteration')
+    if best_iteration is not None:
+        trees = trees[:int(best_iteration) + 1]
+
+    roots, features, thresholds, lefts, rights, default_lefts, values = [], [], [], [], [], [], []
+    offset, depth, paired_children = 0, 0, True
+    for tree in trees:
+        if tree['categories_nodes']:
+            raise ValueError("Cannot compile categorical splits")
+        left = np.asarray(tree['left_children'], dtype=np.int64)
+        right = np.asarray(tree['right_children'], dtype=np.int64)
+        is_leaf = left == -1
+        paired_children = paired_children and bool(np.all((right == left + 1)[~is_leaf]))
+        node_ids = np.arange(len(left))
+        # Leaves loop back to themselves; their leaf value is stored in split_conditions
+        left = np.where(is_leaf, node_ids, left)
+        right = np.where(is_leaf, node_ids, right)
+        conditions = np.asarray(tree['split_conditions'], dtype=np.float32)
+
+        roots.append(offset)
+        features.append(np.where(is_leaf, 0, tree['split_indices']))
+        thresholds.append(conditions)
+        lefts.append(left + offset)
+        rights.append(right + offset)
+        default_lefts.append(np.asarray(tree['default_left'], dtype=bool))
+        values.append(np.where(is_leaf, conditions, 0.0).astype(np.float32))
+        depth = max(depth, _tree_depth(np.asarray(tree['parents'], dtype=np.int64), is_leaf))
+        offset += len(left)
+
+    return CompiledTrees(
+        feature_names=list(booster.feature_names) if booster.feature_names else None,
+        base_score=_parse_float(config['learner_model_param']['base_score']),
+        roots=np.asarray(roots, dtype=np.int64),
+        feature=np.concatenate(features).astype(np.int64),
+        threshold=np.concatenate(thresholds),
+        left=np.concatenate(lefts),
+        right=np.concatenate(rights),
+        default_left=np.concatenate(default_lefts),
+        value=np.concatenate(values),
+        depth=depth,
+        paired_children=paired_children
+    )
+
+
+def _tree_depth(parents, is_leaf):
+    """Levels from the root to the deepest leaf (the root's parent is stored as 2147483647)."""
+    depth = np.zeros(len(parents), dtype=np.int64)
+    # Children always have larger ids than their parents, so one pass in id order suffices
+    for node in range(1, len(parents)):
+        depth[node] = depth[parents[node]] + 1
+    return int(depth[is_leaf].max()) if is_leaf.any() else 0
+
+
+def parity_tolerance(predictions, ulps=PARITY_TOLERANCE_ULPS):
+    """`ulps` float32 spacings at the largest magnitude of `predictions`: the rounding two summation orders allow."""
+    scale = np.max(np.abs(predictions)) if len(predictions) else 0.0
+    return float(ulps * np.spacing(np.float32(scale)))
+
+
+def validate_parity(compiled, model, X, ulps=PARITY_TOLERANCE_ULPS):
+    """
+    Largest absolute difference between compiled and booster predictions on X; raises beyond `ulps` float32 ULPs
+    of the prediction scale (see parity_tolerance).
+    """
+    expected = model.predict(X.reindex(columns=compiled.feature_names, fill_value=0))
+    difference = float(np.max(np.abs(compiled.predict(X) - expected))) if len(X) else 0.0
+    tolerance = parity_tolerance(expected, ulps)
+    if difference > tolerance:
+        raise ValueError(f"Compiled predictions differ from the booster by up to {difference:.4f} "
+                         f"(tolerance {tolerance:.4f}, {ulps} float32 ULPs of the prediction scale)")
+    return difference
+
+
+def _time_predictions(predict, X, repeats):
+    predict(X)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        predict(X)
+    return (time.perf_counter() - start) * 1000 / repeats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compile a trained booster, check parity and time small batches.")
+    parser.add_argument('--model', default=MODEL_FILENAME, help="Trained model to compile.")
+    parser.add_argument('--tractors', type=int, default=40, help="Synthetic tractors whose features are scored.")
+    parser.add_argument('--seed', type=int, default=7, help="Seed of the synthetic tractors.")
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=BENCHMARK_BATCH_SIZES, help="Rows per call.")
+    parser.add_argument('--repeats', type=int, default=50, help="Calls timed per batch size and predictor.")
+    args = parser.parse_args(argv)
+
+    from generate_synthetic_data import generate_fleet
+    model = joblib.load(args.model)
+    fleet_df = next(generate_fleet(args.tractors, seed=args.seed, batch_size=args.tractors))
+    with warnings.catch_warnings(), contextlib.redirect_stdout(io.StringIO()):
+        warnings.simplefilter('ignore', pd.errors.PerformanceWarning)
+        X, _ = preprocess_and_engineer_features(fleet_df, COLUMNS_TO_DROP, **load_feature_params(args.model))
+
+    start = time.perf_counter()
+    compiled = compile_booster(model)
+    print(f"Compiled {len(compiled.roots)} trees ({len(compiled.value)} nodes, depth {compiled.depth}) "
+          f"in {time.perf_counter() - start:.2f} s.")
+    X = X.reindex(columns=compiled.feature_names, fill_value=0)
+    print(f"Parity on {len(X)} rows: max difference {validate_parity(compiled, model, X):.5f} hours.")
+
+    booster = model.get_booster()
+    print(f"{'rows':>6} {'predict ms':>11} {'inplace ms':>11} {'compiled ms':>12} {'speedup':>8}")
+    for batch_size in args.batch_sizes:
+        batch = X.iloc[:batch_size]
+        values = np.ascontiguousarray(batch.to_numpy(dtype=np.float32))
+        stock_ms = _time_predictions(model.predict, batch, args.repeats)
+        inplace_ms = _time_predictions(booster.inplace_predict, values, args.repeats)
+        compiled_ms = _time_predictions(compiled.predict, batch, args.repeats)
+        print(f"{len(batch):>6} {stock_ms:>11.2f} {inplace_ms:>11.2f} {compiled_ms:>12.2f} {stock_ms / compiled_ms:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+import io
+import argparse
+import warnings
+import contextlib
+
+import joblib
+import numpy as np
+import pandas as pd
+import xgboost
+from sklearn.model_selection import train_test_split
+
+from mae_403 import (
+    COLUMNS_TO_DROP, MODEL_FILENAME, PARAM_DIST, RANDOM_STATE, TEST_SIZE, load_data_folder, load_feature_params,
+    preprocess_and_engineer_features, training_folder_path
+)
+from evaluate_fleet import compute_metrics
+from generate_synthetic_data import TYPES_OF_FAILURES
+
+# Per-component RUL models. Every tractor history ends in one failure (type_of_failure), so its RUL labels are
+# the hours until that component fails. For every other component the same labels are right-censored: it was
+# still working that many hours later, when the tractor failed some other way. One accelerated failure time model
+# (XGBoost survival:aft) per failure type is trained on every tractor with those censored labels, on the same
+# engineered features as the fleet model, so the components' predictions are comparable and can be ranked.
+# The models are saved together as a bundle; the backend engineers a tractor's features once and runs every
+# component model on that one matrix, then ranks the components by predicted RUL (most urgent first).
+# Training reports how often the first-ranked component is the one that actually failed, on held-out tractors.
+
+COMPONENT_MODELS_FILENAME = 'component_models.joblib'
+
+# Components with fewer failed tractors than this get no model
+MIN_COMPONENT_TRACTORS = 3
+
+# Survival objective of the component models: log failure time ~ tree ensemble + normal noise of this scale
+COMPONENT_OBJECTIVE = {
+    'objective': 'survival:aft',
+    'aft_loss_distribution': 'normal',
+    'aft_loss_distribution_scale': 1.0
+}
+
+# Failure times are modelled on a log scale, so RUL labels of 0 (the month of the failure) are raised to this
+MIN_SURVIVAL_HOURS = 1.0
+
+# Used when there is no fleet model to take tuned hyperparameters from
+DEFAULT_COMPONENT_MODEL_PARAMS = {
+    'n_estimators': 400,
+    'max_depth': 6,
+    'learning_rate': 0.05,
+    'subsample': 0.9,
+    'colsample_bytree': 0.9
+}
+
+
+def component_name(failure_type):
+    """'Hydraulic System Failure' -> 'Hydraulic System', 'Tire Damage' -> 'Tire'."""
+    for suffix in (' Failure', ' Damage'):
+        if failure_type.endswith(suffix):
+            return failure_type[:-len(suffix)]
+    return failure_type
+
+
+def fleet_model_params(model_path=MODEL_FILENAME):
+    """Tuned hyperparameters (the PARAM_DIST keys) of the saved fleet model, or the defaults without one."""
+    try:
+        params = joblib.load(model_path).get_params()
+    except (OSError, EOFError):
+        return dict(DEFAULT_COMPONENT_MODEL_PARAMS)
+    return {key: params[key] for key in PARAM_DIST if params.get(key) is not None}
+
+
+def engineer_with_failure_types(df, feature_params):
+    """(X, y, type_of_failure per row of X) with features engineered in one call for the whole fleet."""
+    df = df.sort_values(by=['sample_id'], kind='stable').reset_index(drop=True)
+    with warnings.catch_warnings(), contextlib.redirect_stdout(io.StringIO()):
+        warnings.simplefilter('ignore', pd.errors.PerformanceWarning)
+        X, y = preprocess_and_engineer_features(df, COLUMNS_TO_DROP, **feature_params)
+    # Rows of X are positions in the sample_id-sorted frame, and the failure type is constant per sample_id
+    return X, y, df.loc[X.index, ['sample_id', 'type_of_failure']].reset_index(drop=True)
+
+
+def fit_censored_model(X, lower, upper, model_params):
+    """
+    Booster with COMPONENT_OBJECTIVE fitted on failure times between `lower` and `upper` hours per row (equal for
+    observed failures, upper=inf for censored ones). `model_params` are XGBRegressor-style hyperparameters.
+    """
+    params = dict(model_params)
+    n_estimators = params.pop('n_estimators', DEFAULT_COMPONENT_MODEL_PARAMS['n_estimators'])
+    data = xgboost.DMatrix(X)
+    data.set_float_info('label_lower_bound', lower)
+    data.set_float_info('label_upper_bound', upper)
+    return xgboost.train({**params, **COMPONENT_OBJECTIVE, 'seed': RANDOM_STATE, 'verbosity': 0}, data,
+                         num_boost_round=n_estimators)
+
+
+def ranking_accuracy(bundle, X, failure_types, top=(1, 3)):
+    """Share of rows whose actual failure type is among the `k` components predicted to fail first, for each k."""
+    if not len(X):
+        return {}
+    order = np.argsort(predict_components(bundle, X), axis=1)
+    component_types = np.array([TYPES_OF_FAILURES[name] for name in bundle['failure_types']])[order]
+    hits = component_types == np.asarray(failure_types)[:, None]
+    return {f'top_{k}': float(hits[:, :k].any(axis=1).mean()) for k in top}
+
+
+def train_component_models(df, feature_params, model_params=None, min_tractors=MIN_COMPONENT_TRACTORS,
+                           test_size=TEST_SIZE):
+    """
+    Trains one survival model per failure type on every tractor, censored for tractors that failed another way.
+    Models fitted on a split of the tractors are validated on the held-out ones: MAE per component on its own
+    failures, and how often the ranking puts the actual failure first (or in the top 3). The saved models are
+    refitted on every tractor. Returns (bundle, report); the bundle holds the models by component name plus the
+    shared feature params.
+    """
+    model_params = model_params or dict(DEFAULT_COMPONENT_MODEL_PARAMS)
+    X, y, metadata = engineer_with_failure_types(df, feature_params)
+    X, y = X.reset_index(drop=True), y.reset_index(drop=True)
+    hours = np.maximum(y.to_numpy(dtype=float), MIN_SURVIVAL_HOURS)
+    failure_types = metadata['type_of_failure'].to_numpy()
+
+    train_ids, test_ids = train_test_split(metadata['sample_id'].unique(), test_size=test_size,
+                                           random_state=RANDOM_STATE)
+    is_train = metadata['sample_id'].isin(train_ids).to_numpy()
+    is_test = ~is_train
+
+    components, validation_models, failure_type_names, report = {}, {}, [], {}
+    for failure_type, type_index in TYPES_OF_FAILURES.items():
+        name = component_name(failure_type)
+        is_component = failure_types == type_index
+        n_tractors = metadata.loc[is_component, 'sample_id'].nunique()
+        if n_tractors < min_tractors:
+            print(f"{name:<18} skipped: {n_tractors} failed tractors (need {min_tractors})")
+            continue
+
+        upper = np.where(is_component, hours, np.inf)
+        model = fit_censored_model(X[is_train], hours[is_train], upper[is_train], model_params)
+        is_failure_test = is_test & is_component
+        validation = compute_metrics(y[is_failure_test],
+                                     model.inplace_predict(X[is_failure_test].to_numpy(dtype=np.float32)))
+        mae = validation['mae'] if validation['mae'] is not None else float('nan')
+        print(f"{name:<18} {n_tractors:>5} tractors  validation MAE {mae:>8.1f} h")
+
+        validation_models[name] = model
+        # Final model on every tractor
+        components[name] = fit_censored_model(X, hours, upper, model_params)
+        failure_type_names.append(failure_type)
+        report[name] = {'type_of_failure': type_index, 'tractors': int(n_tractors), 'validation': validation}
+
+    bundle = {
+        'feature_params': feature_params,
+        'feature_names': list(X.columns),
+        'objective': COMPONENT_OBJECTIVE['objective'],
+        'failure_types': failure_type_names,
+        'components': components
+    }
+    if components:
+        # Tractors that failed in a way without a model cannot be ranked right, so they are left out
+        is_ranked = is_test & np.isin(failure_types, [TYPES_OF_FAILURES[name] for name in failure_type_names])
+        validation_bundle = dict(bundle, components=validation_models)
+        report['ranking'] = dict(ranking_accuracy(validation_bundle, X[is_ranked], failure_types[is_ranked]),
+                                 rows=int(is_ranked.sum()), chance_top_1=1.0 / len(components))
+        print(f"Held-out ranking: actual failure first in {report['ranking']['top_1']:.1%} of "
+              f"{report['ranking']['rows']} rows, in the top 3 in {report['ranking']['top_3']:.1%} "
+              f"(chance {report['ranking']['chance_top_1']:.1%})")
+    return bundle, report
+
+
+def predict_components(bundle, X):
+    """
+    RUL of every component for every row of X, shape (rows, components) in bundle['components'] order.
+    X is converted to one float32 array that all boosters predict from, so adding components does not add
+    feature engineering or conversion work.
+    """
+    X_values = np.ascontiguousarray(X.reindex(columns=bundle['feature_names'], fill_value=0).to_numpy(dtype=np.float32))
+    if not bundle['components'] or not len(X_values):
+        return np.empty((len(X_values), len(bundle['components'])), dtype=np.float32)
+    return np.column_stack([model.inplace_predict(X_values) for model in bundle['components'].values()])
+
+
+def rank_components(bundle, hours):
+    """[{'component', 'hours_until_failure'}, ...] for one row of predict_components, most urgent first."""
+    ranking = [
+        {'component': name, 'hours_until_failure': int(value)}
+        for name, value in zip(bundle['components'], hours)
+    ]
+    ranking.sort(key=lambda entry: entry['hours_until_failure'])
+    return ranking
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train one RUL model per failing component.")
+    parser.add_argument('--synthetic-samples', type=int, default=None,
+                        help="Use this many tractors generated in memory instead of reading training_data_csv.")
+    parser.add_argument('--seed', type=int, default=42, help="Seed for --synthetic-samples.")
+    parser.add_argument('--model', default=MODEL_FILENAME,
+                        help="Fleet model whose feature config and tuned hyperparameters the component models share.")
+    parser.add_argument('--min-tractors', type=int, default=MIN_COMPONENT_TRACTORS,
+                        help="Failed tractors a component needs to get a model.")
+    parser.add_argument('--output', default=COMPONENT_MODELS_FILENAME, help="Where to write the model bundle.")
+    args = parser.parse_args(argv)
+
+    if args.synthetic_samples:
+        from generate_synthetic_data import generate_fleet
+        fleet_df = next(generate_fleet(args.synthetic_samples, seed=args.seed, batch_size=args.synthetic_samples))
+    else:
+        fleet_df = load_data_folder(training_folder_path, 'training')
+        if fleet_df is None:
+            print(f"No CSV files found in the training folder: {training_folder_path}")
+            return
+
+    # Same features as the fleet model, so the backend engineers them once for all models
+    bundle, _ = train_component_models(fleet_df, load_feature_params(args.model), fleet_model_params(args.model),
+                                       min_tractors=args.min_tractors)
+    if not bundle['components']:
+        print("No component had enough failed tractors; nothing saved.")
+        return
+    joblib.dump(bundle, args.output)
+    print(f"{len(bundle['components'])} component models saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
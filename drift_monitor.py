@@ -0,0 +1,407 @@
+import os
+import json
+import math
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from generate_synthetic_data import SENSOR_BASELINES
+
+# Streaming sensor drift monitor. Every sensor is summarised per tractor cohort by two constant-memory sketches:
+#   - a histogram whose bins tile its SENSOR_BASELINES range (and one range-width either side, plus
+#     under/overflow bins), and
+#   - a quantile sketch with bounded relative error (logarithmic buckets, as in DDSketch).
+# Both merge by adding counts, so sketches built over separate file batches or by separate backend worker
+# processes combine into exactly the sketch of all their rows, without revisiting raw history.
+# Training builds the reference sketches (saved next to the model as <model>.drift.json); the backend keeps
+# live sketches of the rows it scores and reports drift scores against the reference.
+
+# Histogram bins covering [low - width, high + width] of each sensor's baseline range (low, high)
+HISTOGRAM_BINS = 30
+
+# Quantile sketch: relative accuracy of the returned quantiles and the most buckets kept per sign
+RELATIVE_ACCURACY = 0.01
+MAX_BUCKETS = 2048
+
+# Cohorts by tractor age (cumulative operating hours at the row)
+COHORT_AGE_EDGES = [2000, 5000, 10000]
+FLEET_COHORT = 'fleet'
+
+# Population stability index above which a sensor counts as moderately / severely drifted
+PSI_MODERATE = 0.1
+PSI_MAJOR = 0.25
+
+# Rows a cohort needs before its own reference or live sketch is used
+MIN_COHORT_ROWS = 30
+
+DEFAULT_FILES_PER_TASK = 64
+
+
+def drift_reference_path(model_filename):
+    """Reference sketches saved next to a model: mae_403.joblib -> mae_403.drift.json."""
+    return os.path.splitext(model_filename)[0] + '.drift.json'
+
+
+class QuantileSketch:
+    """
+    Mergeable quantile sketch: a value x > 0 is counted in bucket ceil(log_gamma(x)), with
+    gamma = (1 + a) / (1 - a), so every returned quantile is within relative accuracy a of a true one.
+    Negative values use a mirrored store. Beyond `max_buckets` the lowest-magnitude buckets are collapsed.
+    """
+
+    def __init__(self, relative_accuracy=RELATIVE_ACCURACY, max_buckets=MAX_BUCKETS):
+        self.relative_accuracy = relative_accuracy
+        self.max_buckets = max_buckets
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.positive = {}
+        self.negative = {}
+        self.zero_count = 0
+        self.count = 0
+
+    def _add_to_store(self, store, magnitudes):
+        indexes, counts = np.unique(np.ceil(np.log(magnitudes) / self._log_gamma).astype(np.int64), return_counts=True)
+        for index, count in zip(indexes.tolist(), counts.tolist()):
+            store[index] = store.get(index, 0) + count
+        self._collapse(store)
+
+    def _collapse(self, store):
+        if len(store) <= self.max_buckets:
+            return
+        indexes = sorted(store)
+        excess = indexes[:len(indexes) - self.max_buckets + 1]
+        collapsed = sum(store.pop(index) for index in excess)
+        store[excess[-1]] = collapsed
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        if not len(values):
+            return
+        self.count += len(values)
+        self.zero_count += int(np.count_nonzero(values == 0))
+        if (values > 0).any():
+            self._add_to_store(self.positive, values[values > 0])
+        if (values < 0).any():
+            self._add_to_store(self.negative, -values[values < 0])
+
+    def merge(self, other):
+        if other.relative_accuracy != self.relative_accuracy:
+            raise ValueError("Quantile sketches with different relative accuracies cannot be merged")
+        for store, other_store in ((self.positive, other.positive), (self.negative, other.negative)):
+            for index, count in other_store.items():
+                store[index] = store.get(index, 0) + count
+            self._collapse(store)
+        self.zero_count += other.zero_count
+        self.count += other.count
+        return self
+
+    def _value(self, index):
+        return 2 * self.gamma ** index / (self.gamma + 1)
+
+    def quantile(self, q):
+        """Approximate q-quantile (0 <= q <= 1), or None while the sketch is empty."""
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = 0
+        for index in sorted(self.negative, reverse=True):
+            seen += self.negative[index]
+            if seen > rank:
+                return -self._value(index)
+        seen += self.zero_count
+        if seen > rank:
+            return 0.0
+        for index in sorted(self.positive):
+            seen += self.positive[index]
+            if seen > rank:
+                return self._value(index)
+        return self._value(max(self.positive)) if self.positive else 0.0
+
+    def to_dict(self):
+        return {
+            'relative_accuracy': self.relative_accuracy,
+            'max_buckets': self.max_buckets,
+            'positive': {str(index): count for index, count in self.positive.items()},
+            'negative': {str(index): count for index, count in self.negative.items()},
+            'zero_count': self.zero_count,
+            'count': self.count
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        sketch = cls(data['relative_accuracy'], data['max_buckets'])
+        sketch.positive = {int(index): count for index, count in data['positive'].items()}
+        sketch.negative = {int(index): count for index, count in data['negative'].items()}
+        sketch.zero_count = data['zero_count']
+        sketch.count = data['count']
+        return sketch
+
+
+def histogram_edges(sensor, bins=HISTOGRAM_BINS):
+    low, high = SENSOR_BASELINES[sensor]
+    width = high - low
+    return np.linspace(low - width, high + width, bins + 1)
+
+
+class SensorSketch:
+    """Histogram keyed to the sensor's baseline range (under/overflow in the first/last count) plus a QuantileSketch."""
+
+    def __init__(self, sensor, bins=HISTOGRAM_BINS):
+        self.sensor = sensor
+        self.edges = histogram_edges(sensor, bins)
+        self.counts = np.zeros(bins + 2, dtype=np.int64)
+        self.quantiles = QuantileSketch()
+
+    def add(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        values = values[np.isfinite(values)]
+        self.counts += np.bincount(np.searchsorted(self.edges, values, side='right'), minlength=len(self.counts))
+        self.quantiles.add(values)
+
+    def merge(self, other):
+        if not np.array_equal(self.edges, other.edges):
+            raise ValueError(f"Histograms of {self.sensor} with different bins cannot be merged")
+        self.counts += other.counts
+        self.quantiles.merge(other.quantiles)
+        return self
+
+    @property
+    def count(self):
+        return int(self.counts.sum())
+
+    def out_of_range_share(self):
+        """Share of values outside the baseline (low, high) range, from the histogram."""
+        low, high = SENSOR_BASELINES[self.sensor]
+        bin_lows = np.concatenate([[-np.inf], self.edges])
+        bin_highs = np.concatenate([self.edges, [np.inf]])
+        tolerance = 1e-9 * (high - low)  # the range ends are bin edges, up to floating-point rounding
+        outside = (bin_highs <= low + tolerance) | (bin_lows >= high - tolerance)
+        return float(self.counts[outside].sum() / self.count) if self.count else None
+
+    def to_dict(self):
+        return {'counts': self.counts.tolist(), 'quantiles': self.quantiles.to_dict()}
+
+    @classmethod
+    def from_dict(cls, sensor, data):
+        sketch = cls(sensor, len(data['counts']) - 2)
+        sketch.counts = np.asarray(data['counts'], dtype=np.int64)
+        sketch.quantiles = QuantileSketch.from_dict(data['quantiles'])
+        return sketch
+
+
+def cohort_labels(df):
+    """Age cohort of every row, from cumulative_hours ('unknown' where it is missing)."""
+    if 'cumulative_hours' not in df.columns:
+        return pd.Series('unknown', index=df.index)
+    edges = [-np.inf] + COHORT_AGE_EDGES + [np.inf]
+    names = [f'age<{COHORT_AGE_EDGES[0]}h'] + [
+        f'age{low}-{high}h' for low, high in zip(COHORT_AGE_EDGES[:-1], COHORT_AGE_EDGES[1:])
+    ] + [f'age>={COHORT_AGE_EDGES[-1]}h']
+    labels = pd.cut(pd.to_numeric(df['cumulative_hours'], errors='coerce'), edges, labels=names, right=False)
+    return labels.astype(object).fillna('unknown')
+
+
+class SensorSketches:
+    """
+    SensorSketch of every SENSOR_BASELINES sensor per cohort:
+
+        sketches = SensorSketches()
+        sketches.update(monthly_rows_df)
+        sketches.merge(SensorSketches.load('worker-2.json'))
+        drift_scores(reference, sketches)
+
+    Memory is constant in the number of rows: a fixed histogram and a bounded quantile sketch per cohort and sensor.
+    """
+
+    def __init__(self):
+        self.cohorts = {}
+
+    def _sketch(self, cohort, sensor):
+        sensors = self.cohorts.setdefault(cohort, {})
+        if sensor not in sensors:
+            sensors[sensor] = SensorSketch(sensor)
+        return sensors[sensor]
+
+    def update(self, df):
+        """Adds every row of `df` (monthly records with sensor columns) to its cohort's sketches."""
+        if df is None or not len(df):
+            return self
+        sensors = [sensor for sensor in SENSOR_BASELINES if sensor in df.columns]
+        labels = cohort_labels(df)
+        for cohort, rows in df.groupby(labels.values, sort=False):
+            for sensor in sensors:
+                self._sketch(cohort, sensor).add(pd.to_numeric(rows[sensor], errors='coerce'))
+        return self
+
+    def merge(self, other):
+        for cohort, sensors in other.cohorts.items():
+            for sensor, sketch in sensors.items():
+                self._sketch(cohort, sensor).merge(sketch)
+        return self
+
+    def fleet(self):
+        """Sketches of all cohorts merged, by sensor."""
+        merged = {}
+        for sensors in self.cohorts.values():
+            for sensor, sketch in sensors.items():
+                if sensor not in merged:
+                    merged[sensor] = SensorSketch(sensor, len(sketch.counts) - 2)
+                merged[sensor].merge(sketch)
+        return merged
+
+    def rows(self):
+        return sum(max((sketch.count for sketch in sensors.values()), default=0) for sensors in self.cohorts.values())
+
+    def to_dict(self):
+        return {cohort: {sensor: sketch.to_dict() for sensor, sketch in sensors.items()}
+                for cohort, sensors in self.cohorts.items()}
+
+    @classmethod
+    def from_dict(cls, data):
+        sketches = cls()
+        sketches.cohorts = {
+            cohort: {sensor: SensorSketch.from_dict(sensor, sketch) for sensor, sketch in sensors.items()}
+            for cohort, sensors in data.items()
+        }
+        return sketches
+
+    def save(self, path):
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.to_dict(), f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls.from_dict(json.load(f))
+
+
+def population_stability_index(reference_counts, live_counts, epsilon=1e-4):
+    reference = np.maximum(reference_counts / max(reference_counts.sum(), 1), epsilon)
+    live = np.maximum(live_counts / max(live_counts.sum(), 1), epsilon)
+    return float(np.sum((live - reference) * np.log(live / reference)))
+
+
+def sensor_drift_score(reference, live):
+    """Drift of one live SensorSketch from its reference: PSI over the histogram bins, median shift and range share."""
+    low, high = SENSOR_BASELINES[live.sensor]
+    psi = population_stability_index(reference.counts, live.counts)
+    reference_median, live_median = reference.quantiles.quantile(0.5), live.quantiles.quantile(0.5)
+    return {
+        'psi': psi,
+        'status': 'major' if psi > PSI_MAJOR else 'moderate' if psi > PSI_MODERATE else 'ok',
+        'rows': live.count,
+        'reference_median': reference_median,
+        'live_median': live_median,
+        # In widths of the baseline range, so shifts are comparable across sensors
+        'median_shift': (live_median - reference_median) / (high - low),
+        'out_of_range_share': live.out_of_range_share(),
+        'reference_out_of_range_share': reference.out_of_range_share()
+    }
+
+
+def drift_scores(reference, live, min_rows=MIN_COHORT_ROWS):
+    """
+    {cohort: {sensor: score}} of the live SensorSketches against the reference ones, with the merged fleet as
+    cohort FLEET_COHORT. A cohort is compared with the same reference cohort when that one has at least `min_rows`
+    rows, otherwise with the reference fleet; live cohorts with fewer rows are left out.
+    """
+    reference_fleet = reference.fleet()
+    live_groups = {FLEET_COHORT: live.fleet(), **live.cohorts}
+    scores = {}
+    for cohort, sensors in live_groups.items():
+        reference_sensors = reference_fleet if cohort == FLEET_COHORT else reference.cohorts.get(cohort, {})
+        cohort_scores = {}
+        for sensor, sketch in sensors.items():
+            reference_sketch = reference_sensors.get(sensor)
+            if reference_sketch is None or reference_sketch.count < min_rows:
+                reference_sketch = reference_fleet.get(sensor)
+            if reference_sketch is None or sketch.count < min_rows:
+                continue
+            cohort_scores[sensor] = sensor_drift_score(reference_sketch, sketch)
+        if cohort_scores:
+            scores[cohort] = cohort_scores
+    return scores
+
+
+def most_drifted(scores, top=5):
+    """The `top` (cohort, sensor, psi) with the highest PSI."""
+    ranked = [(cohort, sensor, score['psi']) for cohort, sensors in scores.items() for sensor, score in sensors.items()]
+    return sorted(ranked, key=lambda entry: entry[2], reverse=True)[:top]
+
+
+def sketch_file_batch(file_paths):
+    """SensorSketches (as a dict, to cross the process boundary) of the rows of several history files."""
+    from evaluate_fleet import read_history_file
+    sketches = SensorSketches()
+    for file_path in file_paths:
+        sketches.update(read_history_file(file_path))
+    return sketches.to_dict()
+
+
+def build_sketches(files, workers=None, files_per_task=DEFAULT_FILES_PER_TASK):
+    """Sketches of every row of `files`, built per file batch in worker processes and merged."""
+    n_workers = workers or os.cpu_count() or 1
+    files_per_task = max(1, min(files_per_task, -(-len(files) // n_workers)))
+    batches = [files[i:i + files_per_task] for i in range(0, len(files), files_per_task)]
+    sketches = SensorSketches()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for batch_sketches in executor.map(sketch_file_batch, batches):
+            sketches.merge(SensorSketches.from_dict(batch_sketches))
+    return sketches
+
+
+def print_drift_report(scores, top=10):
+    print(f"{'cohort':<16} {'sensor':<34} {'psi':>7} {'status':>9} {'median shift':>13} {'out of range':>13}")
+    for cohort, sensor, _ in most_drifted(scores, top):
+        score = scores[cohort][sensor]
+        print(f"{cohort:<16} {sensor:<34} {score['psi']:>7.3f} {score['status']:>9} "
+              f"{score['median_shift']:>+13.3f} {score['out_of_range_share']:>13.1%}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build mergeable sensor sketches and score drift against a reference.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help="Sketch every row of the given history files.")
+    build.add_argument('paths', nargs='+', help="Folders of per-tractor .csv/.parquet histories, or individual files.")
+    build.add_argument('--output', required=True, help="Where to write the sketches (JSON).")
+    build.add_argument('--workers', type=int, default=None, help="Processes sketching file batches (default: all cores).")
+
+    compare = subparsers.add_parser('compare', help="Merge live sketches and score them against a reference.")
+    compare.add_argument('reference', help="Reference sketches, e.g. mae_403.drift.json.")
+    compare.add_argument('live', nargs='+', help="Live sketches to merge, e.g. one file per backend worker.")
+    compare.add_argument('--top', type=int, default=10, help="Most drifted cohort/sensor pairs to print.")
+    compare.add_argument('--report', default=None, help="Where to write the JSON drift scores.")
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        from evaluate_fleet import list_history_files
+        files = list_history_files(args.paths)
+        if not files:
+            print(f"No .csv or .parquet files found in {args.paths}")
+            return
+        sketches = build_sketches(files, args.workers)
+        sketches.save(args.output)
+        print(f"Sketched {sketches.rows()} rows of {len(files)} files into {args.output}")
+        return
+
+    reference = SensorSketches.load(args.reference)
+    live = SensorSketches()
+    for path in args.live:
+        live.merge(SensorSketches.load(path))
+    scores = drift_scores(reference, live)
+    print(f"{live.rows()} live rows from {len(args.live)} sketch files")
+    print_drift_report(scores, args.top)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(scores, f, indent=2)
+        print(f"Drift scores written to {args.report}")
+
+
+if __name__ == '__main__':
+    main()
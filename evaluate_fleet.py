@@ -0,0 +1,307 @@
+import os
+import io
+import json
+import time
+import argparse
+import warnings
+import contextlib
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.metrics import r2_score, mean_absolute_error, mean_squared_error
+
+from mae_403 import (
+    preprocess_and_engineer_features, load_feature_params, COLUMNS_TO_DROP, FEATURE_PARAMS, MODEL_FILENAME
+)
+
+# Scores every tractor history in a folder with one batched prediction.
+# Files are read and feature-engineered in batches by parallel worker processes (the expensive part),
+# then all rows are stacked into a single matrix and passed to model.predict once.
+
+# Upper edges (hours) of the RUL buckets used in the error breakdown; the last bucket is open-ended
+DEFAULT_RUL_BUCKETS = [200, 500, 1000, 2000, 5000]
+
+METADATA_COLUMNS = ['sample_id', 'type_of_failure']
+
+# preprocess_and_engineer_features has a large fixed cost per call, so each worker task engineers
+# a batch of files in one call instead of one call per file
+DEFAULT_FILES_PER_TASK = 64
+
+
+def list_history_files(paths):
+    """Expands folders into the .csv/.parquet files they contain; files are passed through."""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(
+                os.path.join(path, filename) for filename in os.listdir(path)
+                if filename.endswith('.csv') or filename.endswith('.parquet')
+            ))
+        else:
+            files.append(path)
+    return files
+
+
+def read_history_file(file_path):
+    if file_path.endswith('.parquet'):
+        return pd.read_parquet(file_path)
+    return pd.read_csv(file_path)
+
+
+def engineer_features_with_metadata(df, metadata_columns=METADATA_COLUMNS, feature_params=FEATURE_PARAMS):
+    """
+    Runs preprocess_and_engineer_features quietly with `feature_params` (the model's, see
+    mae_403.load_feature_params) and also returns `metadata_columns` (by default sample_id/type_of_failure) of
+    every surviving row. The metadata is taken from the frame sorted the same way the function sorts it,
+    so it lines up with the index of X.
+    """
+    with warnings.catch_warnings(), contextlib.redirect_stdout(io.StringIO()):
+        warnings.simplefilter('ignore', pd.errors.PerformanceWarning)
+        X, y = preprocess_and_engineer_features(df, COLUMNS_TO_DROP, **feature_params)
+
+    if 'sample_id' in df.columns:
+        sorted_df = df.sort_values(by=['sample_id'], kind='stable').reset_index(drop=True)
+    else:
+        sorted_df = df.reset_index(drop=True)
+    metadata = sorted_df.reindex(columns=metadata_columns).loc[X.index]
+    return X, y, metadata
+
+
+def read_file_batch(file_paths):
+    """
+    Loads several history files into one frame sorted by a temporary sample_id that is unique per
+    (file, sample_id), so tractors from different files never share a group. The file name and the original
+    id are kept in the source_file and original_sample_id columns.
+    Returns (combined DataFrame or None, errors) where errors maps file path -> message.
+    """
+    frames, errors = [], {}
+    for file_path in file_paths:
+        try:
+            df = read_history_file(file_path)
+        except Exception as e:
+            errors[file_path] = str(e)
+            continue
+        if 'sample_id' not in df.columns:
+            df['sample_id'] = 0
+        df['source_file'] = os.path.basename(file_path)
+        frames.append(df)
+
+    if not frames:
+        return None, errors
+
+    combined = pd.concat(frames, ignore_index=True)
+    tractor_keys = combined['source_file'].astype(str) + ':' + combined['sample_id'].astype(str)
+    combined['original_sample_id'] = combined['sample_id']
+    combined['sample_id'] = pd.factorize(tractor_keys)[0]
+    combined = combined.sort_values(by=['sample_id'], kind='stable').reset_index(drop=True)
+    return combined, errors
+
+
+def engineer_file_batch(file_paths, metadata_columns=METADATA_COLUMNS, feature_params=FEATURE_PARAMS):
+    """
+    Loads several history files (see read_file_batch) and engineers their features with `feature_params` in a
+    single preprocess_and_engineer_features call, which has a large fixed cost per call. The original sample ids
+    are kept in the metadata.
+    Returns (X, y, metadata, raw_rows, errors) where errors maps file path -> message.
+    """
+    combined, errors = read_file_batch(file_paths)
+    if combined is None:
+        return None, None, None, 0, errors
+    raw_rows = len(combined)
+
+    try:
+        X, y, metadata = engineer_features_with_metadata(
+            combined.drop(columns=['source_file', 'original_sample_id']), metadata_columns, feature_params
+        )
+    except Exception as e:
+        errors.update({file_path: str(e) for file_path in file_paths if file_path not in errors})
+        return None, None, None, 0, errors
+
+    metadata = metadata.assign(
+        source_file=combined.loc[metadata.index, 'source_file'],
+        sample_id=combined.loc[metadata.index, 'original_sample_id']
+    )
+    return X, y, metadata, raw_rows, errors
+
+
+def engineer_fleet(files, metadata_columns=METADATA_COLUMNS, feature_params=FEATURE_PARAMS, workers=None,
+                   files_per_task=DEFAULT_FILES_PER_TASK, last_n=None):
+    """
+    Feature-engineers `files` in batches (see engineer_file_batch) spread over `workers` processes, with the
+    model's `feature_params` (see mae_403.load_feature_params). With `last_n`, only the last `last_n` rows of each
+    tractor are kept. Returns (X, y, metadata, raw_rows, errors) of the whole fleet, where errors maps file path ->
+    message; raises ValueError when no file could be feature-engineered.
+    """
+    # Spread small fleets over all workers instead of handing everything to one task
+    n_workers = workers or os.cpu_count() or 1
+    files_per_task = max(1, min(files_per_task, -(-len(files) // n_workers)))
+    batches = [files[i:i + files_per_task] for i in range(0, len(files), files_per_task)]
+
+    feature_frames, targets, metadata_frames, errors = [], [], [], {}
+    raw_rows = 0
+    engineer = partial(engineer_file_batch, metadata_columns=metadata_columns, feature_params=feature_params)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for X, y, metadata, batch_rows, batch_errors in executor.map(engineer, batches):
+            errors.update(batch_errors)
+            if X is None or y is None or X.empty:
+                continue
+            raw_rows += batch_rows
+            if last_n is not None:
+                keep = metadata.groupby(['source_file', 'sample_id'], sort=False).tail(last_n).index
+                X, y, metadata = X.loc[keep], y.loc[keep], metadata.loc[keep]
+            feature_frames.append(X)
+            targets.append(y)
+            metadata_frames.append(metadata)
+    if not feature_frames:
+        raise ValueError(f"None of the {len(files)} files could be feature-engineered: {errors}")
+
+    X = pd.concat(feature_frames, ignore_index=True)
+    y = pd.concat(targets, ignore_index=True)
+    metadata = pd.concat(metadata_frames, ignore_index=True)
+    return X, y, metadata, raw_rows, errors
+
+
+def compute_metrics(y_true, y_pred):
+    y_true = np.asarray(y_true, dtype=float)
+    y_pred = np.asarray(y_pred, dtype=float)
+    if len(y_true) == 0:
+        return {'rows': 0, 'mae': None, 'mse': None, 'rmse': None, 'r2': None}
+    mse = mean_squared_error(y_true, y_pred)
+    return {
+        'rows': int(len(y_true)),
+        'mae': float(mean_absolute_error(y_true, y_pred)),
+        'mse': float(mse),
+        'rmse': float(np.sqrt(mse)),
+        # R^2 is undefined for fewer than two rows
+        'r2': float(r2_score(y_true, y_pred)) if len(y_true) > 1 else None
+    }
+
+
+def rul_bucket_labels(rul, bucket_edges=DEFAULT_RUL_BUCKETS):
+    edges = [-np.inf] + list(bucket_edges) + [np.inf]
+    labels = [f'<{bucket_edges[0]}'] + [
+        f'{low}-{high}' for low, high in zip(bucket_edges[:-1], bucket_edges[1:])
+    ] + [f'>={bucket_edges[-1]}']
+    return pd.cut(rul, bins=edges, labels=labels, right=False)
+
+
+def _grouped_metrics(results, key):
+    grouped = {}
+    for group_value, group in results.groupby(key, observed=True, sort=True):
+        grouped[str(group_value)] = compute_metrics(group['actual'], group['predicted'])
+    return grouped
+
+
+def evaluate_fleet(model, paths, workers=None, last_n=None, rul_buckets=DEFAULT_RUL_BUCKETS,
+                   files_per_task=DEFAULT_FILES_PER_TASK, feature_params=FEATURE_PARAMS):
+    """
+    Scores every tractor history under `paths` and returns a JSON-serializable report with fleet,
+    per-tractor, per-`type_of_failure` and per-RUL-bucket error metrics plus throughput.
+    With `last_n`, only the last `last_n` scored rows of each tractor are kept (the old single-file check used 5).
+    `feature_params` must be the ones the model was trained with (see mae_403.load_feature_params).
+    """
+    files = list_history_files(paths)
+    if not files:
+        raise ValueError(f"No .csv or .parquet files found in {paths}")
+
+    start_time = time.perf_counter()
+    X_all, y_all, results, raw_rows, errors = engineer_fleet(
+        files, feature_params=feature_params, workers=workers, files_per_task=files_per_task, last_n=last_n
+    )
+    feature_seconds = time.perf_counter() - start_time
+
+    # --- Single batched prediction over the whole fleet ---
+    model_features = model.get_booster().feature_names
+    X_all = X_all.reindex(columns=model_features, fill_value=0)
+    predict_start = time.perf_counter()
+    predictions = model.predict(X_all)
+    predict_seconds = time.perf_counter() - predict_start
+    total_seconds = time.perf_counter() - start_time
+
+    results['actual'] = y_all.to_numpy(dtype=float)
+    results['predicted'] = predictions
+    results['rul_bucket'] = rul_bucket_labels(results['actual'], rul_buckets)
+
+    per_tractor = {}
+    for (source_file, sample_id), group in results.groupby(['source_file', 'sample_id'], sort=True):
+        per_tractor[f'{source_file}:{sample_id}'] = compute_metrics(group['actual'], group['predicted'])
+
+    scored_rows = len(results)
+    return {
+        'files': len(files),
+        'files_scored': int(results['source_file'].nunique()),
+        'tractors': int(results.groupby(['source_file', 'sample_id']).ngroups),
+        'fleet': compute_metrics(results['actual'], results['predicted']),
+        'by_type_of_failure': _grouped_metrics(results, 'type_of_failure'),
+        'by_rul_bucket': _grouped_metrics(results, 'rul_bucket'),
+        'per_tractor': per_tractor,
+        'throughput': {
+            'raw_rows': int(raw_rows),
+            'scored_rows': int(scored_rows),
+            'load_and_feature_seconds': feature_seconds,
+            'predict_seconds': predict_seconds,
+            'total_seconds': total_seconds,
+            'raw_rows_per_second': raw_rows / total_seconds if total_seconds > 0 else None,
+            'predicted_rows_per_second': scored_rows / predict_seconds if predict_seconds > 0 else None
+        },
+        'errors': errors
+    }
+
+
+def print_report(report):
+    fleet = report['fleet']
+    print(f"Scored {report['throughput']['scored_rows']} rows from {report['tractors']} tractors "
+          f"({report['files_scored']}/{report['files']} files).")
+    print(f"\n--- Fleet ---")
+    print(f"Mean Absolute Error: {fleet['mae']:.4f} hours")
+    print(f"Root Mean Squared Error: {fleet['rmse']:.4f} hours")
+    if fleet['r2'] is not None:
+        print(f"R^2 Score: {fleet['r2']:.4f}")
+
+    print("\n--- Error by type_of_failure ---")
+    for failure_type, metrics in report['by_type_of_failure'].items():
+        print(f"{failure_type}: MAE {metrics['mae']:.2f} hours over {metrics['rows']} rows")
+
+    print("\n--- Error by RUL bucket (hours) ---")
+    for bucket, metrics in report['by_rul_bucket'].items():
+        print(f"{bucket}: MAE {metrics['mae']:.2f} hours over {metrics['rows']} rows")
+
+    throughput = report['throughput']
+    print("\n--- Throughput ---")
+    print(f"Load + feature engineering: {throughput['load_and_feature_seconds']:.3f} s")
+    print(f"Batched prediction: {throughput['predict_seconds']:.3f} s")
+    print(f"End to end: {throughput['raw_rows_per_second']:.0f} rows/s")
+
+    if report['errors']:
+        print(f"\n{len(report['errors'])} files could not be scored:")
+        for file_path, error in report['errors'].items():
+            print(f"  {file_path}: {error}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate a trained RUL model across a fleet of tractor histories.")
+    parser.add_argument('paths', nargs='+', help="Folders of per-tractor .csv/.parquet files, or individual files.")
+    parser.add_argument('--model', default=MODEL_FILENAME, help="Path of the joblib model to evaluate.")
+    parser.add_argument('--workers', type=int, default=None, help="Feature engineering processes (default: all cores).")
+    parser.add_argument('--files-per-task', type=int, default=DEFAULT_FILES_PER_TASK,
+                        help="History files feature-engineered together by one worker task.")
+    parser.add_argument('--last-n', type=int, default=None, help="Only score the last N rows of each tractor.")
+    parser.add_argument('--report', default='evaluation_report.json', help="Where to write the JSON report.")
+    args = parser.parse_args(argv)
+
+    model = joblib.load(args.model)
+    report = evaluate_fleet(model, args.paths, workers=args.workers, last_n=args.last_n,
+                            files_per_task=args.files_per_task, feature_params=load_feature_params(args.model))
+    report['model'] = args.model
+    print_report(report)
+
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.report}")
+
+
+if __name__ == '__main__':
+    main()
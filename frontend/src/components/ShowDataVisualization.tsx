@@ -1,52 +1,96 @@
-import {FC} from 'react';
+import {FC, useEffect, useState} from 'react';
 import Card from '@mui/material/Card';
 import Image from 'next/image';
 
-const ShowDataVisualization: FC<{dataVisualization: string}> = ({dataVisualization}) => (
-    <Card>
-        <div style={{ position: 'relative', width: '100%', minHeight: '250px' }}>
-            {dataVisualization === 'Engine Temperature' && (
-                <Image
-                    alt={'Engine Temperature Visualization'}
-                    src={'/engine-temperature.png'}
-                    fill
-                    style={{ objectFit: 'cover' }}
-                />
-            )}
-            {dataVisualization === 'Oil Pressure' && (
-                <Image
-                    alt={'Oil Pressure Visualization'}
-                    src={'/oil-pressure.png'}
-                    fill
-                    style={{ objectFit: 'cover' }}
-                />
-            )}
-            {dataVisualization === 'Engine Vibration' && (
-                <Image
-                    alt={'Engine Vibration Visualization'}
-                    src={'/engine-vibration.png'}
-                    fill
-                    style={{ objectFit: 'cover' }}
-                />
-            )}
-            {dataVisualization === 'Hydraulic Pressure' && (
-                <Image
-                    alt={'Hydraulic Pressure Visualization'}
-                    src={'/hydraulic-pressure.png'}
-                    fill
-                    style={{ objectFit: 'cover' }}
-                />
-            )}
-            {dataVisualization === 'Battery Voltage' && (
-                <Image
-                    alt={'Battery Voltage Visualization'}
-                    src={'/battery-voltage.png'}
-                    fill
-                    style={{ objectFit: 'cover' }}
-                />
-            )}
-        </div>
-    </Card>
-);
+// Sensor charted for each Data Visualization option, and the picture shown when the backend is not available
+const SENSORS: Record<string, {sensor: string; fallback: string}> = {
+    'Engine Temperature': {sensor: 'engine_temp_c', fallback: '/engine-temperature.png'},
+    'Oil Pressure': {sensor: 'oil_pressure_psi', fallback: '/oil-pressure.png'},
+    'Engine Vibration': {sensor: 'engine_vibration_g', fallback: '/engine-vibration.png'},
+    'Hydraulic Pressure': {sensor: 'hydraulic_pressure_psi', fallback: '/hydraulic-pressure.png'},
+    'Battery Voltage': {sensor: 'battery_voltage_v', fallback: '/battery-voltage.png'},
+};
+
+// The backend downsamples every series to this many points, so the chart costs the same for any history length
+const CHART_POINTS = 500;
+const WIDTH = 600;
+const HEIGHT = 250;
+const PADDING = 24;
+
+interface Series {
+    timestamps: number[];
+    values: number[];
+}
+
+const ShowDataVisualization: FC<{dataVisualization: string; sampleId?: string}> = ({dataVisualization, sampleId}) => {
+    const [series, setSeries] = useState<Series | null>(null);
+    const [failed, setFailed] = useState<boolean>(false);
+    const option = SENSORS[dataVisualization];
+
+    useEffect(() => {
+        if (!option) {
+            return;
+        }
+        setSeries(null);
+        setFailed(false);
+        const params = new URLSearchParams({sensors: option.sensor, points: String(CHART_POINTS)});
+        if (sampleId) {
+            params.set('sample_id', sampleId);
+        }
+        fetch(`http://localhost:5000/series?${params}`)
+            .then((response) => {
+                if (!response.ok) {
+                    throw new Error(`Series request failed: ${response.status}`);
+                }
+                return response.json();
+            })
+            .then((data) => setSeries(data.series[option.sensor]))
+            .catch((error) => {
+                console.error('Error loading series:', error);
+                setFailed(true);
+            });
+    }, [option, sampleId]);
+
+    if (!option) {
+        return null;
+    }
+
+    if (failed || (series && series.values.length < 2)) {
+        return (
+            <Card>
+                <div style={{ position: 'relative', width: '100%', minHeight: '250px' }}>
+                    <Image
+                        alt={`${dataVisualization} Visualization`}
+                        src={option.fallback}
+                        fill
+                        style={{ objectFit: 'cover' }}
+                    />
+                </div>
+            </Card>
+        );
+    }
+
+    let path = '';
+    if (series) {
+        const minTime = series.timestamps[0];
+        const timeSpan = series.timestamps[series.timestamps.length - 1] - minTime || 1;
+        const minValue = Math.min(...series.values);
+        const valueSpan = Math.max(...series.values) - minValue || 1;
+        path = series.values.map((value, i) => {
+            const x = PADDING + ((series.timestamps[i] - minTime) / timeSpan) * (WIDTH - 2 * PADDING);
+            const y = HEIGHT - PADDING - ((value - minValue) / valueSpan) * (HEIGHT - 2 * PADDING);
+            return `${i === 0 ? 'M' : 'L'}${x.toFixed(1)},${y.toFixed(1)}`;
+        }).join(' ');
+    }
+
+    return (
+        <Card>
+            <svg viewBox={`0 0 ${WIDTH} ${HEIGHT}`} style={{ width: '100%', minHeight: '250px' }}>
+                <title>{`${dataVisualization} Visualization`}</title>
+                {series && <path d={path} fill="none" stroke="#367c2b" strokeWidth={1.5} />}
+            </svg>
+        </Card>
+    );
+};
 
 export default ShowDataVisualization;
@@ -17,6 +17,8 @@ import ShowDataVisualization from '@/components/ShowDataVisualization';
 interface PredictionResult {
     hours_until_failure: number;
     component?: string;
+    priority?: string;
+    confidence?: number | null;
 }
 
 const Home: FC = () => {
@@ -55,7 +57,8 @@ const Home: FC = () => {
                     headers: {
                         'Content-Type': 'application/json',
                     },
-                    body: JSON.stringify(sampleData),
+                    // The backend routes the request to the selected product line's model when it has one
+                    body: JSON.stringify({...sampleData, product_line: modelSelected}),
                 });
 
                 if (!response.ok) {
@@ -65,7 +68,9 @@ const Home: FC = () => {
                 const result: PredictionResult = await response.json();
                 setHour(result.hours_until_failure);
 
-                if(result.hours_until_failure < 200) {
+                if (result.priority) {
+                    setPriority(result.priority);
+                } else if(result.hours_until_failure < 200) {
                     setPriority('High');
                 } else if (result.hours_until_failure < 1000) {
                     setPriority('Medium');
@@ -49,6 +49,19 @@ TELEMETRY_PARAMS = {
     "ambient_temp_c": {"normal_range": (10, 30), "daily_std_dev": 3, "failure_drift_factor": 0, "failure_component": None}, # No direct failure link
 }
 
+# Column of the monthly schema (SENSOR_BASELINES in generate_synthetic_data.py) each daily sensor is reported as;
+# the other daily sensors have no monthly counterpart. vibration_level_g stays unmapped: it is the vibration of
+# the processing/cleaning system (see its failure_component), not the engine vibration of engine_vibration_g.
+MONTHLY_SENSOR_COLUMNS = {
+    "engine_coolant_temp_c": "coolant_temp_c",
+    "engine_oil_pressure_psi": "oil_pressure_psi",
+    "hydraulic_fluid_temp_c": "hydraulic_fluid_temp_c",
+    "hydraulic_pressure_psi": "hydraulic_pressure_psi",
+    "electrical_voltage_v": "battery_voltage_v",
+    "fuel_pressure_psi": "fuel_pressure_psi",
+    "ambient_temp_c": "ambient_temp_c",
+}
+
 # Seasonal Profiles
 SEASONAL_PROFILES = {
     1: {"avg_hours": 2, "temp_shift": -10},
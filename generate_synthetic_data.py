@@ -32,40 +32,41 @@ MONTHLY_OPERATING_PROFILE = {
     12: {'operating_days_range': (5, 15), 'daily_hours_range': (3, 7), 'primary_mode': 'Tillage/Transport/Idle'} # Dec: Medium-Low, late tillage, transport, winter prep
 }
 
-def get_simulated_weather(date, location_lat=40.11, location_lon=-88.21):
+def get_simulated_weather(date, location_lat=40.11, location_lon=-88.21, rng=random):
     """
     Simulates realistic weather data for Champaign, IL based on the month.
     This function provides a simplified, rule-based weather simulation.
+    `rng` can be any object with the `random` module interface (e.g. a seeded random.Random).
     """
     month = date.month
     # Simple seasonal variations Midwest
     if month in [12, 1, 2]: # Winter
-        ambient_temp = random.uniform(-10, 5) # C
-        humidity = random.uniform(70, 90)
-        precipitation = random.uniform(0, 10) if random.random() < 0.5 else 0 # 50% chance of snow/rain
-        wind_speed = random.uniform(10, 30)
+        ambient_temp = rng.uniform(-10, 5) # C
+        humidity = rng.uniform(70, 90)
+        precipitation = rng.uniform(0, 10) if rng.random() < 0.5 else 0 # 50% chance of snow/rain
+        wind_speed = rng.uniform(10, 30)
     elif month in [3, 4, 5]: # Spring
-        ambient_temp = random.uniform(5, 20)
-        humidity = random.uniform(60, 80)
-        precipitation = random.uniform(0, 5) if random.random() < 0.6 else 0 # Higher chance of rain
-        wind_speed = random.uniform(15, 25)
+        ambient_temp = rng.uniform(5, 20)
+        humidity = rng.uniform(60, 80)
+        precipitation = rng.uniform(0, 5) if rng.random() < 0.6 else 0 # Higher chance of rain
+        wind_speed = rng.uniform(15, 25)
     elif month in [6, 7, 8]: # Summer
-        ambient_temp = random.uniform(20, 35)
-        humidity = random.uniform(50, 75)
-        precipitation = random.uniform(0, 3) if random.random() < 0.3 else 0 # Lower chance of rain
-        wind_speed = random.uniform(5, 20)
+        ambient_temp = rng.uniform(20, 35)
+        humidity = rng.uniform(50, 75)
+        precipitation = rng.uniform(0, 3) if rng.random() < 0.3 else 0 # Lower chance of rain
+        wind_speed = rng.uniform(5, 20)
     else: # Autumn (9, 10, 11)
-        ambient_temp = random.uniform(10, 25)
-        humidity = random.uniform(60, 85)
-        precipitation = random.uniform(0, 5) if random.random() < 0.4 else 0
-        wind_speed = random.uniform(10, 25)
+        ambient_temp = rng.uniform(10, 25)
+        humidity = rng.uniform(60, 85)
+        precipitation = rng.uniform(0, 5) if rng.random() < 0.4 else 0
+        wind_speed = rng.uniform(10, 25)
 
     return {
         "ambient_temp_c": round(ambient_temp, 1),
         "humidity_percent": round(humidity, 0),
         "precipitation_mm_24hr": round(precipitation, 1),
         "wind_speed_kph": round(wind_speed, 1),
-        "wind_direction": random.choice(["N", "NE", "E", "SE", "S", "SW", "W", "NW"])
+        "wind_direction": rng.choice(["N", "NE", "E", "SE", "S", "SW", "W", "NW"])
     }
 
 BASE_OUTPUT_DIR = 'actual_data_csv'
@@ -158,29 +159,55 @@ FAILURE_WINDOW_HOURS = 500 # The number of hours before the predicted failure wh
 FAILURE_MAGNITUDE_FACTOR = 0.25 # The maximum percentage change a sensor value will deviate from its baseline at the exact point of failure.
 NOISE_FACTOR = 0.05 # The percentage of a sensor's range used for random noise in its readings.
 
-os.makedirs(BASE_OUTPUT_DIR, exist_ok=True)
-print(f"Base folder '{BASE_OUTPUT_DIR}' ensured to exist.")
+# Column dtypes of one monthly record. Keeping these explicit means in-memory frames match what
+# `pd.read_csv` infers from the CSV files, without the text round-trip.
+SAMPLE_DTYPES = {
+    'sample_id': 'int64',
+    'date': 'object',
+    'month': 'int64',
+    'year': 'int64',
+    'cumulative_hours': 'float64',
+    'monthly_operating_hours': 'float64',
+    'ambient_temp_c': 'float64',
+    'humidity_percent': 'float64',
+    'precipitation_mm_24hr': 'float64',
+    'wind_speed_kph': 'float64',
+    'driver_experience_years': 'int64',
+    'was_regular_maintenance_followed': 'int64',
+    **{sensor: 'float64' for sensor in SENSOR_BASELINES},
+    'failure_imminent': 'int64',
+    'failure_occurred': 'int64',
+    'type_of_failure': 'int64',
+    'remaining_useful_life_hours': 'float64'
+}
+
+SUPPORTED_OUTPUT_FORMATS = ('csv', 'parquet')
 
-# Iterates through to create sample data
-for i in range(NUM_SAMPLES):
+
+def simulate_sample(sample_id, failure_hours_for_sample, type_of_failure=None, num_months=NUM_MONTHS,
+                    start_date=START_DATE, rng=random, verbose=True):
+    """
+    Simulates one tractor month by month until its failure (or `num_months`) and returns the monthly records.
+    `rng` can be any object with the `random` module interface (e.g. a seeded random.Random).
+    """
     current_hours_cumulative = 0.0
     # Randomly select failure type
-    type_of_failure = random.choice(list(TYPES_OF_FAILURES.keys()))
-    # Get failure hour threshold
-    failure_hours_for_sample = TRACTOR_FAILURE_HOURS[i]
-    print(f"Sample {i}: Failure type '{type_of_failure}' expected at {failure_hours_for_sample} hours.")
+    if type_of_failure is None:
+        type_of_failure = rng.choice(list(TYPES_OF_FAILURES.keys()))
+    if verbose:
+        print(f"Sample {sample_id}: Failure type '{type_of_failure}' expected at {failure_hours_for_sample} hours.")
 
     sample_data_rows = []
     failure_occurred_this_sample = False
 
     # Simulate data month by month until the total simulation duration or failure occurs
-    for month_offset in range(NUM_MONTHS):
-        current_date = START_DATE + timedelta(days=month_offset * 30) # Approximate month progression
+    for month_offset in range(num_months):
+        current_date = start_date + timedelta(days=month_offset * 30) # Approximate month progression
         month_profile = MONTHLY_OPERATING_PROFILE[current_date.month]
 
         # Calculate monthly operating hours based on the seasonal profile
-        operating_days = random.randint(*month_profile['operating_days_range'])
-        daily_hours = random.uniform(*month_profile['daily_hours_range'])
+        operating_days = rng.randint(*month_profile['operating_days_range'])
+        daily_hours = rng.uniform(*month_profile['daily_hours_range'])
         monthly_operating_hours = operating_days * daily_hours
 
         # Update the cumulative operating hours for the tractor
@@ -200,24 +227,26 @@ for i in range(NUM_SAMPLES):
             failure_occurred_this_sample = True
             # For the last data point, set cumulative hours exactly to the failure point
             current_hours_cumulative = failure_hours_for_sample
-            print(f"Sample {i}: Failure occurred at {current_hours_cumulative:.2f} hours in month {month_offset+1}.")
+            if verbose:
+                print(f"Sample {sample_id}: Failure occurred at {current_hours_cumulative:.2f} hours in month {month_offset+1}.")
         # Check if the tractor is within the failure prediction window
         elif (failure_hours_for_sample - current_hours_cumulative) <= FAILURE_WINDOW_HOURS:
             failure_imminent = 1
-            print(f"Sample {i}: Failure imminent (within {FAILURE_WINDOW_HOURS} hours) in month {month_offset+1}.")
+            if verbose:
+                print(f"Sample {sample_id}: Failure imminent (within {FAILURE_WINDOW_HOURS} hours) in month {month_offset+1}.")
 
         # Simulate weather data for the current month
-        weather_data = get_simulated_weather(current_date)
+        weather_data = get_simulated_weather(current_date, rng=rng)
 
         # Simulate sensor data, applying failure trends if applicable
         sensor_data = {}
         for sensor, (min_val, max_val) in SENSOR_BASELINES.items():
             # Base value for the sensor
-            base_value = random.uniform(min_val, max_val)
+            base_value = rng.uniform(min_val, max_val)
             # Range for random noise
             noise_range = (max_val - min_val) * NOISE_FACTOR
             # Add initial noise
-            final_value = base_value + random.uniform(-noise_range, noise_range)
+            final_value = base_value + rng.uniform(-noise_range, noise_range)
 
             # Apply failure trend if failure is imminent and this sensor is affected by the chosen failure type
             if failure_imminent == 1 and sensor in FAILURE_TRENDS.get(type_of_failure, {}):
@@ -235,7 +264,7 @@ for i in range(NUM_SAMPLES):
 
                 # If the sensor value should increase
                 if trend_direction == '+':
-                    final_value = base_value + trend_amount + random.uniform(-noise_range/2, noise_range/2)
+                    final_value = base_value + trend_amount + rng.uniform(-noise_range/2, noise_range/2)
                     # For fuel efficiency, higher is worse, so allow it to go above max_val
                     if 'efficiency' in sensor:
                         # Cap at a reasonable upper bound
@@ -244,7 +273,7 @@ for i in range(NUM_SAMPLES):
                         # For other increasing metrics (temps, vibrations), ensure it's above base
                         final_value = max(final_value, base_value)
                 elif trend_direction == '-':
-                    final_value = base_value - trend_amount + random.uniform(-noise_range/2, noise_range/2)
+                    final_value = base_value - trend_amount + rng.uniform(-noise_range/2, noise_range/2)
                     # Ensure value doesn't drop below a reasonable lower bound
                     # Allow some undershoot for failure
                     final_value = max(final_value, min_val * 0.5)
@@ -253,14 +282,14 @@ for i in range(NUM_SAMPLES):
             sensor_data[sensor] = round(final_value, 2)
 
         # Simulate driver experience (constant for the simulation, could be dynamic)
-        driver_experience_years = random.randint(1, 30)
+        driver_experience_years = rng.randint(1, 30)
 
         # Simulate maintenance adherence (90% chance of being followed)
-        was_regular_maintenance_followed = 1 if random.random() < 0.9 else 0
+        was_regular_maintenance_followed = 1 if rng.random() < 0.9 else 0
 
         # Combine all generated data for the current month into a single record
         monthly_record = {
-            'sample_id': i,
+            'sample_id': sample_id,
             'date': current_date.strftime('%Y-%m-%d'),
             'month': current_date.month,
             'year': current_date.year,
@@ -284,10 +313,87 @@ for i in range(NUM_SAMPLES):
         if failure_occurred_this_sample:
             break
 
-    # Convert the list of monthly records into a pandas DataFrame and save to a CSV file
-    df = pd.DataFrame(sample_data_rows)
-    output_csv_path = os.path.join(BASE_OUTPUT_DIR, f'sample_{i}_data.csv')
-    df.to_csv(output_csv_path, index=False)
-    print(f"Data for sample {i} saved to {output_csv_path}")
+    return sample_data_rows
+
+
+def records_to_dataframe(records):
+    """Builds a typed DataFrame (see SAMPLE_DTYPES) from monthly records."""
+    return pd.DataFrame.from_records(records, columns=list(SAMPLE_DTYPES)).astype(SAMPLE_DTYPES)
+
+
+def dataframe_to_arrays(df):
+    """Returns a dict of column name -> numpy array, with `date` as datetime64[D]."""
+    arrays = {col: df[col].to_numpy() for col in df.columns}
+    if 'date' in arrays:
+        arrays['date'] = arrays['date'].astype('datetime64[D]')
+    return arrays
+
+
+def generate_fleet(num_samples, seed=None, batch_size=None, as_arrays=False, start_id=0,
+                   failure_hours_range=(5000, 10000), num_months=NUM_MONTHS, start_date=START_DATE, verbose=False):
+    """
+    Generates synthetic tractors in memory, yielding one DataFrame per tractor or, with `batch_size`,
+    one DataFrame per `batch_size` tractors. With `as_arrays=True` each item is a dict of numpy arrays instead.
+
+    With a `seed`, each tractor gets its own random.Random seeded from (seed, sample_id), so the data
+    for a given tractor is the same no matter the batch size or which process generates it.
+    Without a seed the module-level `random` state is used, like the script does.
+    """
+    batch_records = []
+    batch_count = 0
+    for sample_id in range(start_id, start_id + num_samples):
+        rng = random.Random(f"synthetic_{seed}_{sample_id}") if seed is not None else random
+        failure_hours_for_sample = rng.randint(*failure_hours_range)
+        batch_records.extend(simulate_sample(
+            sample_id, failure_hours_for_sample, num_months=num_months,
+            start_date=start_date, rng=rng, verbose=verbose
+        ))
+        batch_count += 1
+
+        if batch_size is None or batch_count >= batch_size:
+            df = records_to_dataframe(batch_records)
+            yield dataframe_to_arrays(df) if as_arrays else df
+            batch_records = []
+            batch_count = 0
+
+    if batch_records:
+        df = records_to_dataframe(batch_records)
+        yield dataframe_to_arrays(df) if as_arrays else df
+
+
+def write_fleet(frames, output_dir=BASE_OUTPUT_DIR, file_format='csv', verbose=True):
+    """
+    Optional disk sink for `generate_fleet` output: writes one `sample_<id>_data.<ext>` file per tractor.
+    `file_format` is 'csv' or 'parquet' (binary columnar, needs pyarrow or fastparquet installed).
+    Returns the list of written paths.
+    """
+    if file_format not in SUPPORTED_OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output format '{file_format}'. Use one of {SUPPORTED_OUTPUT_FORMATS}.")
+
+    os.makedirs(output_dir, exist_ok=True)
+    written_paths = []
+    for frame in frames:
+        for sample_id, df in frame.groupby('sample_id', sort=False):
+            output_path = os.path.join(output_dir, f'sample_{sample_id}_data.{file_format}')
+            if file_format == 'csv':
+                df.to_csv(output_path, index=False)
+            else:
+                df.to_parquet(output_path, index=False)
+            written_paths.append(output_path)
+            if verbose:
+                print(f"Data for sample {sample_id} saved to {output_path}")
+    return written_paths
+
+
+if __name__ == "__main__":
+    os.makedirs(BASE_OUTPUT_DIR, exist_ok=True)
+    print(f"Base folder '{BASE_OUTPUT_DIR}' ensured to exist.")
+
+    # Iterates through to create sample data
+    for i in range(NUM_SAMPLES):
+        sample_data_rows = simulate_sample(i, TRACTOR_FAILURE_HOURS[i])
+
+        # Convert the list of monthly records into a pandas DataFrame and save to a CSV file
+        write_fleet([records_to_dataframe(sample_data_rows)], BASE_OUTPUT_DIR, file_format='csv')
 
-print("\nSimulation complete. Check the 'validation_data_csv' directory for generated data.")
+    print("\nSimulation complete. Check the 'validation_data_csv' directory for generated data.")
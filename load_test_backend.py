@@ -0,0 +1,287 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from generate_synthetic_data import generate_fleet
+
+# Replays synthetic fleet telemetry against the prediction backend and reports throughput, latency
+# percentiles, error rates and the request rate at which the backend saturates.
+#
+# Requests are issued open-loop: each one is scheduled at a fixed time for the target rate and its latency
+# is measured from that scheduled time, so queueing inside the client counts against the backend instead of
+# silently lowering the offered load.
+
+REPO_ROOT = os.path.dirname(os.path.abspath(__file__))
+BACKEND_PATH = os.path.join(REPO_ROOT, 'backend', 'backend.py')
+
+DEFAULT_PORT = 5055
+DEFAULT_RATES = [2, 5, 10, 20]
+DEFAULT_DURATION_SECONDS = 20
+DEFAULT_CONCURRENCY = 8
+DEFAULT_TRACTORS = 50
+DEFAULT_BATCH_SIZE = 10
+DEFAULT_MIX = {'predict': 0.5, 'predict_batch': 0.1, 'explain': 0.1, 'telemetry': 0.3}
+
+# Every other replayed tractor is sent under a string sample_id (e.g. 'T0007') instead of its integer one,
+# since clients key tractors by serial numbers as often as by integers
+STRING_ID_FORMAT = 'T{:04d}'
+
+# Months of history appended for every tractor before the replay starts; /predict needs 20 to have features
+WARM_HISTORY_MONTHS = 24
+
+# A rate counts as saturated when any of these is exceeded
+SATURATION_MIN_THROUGHPUT_RATIO = 0.9
+SATURATION_MAX_ERROR_RATE = 0.01
+DEFAULT_P99_SLO_MS = 2000.0
+
+REQUEST_TIMEOUT_SECONDS = 30
+
+
+def _post_json(url, payload, timeout=REQUEST_TIMEOUT_SECONDS):
+    data = json.dumps(payload).encode('utf-8')
+    request = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'}, method='POST')
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
+        return response.status
+
+
+def start_backend(port, model_path, history_csv_path=None):
+    """Starts backend/backend.py in a subprocess (debug off, threaded) and waits until it accepts requests."""
+    env = dict(os.environ, PORT=str(port), RUL_DEBUG='0', RUL_MODEL_PATH=model_path)
+    if history_csv_path:
+        env['RUL_HISTORY_CSV'] = history_csv_path
+    process = subprocess.Popen(
+        [sys.executable, BACKEND_PATH], env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Backend exited with code {process.returncode} during startup")
+        try:
+            _post_json(f'{base_url}/telemetry', {}, timeout=1)
+        except urllib.error.HTTPError:
+            # 400 for the empty payload means the server is up
+            return process, base_url
+        except (urllib.error.URLError, ConnectionError, OSError):
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError("Backend did not start within 60 seconds")
+
+
+class FleetReplay:
+    """Synthetic tractors whose monthly records are appended to the backend one month at a time."""
+
+    def __init__(self, num_tractors, seed):
+        fleet_df = next(generate_fleet(num_tractors, seed=seed, batch_size=num_tractors))
+        # JSON-friendly records per tractor, in time order
+        self.histories = {
+            (STRING_ID_FORMAT.format(sample_id) if sample_id % 2 else int(sample_id)):
+                json.loads(group.drop(columns=['sample_id']).to_json(orient='records'))
+            for sample_id, group in fleet_df.groupby('sample_id', sort=True)
+        }
+        self.cursors = {sample_id: 0 for sample_id in self.histories}
+        self.lock = threading.Lock()
+        self.rng = random.Random(seed)
+
+    def warm_up(self, base_url, months=WARM_HISTORY_MONTHS):
+        for sample_id, records in self.histories.items():
+            _post_json(f'{base_url}/telemetry', {'sample_id': sample_id, 'records': records[:months]})
+            self.cursors[sample_id] = min(months, len(records))
+
+    def next_request(self, mix, batch_size):
+        """Picks the next operation according to `mix` and returns (op, path, payload)."""
+        with self.lock:
+            op = self.rng.choices(list(mix), weights=list(mix.values()))[0]
+            sample_ids = list(self.histories)
+            if op == 'telemetry':
+                # Tractors that reached the end of their simulated life loop back to their start
+                sample_id = self.rng.choice(sample_ids)
+                records = self.histories[sample_id]
+                record = records[self.cursors[sample_id] % len(records)]
+                self.cursors[sample_id] += 1
+                return op, '/telemetry', {'sample_id': sample_id, 'records': [record]}
+            if op in ('predict_batch', 'explain'):
+                chosen = self.rng.sample(sample_ids, min(batch_size, len(sample_ids)))
+                return op, f'/{op}', {'sample_ids': chosen}
+            return op, '/predict', {'sample_id': self.rng.choice(sample_ids)}
+
+
+def _summarize(samples, duration_seconds):
+    """samples: list of (op, latency_seconds, service_seconds, ok)."""
+    def stats(subset):
+        if not subset:
+            return {'requests': 0}
+        latencies_ms = np.array([s[1] for s in subset]) * 1000
+        service_ms = np.array([s[2] for s in subset]) * 1000
+        errors = sum(1 for s in subset if not s[3])
+        return {
+            'requests': len(subset),
+            'errors': errors,
+            'error_rate': errors / len(subset),
+            'throughput_rps': len(subset) / duration_seconds,
+            'p50_ms': float(np.percentile(latencies_ms, 50)),
+            'p95_ms': float(np.percentile(latencies_ms, 95)),
+            'p99_ms': float(np.percentile(latencies_ms, 99)),
+            'max_ms': float(latencies_ms.max()),
+            'service_p50_ms': float(np.percentile(service_ms, 50))
+        }
+
+    summary = {'all': stats(samples)}
+    for op in sorted({s[0] for s in samples}):
+        summary[op] = stats([s for s in samples if s[0] == op])
+    return summary
+
+
+def run_load_step(base_url, replay, rate, duration_seconds, concurrency, mix, batch_size):
+    """Offers `rate` requests/second for `duration_seconds` with at most `concurrency` in flight."""
+    samples = []
+    samples_lock = threading.Lock()
+
+    def send(op, path, payload, scheduled_at):
+        started_at = time.perf_counter()
+        ok = True
+        try:
+            _post_json(f'{base_url}{path}', payload)
+        except (urllib.error.URLError, ConnectionError, OSError):
+            ok = False
+        finished_at = time.perf_counter()
+        with samples_lock:
+            samples.append((op, finished_at - scheduled_at, finished_at - started_at, ok))
+
+    interval = 1.0 / rate
+    total_requests = int(rate * duration_seconds)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for i in range(total_requests):
+            scheduled_at = start + i * interval
+            delay = scheduled_at - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            op, path, payload = replay.next_request(mix, batch_size)
+            executor.submit(send, op, path, payload, scheduled_at)
+    elapsed = time.perf_counter() - start
+
+    summary = _summarize(samples, elapsed)
+    summary['offered_rps'] = rate
+    summary['elapsed_seconds'] = elapsed
+    return summary
+
+
+def is_saturated(step, p99_slo_ms):
+    overall = step['all']
+    if overall['requests'] == 0:
+        return True
+    return (
+        overall['throughput_rps'] < SATURATION_MIN_THROUGHPUT_RATIO * step['offered_rps']
+        or overall['error_rate'] > SATURATION_MAX_ERROR_RATE
+        or overall['p99_ms'] > p99_slo_ms
+    )
+
+
+def run_load_test(base_url, rates=DEFAULT_RATES, duration_seconds=DEFAULT_DURATION_SECONDS,
+                  concurrency=DEFAULT_CONCURRENCY, num_tractors=DEFAULT_TRACTORS, mix=DEFAULT_MIX,
+                  batch_size=DEFAULT_BATCH_SIZE, p99_slo_ms=DEFAULT_P99_SLO_MS, seed=42, stop_at_saturation=True):
+    """Runs one load step per rate (ascending) and reports each step plus the first saturated rate."""
+    replay = FleetReplay(num_tractors, seed)
+    print(f"Appending {WARM_HISTORY_MONTHS} months of history for {num_tractors} tractors...")
+    replay.warm_up(base_url)
+
+    steps = []
+    saturation_rps = None
+    for rate in sorted(rates):
+        print(f"\nOffering {rate} req/s for {duration_seconds} s (concurrency {concurrency})...")
+        step = run_load_step(base_url, replay, rate, duration_seconds, concurrency, mix, batch_size)
+        steps.append(step)
+        overall = step['all']
+        print(f"  achieved {overall['throughput_rps']:.1f} req/s, errors {overall['error_rate']:.1%}, "
+              f"p50 {overall['p50_ms']:.0f} ms, p95 {overall['p95_ms']:.0f} ms, p99 {overall['p99_ms']:.0f} ms")
+        for op in mix:
+            if op in step and step[op]['requests']:
+                print(f"    {op:<14} {step[op]['requests']:>5} req, p50 {step[op]['p50_ms']:.0f} ms, "
+                      f"p99 {step[op]['p99_ms']:.0f} ms, errors {step[op]['errors']}")
+        if is_saturated(step, p99_slo_ms):
+            saturation_rps = rate
+            print(f"  Saturated at {rate} req/s.")
+            if stop_at_saturation:
+                break
+
+    return {
+        'base_url': base_url,
+        'config': {
+            'rates': sorted(rates), 'duration_seconds': duration_seconds, 'concurrency': concurrency,
+            'tractors': num_tractors, 'mix': mix, 'batch_size': batch_size, 'p99_slo_ms': p99_slo_ms,
+            'seed': seed
+        },
+        'steps': steps,
+        'saturation_rps': saturation_rps,
+        'max_sustained_rps': max(
+            (s['offered_rps'] for s in steps if not is_saturated(s, p99_slo_ms)), default=None
+        )
+    }
+
+
+def _parse_mix(text):
+    mix = {}
+    for item in text.split(','):
+        op, weight = item.split('=')
+        if op not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"Unknown operation '{op}'; use {list(DEFAULT_MIX)}")
+        mix[op] = float(weight)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay synthetic fleet traffic against the prediction backend.")
+    parser.add_argument('--url', default=None, help="Backend to target; by default one is started locally.")
+    parser.add_argument('--model', default=os.path.join(REPO_ROOT, 'mae_403.joblib'),
+                        help="Model for the locally started backend.")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="Port for the locally started backend.")
+    parser.add_argument('--rates', default=','.join(str(r) for r in DEFAULT_RATES),
+                        help="Comma-separated offered request rates (req/s), tried in ascending order.")
+    parser.add_argument('--duration', type=float, default=DEFAULT_DURATION_SECONDS, help="Seconds per rate.")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY, help="Maximum requests in flight.")
+    parser.add_argument('--tractors', type=int, default=DEFAULT_TRACTORS, help="Synthetic tractors replayed.")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help="Tractors per /predict_batch.")
+    parser.add_argument('--mix', type=_parse_mix, default=DEFAULT_MIX,
+                        help="Operation weights, e.g. predict=0.5,predict_batch=0.1,explain=0.1,telemetry=0.3")
+    parser.add_argument('--p99-slo-ms', type=float, default=DEFAULT_P99_SLO_MS,
+                        help="p99 latency above which a rate counts as saturated.")
+    parser.add_argument('--no-stop', action='store_true', help="Keep going after the first saturated rate.")
+    parser.add_argument('--seed', type=int, default=42, help="Seed of the replayed fleet and request mix.")
+    parser.add_argument('--report', default='load_test_report.json', help="Where to write the JSON report.")
+    args = parser.parse_args(argv)
+
+    process = None
+    base_url = args.url
+    if base_url is None:
+        print(f"Starting backend on port {args.port} with model {args.model}...")
+        process, base_url = start_backend(args.port, args.model)
+    try:
+        report = run_load_test(
+            base_url, [float(r) for r in args.rates.split(',') if r], args.duration, args.concurrency,
+            args.tractors, args.mix, args.batch_size, args.p99_slo_ms, args.seed, not args.no_stop
+        )
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    print(f"\nMax sustained rate: {report['max_sustained_rps']} req/s; saturated at: {report['saturation_rps']} req/s")
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.report}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,23 +1,124 @@
 import joblib
 import pandas as pd
-from sklearn.model_selection import train_test_split, RandomizedSearchCV
+from sklearn.model_selection import train_test_split
+import xgboost
 from xgboost import XGBRegressor
 from sklearn.metrics import r2_score, mean_absolute_error, mean_squared_error
 import os
+import re
+import json
+import time
+import inspect
+import argparse
+import contextlib
 import numpy as np
 
+from training_checkpoints import CheckpointStore, fingerprint, files_fingerprint, run_resumable_search
+from drift_monitor import SensorSketches, drift_reference_path
+from training_scheduler import FitScheduler, print_utilization
+
 training_folder_path = 'training_data_csv'
 validation_folder_path = 'validation_data_csv'
-
-def preprocess_and_engineer_features(df, columns_to_drop, lags=3, rolling_windows=[5, 10, 20], diff_periods=[1, 3], ewma_spans=[10, 20]):
-    processed_df = df.copy()
+MODEL_FILENAME = 'mae_403.joblib'
+CHECKPOINT_DIR = 'training_checkpoints'
+
+# Stages of the training pipeline; each one is checkpointed (see training_checkpoints.py and run_training_pipeline)
+PIPELINE_STAGES = ['ingest', 'features', 'validation_features', 'split', 'search', 'quantiles', 'evaluate',
+                   'sensor_sketches', 'export']
+STAGE_INPUTS = {
+    'ingest': [],
+    'features': ['ingest'],
+    'validation_features': ['ingest'],
+    'split': ['features'],
+    'search': ['features', 'split'],
+    'quantiles': ['features', 'split', 'search'],
+    'evaluate': ['features', 'split', 'search', 'quantiles', 'validation_features'],
+    'sensor_sketches': ['ingest'],
+    'export': ['search', 'quantiles', 'sensor_sketches']
+}
+
+TEST_SIZE = 0.2
+RANDOM_STATE = 42
+
+COLUMNS_TO_DROP = [
+    'sample_id', 'date', 'type_of_failure',
+    'failure_imminent', 'failure_occurred',
+    'remaining_useful_life_hours'
+]
+
+FEATURE_PARAMS = {
+    'lags': 3,
+    'rolling_windows': [5, 10, 20],
+    'diff_periods': [1, 3],
+    'ewma_spans': [10, 20]
+}
+
+# Feature families built for every numeric column; a feature config can restrict them per column
+ROLLING_STATS = ['mean', 'std', 'min', 'max']
+FEATURE_FAMILIES = ['lag'] + [f'rolling_{stat}' for stat in ROLLING_STATS] + ['diff', 'ewma']
+FEATURE_NAME_PATTERN = re.compile(r'^(.+)_({})_\d+$'.format('|'.join(FEATURE_FAMILIES)))
+
+# RUL quantiles predicted by the interval model exported next to the fleet model (one booster, one predict call).
+# The outer two bound a 90% prediction interval, which is recalibrated on the held-out test split so that it
+# covers 90% of it (conformalized quantile regression).
+QUANTILES = [0.05, 0.25, 0.5, 0.75, 0.95]
+
+PARAM_DIST = {
+    'n_estimators': [200, 400, 600, 800, 1000, 1200],
+    'learning_rate': [0.01, 0.03, 0.05, 0.1, 0.15],
+    'max_depth': [5, 6, 7, 8, 9, 10],
+    'subsample': [0.7, 0.8, 0.9, 1.0],
+    'colsample_bytree': [0.7, 0.8, 0.9, 1.0],
+    'gamma': [0, 0.1, 0.2, 0.3],
+    'reg_alpha': [0, 0.001, 0.005, 0.01, 0.05],
+    'reg_lambda': [1, 0.5, 0.1, 0.05],
+    'min_child_weight': [1, 3, 5, 7]
+}
+
+# Compact mode: float32 sensors and engineered features, small integers for calendar fields, flags and codes.
+# Halves the memory of the feature matrix and hands XGBoost float32 data, which it would otherwise convert.
+COMPACT_INTEGER_DTYPES = {
+    'sample_id': 'int32',
+    'month': 'int8',
+    'year': 'int16',
+    'driver_experience_years': 'int8',
+    'was_regular_maintenance_followed': 'int8',
+    'failure_imminent': 'int8',
+    'failure_occurred': 'int8',
+    'type_of_failure': 'int8'
+}
+COMPACT_FLOAT_DTYPE = np.float32
+
+
+def to_compact_dtypes(df):
+    """Copy of `df` with float columns as float32 and COMPACT_INTEGER_DTYPES applied to complete integer columns."""
+    dtypes = {}
+    for col in df.columns:
+        if col in COMPACT_INTEGER_DTYPES and pd.api.types.is_numeric_dtype(df[col]):
+            # Columns with gaps (e.g. type_of_failure of healthy tractors in aggregated logs) cannot be integers
+            dtypes[col] = COMPACT_INTEGER_DTYPES[col] if not df[col].isna().any() else COMPACT_FLOAT_DTYPE
+        elif pd.api.types.is_float_dtype(df[col]):
+            dtypes[col] = COMPACT_FLOAT_DTYPE
+    return df.astype(dtypes)
+
+
+def engineer_time_series_features(df, lags=3, rolling_windows=[5, 10, 20], diff_periods=[1, 3], ewma_spans=[10, 20],
+                                  compact=False, families=None, timings=None):
+    """
+    Adds lag, rolling, diff and EWMA features per sample_id; first half of preprocess_and_engineer_features.
+    With `compact`, inputs are converted by to_compact_dtypes and every feature is stored as float32.
+    `families` ({column: [family, ...]}, see FEATURE_FAMILIES) restricts which features are built; raw columns
+    are always kept. A `timings` dict is filled with the seconds spent on each 'column:family'.
+    """
+    processed_df = to_compact_dtypes(df) if compact else df.copy()
 
     if 'sample_id' not in processed_df.columns:
         print("Warning: 'sample_id' column not found. Time-series features will be applied globally, not per sample.")
         temp_sample_id_present = False
     else:
         temp_sample_id_present = True
-        processed_df = processed_df.sort_values(by=['sample_id']).reset_index(drop=True)
+        # Stable, so each sample keeps its chronological order (a quicksort shuffles the months of equal ids)
+        processed_df = processed_df.sort_values(by=['sample_id'], kind='stable').reset_index(drop=True)
 
     numerical_cols_for_fe = [
         col for col in processed_df.columns
@@ -27,42 +128,76 @@ def preprocess_and_engineer_features(df, columns_to_drop, lags=3, rolling_window
 
     print(f"Applying feature engineering for numerical columns: {numerical_cols_for_fe}")
 
+    def add_feature(name, values):
+        # Rolling and EWMA results come back as float64 even for float32 input
+        processed_df[name] = values.astype(COMPACT_FLOAT_DTYPE, copy=False) if compact else values
+
+    @contextlib.contextmanager
+    def family(col, kind):
+        start = time.perf_counter()
+        yield
+        if timings is not None:
+            key = f'{col}:{kind}'
+            timings[key] = timings.get(key, 0.0) + time.perf_counter() - start
+
     for col in numerical_cols_for_fe:
+        col_families = FEATURE_FAMILIES if families is None else families.get(col, [])
+
         # 1. Lagged Features
-        for i in range(1, lags + 1):
-            if temp_sample_id_present:
-                processed_df[f'{col}_lag_{i}'] = processed_df.groupby('sample_id')[col].shift(i)
-            else:
-                processed_df[f'{col}_lag_{i}'] = processed_df[col].shift(i)
+        if 'lag' in col_families:
+            with family(col, 'lag'):
+                for i in range(1, lags + 1):
+                    if temp_sample_id_present:
+                        add_feature(f'{col}_lag_{i}', processed_df.groupby('sample_id')[col].shift(i))
+                    else:
+                        add_feature(f'{col}_lag_{i}', processed_df[col].shift(i))
 
         # 2. Rolling Statistics
         for window in rolling_windows:
-            if temp_sample_id_present:
-                processed_df[f'{col}_rolling_mean_{window}'] = processed_df.groupby('sample_id')[col].rolling(window=window).mean().reset_index(level=0, drop=True)
-                processed_df[f'{col}_rolling_std_{window}'] = processed_df.groupby('sample_id')[col].rolling(window=window).std().reset_index(level=0, drop=True)
-                processed_df[f'{col}_rolling_min_{window}'] = processed_df.groupby('sample_id')[col].rolling(window=window).min().reset_index(level=0, drop=True)
-                processed_df[f'{col}_rolling_max_{window}'] = processed_df.groupby('sample_id')[col].rolling(window=window).max().reset_index(level=0, drop=True)
-            else:
-                processed_df[f'{col}_rolling_mean_{window}'] = processed_df[col].rolling(window=window).mean()
-                processed_df[f'{col}_rolling_std_{window}'] = processed_df[col].rolling(window=window).std()
-                processed_df[f'{col}_rolling_min_{window}'] = processed_df[col].rolling(window=window).min()
-                processed_df[f'{col}_rolling_max_{window}'] = processed_df[col].rolling(window=window).max()
+            for stat in ROLLING_STATS:
+                if f'rolling_{stat}' not in col_families:
+                    continue
+                with family(col, f'rolling_{stat}'):
+                    if temp_sample_id_present:
+                        rolling = processed_df.groupby('sample_id')[col].rolling(window=window)
+                        add_feature(f'{col}_rolling_{stat}_{window}', getattr(rolling, stat)().reset_index(level=0, drop=True))
+                    else:
+                        add_feature(f'{col}_rolling_{stat}_{window}', getattr(processed_df[col].rolling(window=window), stat)())
 
         # 3. Rate of Change / Derivatives
-        for period in diff_periods:
-            if temp_sample_id_present:
-                processed_df[f'{col}_diff_{period}'] = processed_df.groupby('sample_id')[col].diff(periods=period)
-            else:
-                processed_df[f'{col}_diff_{period}'] = processed_df[col].diff(periods=period)
+        if 'diff' in col_families:
+            with family(col, 'diff'):
+                for period in diff_periods:
+                    if temp_sample_id_present:
+                        add_feature(f'{col}_diff_{period}', processed_df.groupby('sample_id')[col].diff(periods=period))
+                    else:
+                        add_feature(f'{col}_diff_{period}', processed_df[col].diff(periods=period))
 
         # 4. Exponentially Weighted Moving Averages (EWMA)
-        for span in ewma_spans:
-            if temp_sample_id_present:
-                processed_df[f'{col}_ewma_{span}'] = processed_df.groupby('sample_id')[col].ewm(span=span, adjust=False).mean().reset_index(level=0, drop=True)
-            else:
-                processed_df[f'{col}_ewma_{span}'] = processed_df[col].ewm(span=span, adjust=False).mean()
-
-
+        if 'ewma' in col_families:
+            with family(col, 'ewma'):
+                for span in ewma_spans:
+                    if temp_sample_id_present:
+                        add_feature(f'{col}_ewma_{span}', processed_df.groupby('sample_id')[col].ewm(span=span, adjust=False).mean().reset_index(level=0, drop=True))
+                    else:
+                        add_feature(f'{col}_ewma_{span}', processed_df[col].ewm(span=span, adjust=False).mean())
+
+    return processed_df
+
+
+def feature_family(feature_name):
+    """(column, family) an engineered feature was built by, or (feature_name, 'raw') for input columns."""
+    match = FEATURE_NAME_PATTERN.match(feature_name)
+    if match is None:
+        return feature_name, 'raw'
+    return match.group(1), match.group(2)
+
+
+def select_features_and_target(processed_df, columns_to_drop, compact=False):
+    """
+    Splits off the target, drops non-feature columns and the NaN rows left by feature engineering.
+    With `compact`, X is returned as a single float32 block that XGBoost uses without converting it.
+    """
     # Extract the target variable before dropping it from features
     if 'remaining_useful_life_hours' in processed_df.columns:
         y = processed_df['remaining_useful_life_hours']
@@ -98,168 +233,548 @@ def preprocess_and_engineer_features(df, columns_to_drop, lags=3, rolling_window
     if X.shape[0] < initial_rows:
         print(f"Dropped {initial_rows - X.shape[0]} rows due to NaN values after advanced feature engineering and preprocessing.")
 
+    if compact:
+        X = X.astype(COMPACT_FLOAT_DTYPE, copy=False)
     return X, y
 
 
-# Initialize an empty list to store dataframes for training
-all_training_dataframes = []
+def preprocess_and_engineer_features(df, columns_to_drop, lags=3, rolling_windows=[5, 10, 20], diff_periods=[1, 3], ewma_spans=[10, 20],
+                                     compact=False, families=None):
+    processed_df = engineer_time_series_features(df, lags, rolling_windows, diff_periods, ewma_spans,
+                                                 compact=compact, families=families)
+    return select_features_and_target(processed_df, columns_to_drop, compact=compact)
 
-print(f"Loading training data from: {training_folder_path}")
-for filename in os.listdir(training_folder_path):
-    if filename.endswith('.csv'):
-        file_path = os.path.join(training_folder_path, filename)
-        try:
-            df = pd.read_csv(file_path)
-            all_training_dataframes.append(df)
-            print(f"Loaded {filename} for training.")
-        except Exception as e:
-            print(f"Error reading {filename} for training: {e}")
 
-if all_training_dataframes:
-    combined_training_df = pd.concat(all_training_dataframes, ignore_index=True)
-    print(f"Successfully combined {len(all_training_dataframes)} training CSV files.")
-    print(f"Combined Training DataFrame shape: {combined_training_df.shape}")
 
-    columns_to_drop = [
-        'sample_id', 'date', 'type_of_failure',
-        'failure_imminent', 'failure_occurred',
-        'remaining_useful_life_hours'
+def list_data_files(folder_path):
+    """Sorted .csv/.parquet files in `folder_path`, or an empty list when the folder does not exist."""
+    if not os.path.isdir(folder_path):
+        return []
+    return [
+        os.path.join(folder_path, filename) for filename in sorted(os.listdir(folder_path))
+        if filename.endswith('.csv') or filename.endswith('.parquet')
     ]
 
-    # Apply advanced preprocessing and feature engineering to training data
-    X_train_full, y_train_full = preprocess_and_engineer_features(
-        combined_training_df,
-        columns_to_drop,
-        lags=3,
-        rolling_windows=[5, 10, 20],
-        diff_periods=[1, 3],
-        ewma_spans=[10, 20]
-    )
 
-    print(f"\nFeatures (X_train_full) shape after preparation: {X_train_full.shape}")
-    print(f"Target (y_train_full) shape after preparation: {y_train_full.shape}")
+def load_data_folder(folder_path, purpose='training'):
+    """
+    Reads every .csv (or .parquet, as written by generate_synthetic_data.write_fleet) file in `folder_path`
+    and combines them into one DataFrame. Returns None if no file could be loaded.
+    """
+    dataframes = []
 
-    if X_train_full.shape[0] != y_train_full.shape[0]:
-        print("Error: Number of samples in training features (X_train_full) and target (y_train_full) do not match. Please check data preparation.")
-    else:
-        X_train, X_test, y_train, y_test = train_test_split(X_train_full, y_train_full, test_size=0.2, random_state=42)
+    print(f"Loading {purpose} data from: {folder_path}")
+    for file_path in list_data_files(folder_path):
+        filename = os.path.basename(file_path)
+        try:
+            if filename.endswith('.csv'):
+                df = pd.read_csv(file_path)
+            else:
+                df = pd.read_parquet(file_path)
+            dataframes.append(df)
+            print(f"Loaded {filename} for {purpose}.")
+        except Exception as e:
+            print(f"Error reading {filename} for {purpose}: {e}")
 
-        print("\nTraining Data Split Complete:")
-        print(f"X_train shape: {X_train.shape}")
-        print(f"X_test shape: {X_test.shape}")
-        print(f"y_train shape: {y_train.shape}")
-        print(f"y_test shape: {y_test.shape}")
-
-        print("\nTraining XGBoost Regressor model with Hyperparameter Tuning...")
-
-        xgb_model = XGBRegressor(random_state=42, n_jobs=-1)
-
-        param_dist = {
-            'n_estimators': [200, 400, 600, 800, 1000, 1200],
-            'learning_rate': [0.01, 0.03, 0.05, 0.1, 0.15],
-            'max_depth': [5, 6, 7, 8, 9, 10],
-            'subsample': [0.7, 0.8, 0.9, 1.0],
-            'colsample_bytree': [0.7, 0.8, 0.9, 1.0],
-            'gamma': [0, 0.1, 0.2, 0.3],
-            'reg_alpha': [0, 0.001, 0.005, 0.01, 0.05],
-            'reg_lambda': [1, 0.5, 0.1, 0.05],
-            'min_child_weight': [1, 3, 5, 7]
-        }
-
-        random_search = RandomizedSearchCV(
-            estimator=xgb_model,
-            param_distributions=param_dist,
-            n_iter=6,
-            cv=5,
-            verbose=2,
-            random_state=42,
-            n_jobs=-1,
-            scoring='neg_mean_squared_error'
-        )
+    if not dataframes:
+        return None
 
-        random_search.fit(X_train, y_train)
+    combined_df = pd.concat(dataframes, ignore_index=True)
+    print(f"Successfully combined {len(dataframes)} {purpose} files.")
+    print(f"Combined {purpose.title()} DataFrame shape: {combined_df.shape}")
+    return combined_df
 
-        best_model = random_search.best_estimator_
 
-        print("\nHyperparameter Tuning Complete.")
-        print(f"Best parameters found: {random_search.best_params_}")
-        print(f"Best cross-validation score (negative MSE): {random_search.best_score_:.4f}")
 
-        print("\n--- Model Evaluation on Internal Test Set ---")
-        y_pred_test = best_model.predict(X_test)
 
-        r2_test = r2_score(y_test, y_pred_test)
-        print(f"R-squared (R^2) on Test Set: {r2_test:.4f}")
+def tune_model(X_train, y_train, n_iter=6, cv=5, candidates_path=None, search_fingerprint=None, scheduler=None):
+    """
+    Runs the randomized hyperparameter search (same candidates and folds as RandomizedSearchCV with
+    random_state=42) and returns a dict with the refit best model, best_params, best_score and all candidates.
+    With `candidates_path`, finished candidates are persisted there and skipped when the search is rerun.
+    `scheduler` (a training_scheduler.FitScheduler, by default one for this machine's cores and memory) decides
+    how many fits run at once and how many XGBoost threads each one gets.
+    """
+    print("\nTraining XGBoost Regressor model with Hyperparameter Tuning...")
 
-        mae_test = mean_absolute_error(y_test, y_pred_test)
-        print(f"Mean Absolute Error (MAE) on Test Set: {mae_test:.4f} hours")
+    xgb_model = XGBRegressor(random_state=RANDOM_STATE, n_jobs=-1)
 
-        mse_test = mean_squared_error(y_test, y_pred_test)
-        print(f"Mean Squared Error (MSE) on Test Set: {mse_test:.4f} (hours^2)")
+    search = run_resumable_search(
+        xgb_model, PARAM_DIST, X_train, y_train,
+        n_iter=n_iter,
+        cv=cv,
+        scoring='neg_mean_squared_error',
+        random_state=RANDOM_STATE,
+        scheduler=scheduler,
+        candidates_path=candidates_path,
+        search_fingerprint=search_fingerprint
+    )
 
-        rmse_test = np.sqrt(mse_test)
-        print(f"Root Mean Squared Error (RMSE) on Test Set: {rmse_test:.4f} hours")
+    print("\nHyperparameter Tuning Complete.")
+    print_utilization(search['utilization'])
+    print(f"Best parameters found: {search['best_params']}")
+    print(f"Best cross-validation score (negative MSE): {search['best_score']:.4f}")
+    return search
+
+
+def _sorted_quantiles(quantile_model, X):
+    """Uncalibrated quantile predictions for every row of X, sorted per row (independently fitted quantiles can cross)."""
+    booster = quantile_model['model'].get_booster()
+    X_values = np.ascontiguousarray(X.reindex(columns=booster.feature_names, fill_value=0).to_numpy(dtype=np.float32))
+    values = np.asarray(booster.inplace_predict(X_values), dtype=np.float64).reshape(len(X), -1)
+    return np.sort(values, axis=1)
+
+
+def predict_quantiles(quantile_model, X):
+    """
+    RUL quantiles for every row of X, shape (rows, len(quantile_model['quantiles'])), from one predict call.
+    The sorted predictions have their outer two moved out by the calibration margin (the inner ones are kept
+    between them) and are clipped at 0 hours. The booster predicts from a plain float32 array: for a few rows,
+    DataFrame validation in XGBRegressor.predict costs several times the prediction itself.
+    """
+    values = _sorted_quantiles(quantile_model, X)
+    values[:, 0] -= quantile_model['margin']
+    values[:, -1] += quantile_model['margin']
+    values[:, 1:-1] = np.clip(values[:, 1:-1], values[:, :1], values[:, -1:])
+    return np.maximum(values, 0.0)
+
+
+def train_quantile_model(X_train, y_train, X_calibration, y_calibration, params, quantiles=QUANTILES):
+    """
+    Fits one reg:quantileerror booster predicting all `quantiles` with the tuned `params`, then widens (or narrows)
+    its outer interval by the margin that makes it cover the nominal share of (X_calibration, y_calibration).
+    Returns {'model', 'quantiles', 'level', 'margin'}.
+    """
+    print(f"\nTraining the quantile model ({', '.join(f'{q:g}' for q in quantiles)})...")
+    model = XGBRegressor(**params, objective='reg:quantileerror', quantile_alpha=np.asarray(quantiles),
+                         random_state=RANDOM_STATE, n_jobs=-1)
+    model.fit(X_train, y_train)
+    quantile_model = {
+        'model': model,
+        'quantiles': list(quantiles),
+        'level': round(quantiles[-1] - quantiles[0], 6),
+        'margin': 0.0
+    }
+    return calibrate_interval(quantile_model, X_calibration, y_calibration)
+
+
+def calibrate_interval(quantile_model, X_calibration, y_calibration):
+    """Sets quantile_model['margin'] so the outer interval covers its nominal level of the calibration rows."""
+    quantile_model = dict(quantile_model, margin=0.0)
+    # How far each calibration target falls outside the uncalibrated interval (negative inside it), scored on the
+    # same sorted predictions predict_quantiles widens; clipping at 0 hours cannot uncover a (non-negative) target
+    predicted = _sorted_quantiles(quantile_model, X_calibration)
+    y_calibration = np.asarray(y_calibration, dtype=np.float64)
+    scores = np.maximum(predicted[:, 0] - y_calibration, y_calibration - predicted[:, -1])
+    n = len(scores)
+    if n:
+        rank = min(1.0, np.ceil((n + 1) * quantile_model['level']) / n)
+        quantile_model['margin'] = float(np.quantile(scores, rank))
+    print(f"Interval calibration margin: {quantile_model['margin']:+.1f} hours")
+    return quantile_model
+
+
+def evaluate_interval(quantile_model, X, y, set_name):
+    """Prints and returns the coverage and mean width of the quantile model's outer interval on (X, y)."""
+    predicted = predict_quantiles(quantile_model, X)
+    y = np.asarray(y, dtype=np.float64)
+    coverage = float(np.mean((y >= predicted[:, 0]) & (y <= predicted[:, -1])))
+    width = float(np.mean(predicted[:, -1] - predicted[:, 0]))
+    print(f"{quantile_model['level']:.0%} interval on {set_name}: coverage {coverage:.1%}, mean width {width:.1f} hours")
+    return {'level': quantile_model['level'], 'coverage': coverage, 'mean_width': width}
+
+
+def evaluate_model(model, X, y, set_name):
+    """Prints R^2, MAE, MSE and RMSE of `model` on (X, y) and returns them as a dict."""
+    y_pred = model.predict(X)
+
+    r2 = r2_score(y, y_pred)
+    print(f"R-squared (R^2) on {set_name}: {r2:.4f}")
+
+    mae = mean_absolute_error(y, y_pred)
+    print(f"Mean Absolute Error (MAE) on {set_name}: {mae:.4f} hours")
+
+    mse = mean_squared_error(y, y_pred)
+    print(f"Mean Squared Error (MSE) on {set_name}: {mse:.4f} (hours^2)")
+
+    rmse = np.sqrt(mse)
+    print(f"Root Mean Squared Error (RMSE) on {set_name}: {rmse:.4f} hours")
+
+    return {'r2': float(r2), 'mae': float(mae), 'mse': float(mse), 'rmse': float(rmse)}
+
+
+def _stage(profiler, name):
+    """profiler.stage(name) when profiling (see stage_profiler.StageProfiler), otherwise a no-op yielding a dict."""
+    if profiler is None:
+        return contextlib.nullcontext({})
+    return profiler.stage(name)
+
+
+def pipeline_fingerprints(training_fingerprint, validation_fingerprint=None, n_iter=6, cv=5,
+                          model_filename=MODEL_FILENAME, compact=False, feature_params=FEATURE_PARAMS):
+    """
+    Fingerprint of every pipeline stage. Each one chains the fingerprints of the stages it reads with the
+    settings it depends on, so e.g. changing the feature params invalidates features and everything after it,
+    while new validation files only invalidate validation_features and evaluate.
+    """
+    # Editing the feature code invalidates the feature checkpoints just like changing their parameters
+    feature_code = inspect.getsource(engineer_time_series_features) + inspect.getsource(select_features_and_target)
+    feature_config = [feature_params, COLUMNS_TO_DROP, feature_code, compact]
+
+    fingerprints = {'ingest': fingerprint('ingest', training_fingerprint, validation_fingerprint)}
+    fingerprints['features'] = fingerprint('features', training_fingerprint, feature_config)
+    fingerprints['validation_features'] = fingerprint('validation_features', validation_fingerprint, feature_config)
+    fingerprints['split'] = fingerprint(fingerprints['features'], TEST_SIZE, RANDOM_STATE)
+    fingerprints['search'] = fingerprint(fingerprints['split'], PARAM_DIST, n_iter, cv, RANDOM_STATE, xgboost.__version__)
+    fingerprints['quantiles'] = fingerprint(fingerprints['search'], QUANTILES)
+    fingerprints['evaluate'] = fingerprint(fingerprints['quantiles'], fingerprints['validation_features'])
+    fingerprints['sensor_sketches'] = fingerprint('sensor_sketches', training_fingerprint,
+                                                  inspect.getsource(SensorSketches))
+    fingerprints['export'] = fingerprint(fingerprints['quantiles'], fingerprints['sensor_sketches'], model_filename,
+                                         feature_params)
+    return fingerprints
+
+
+class _NoTrainingData(Exception):
+    pass
+
+
+def run_training_pipeline(load_inputs, training_fingerprint=None, validation_fingerprint=None, checkpoint_dir=None,
+                          n_iter=6, cv=5, model_filename=None, profiler=None, restart=False, compact=False,
+                          feature_params=None, scheduler=None):
+    """
+    Runs the PIPELINE_STAGES (export only when `model_filename` is given). `load_inputs()` returns the
+    (training, validation) DataFrames; validation may be None.
+
+    With `checkpoint_dir`, every stage output is saved there and a rerun only recomputes the stages whose
+    inputs changed, as identified by `training_fingerprint`/`validation_fingerprint` (e.g.
+    training_checkpoints.files_fingerprint of the data files). A stage's checkpoint is only read when a stage
+    that has to run needs it, so nothing is loaded when everything is up to date. `restart` discards them all.
+    `compact` engineers float32 features (see to_compact_dtypes). `feature_params` (default FEATURE_PARAMS, e.g. a
+    pruned config from prune_features.py) is saved next to the exported model for serving, as is the quantile model
+    (see train_quantile_model) giving the prediction intervals and the training data's sensor sketches that the
+    backend's drift monitor compares live telemetry against (see drift_monitor.py). `scheduler` plans the search's
+    parallelism (see training_scheduler.py).
+    Returns the best model and a dict of evaluation metrics, or (None, None) if the data could not be prepared.
+    """
+    if checkpoint_dir is not None and training_fingerprint is None:
+        raise ValueError("Checkpointing needs a training_fingerprint identifying the training data")
+
+    checkpoints = CheckpointStore(checkpoint_dir)
+    if restart:
+        checkpoints.clear()
+    feature_params = feature_params or FEATURE_PARAMS
+    fingerprints = pipeline_fingerprints(training_fingerprint, validation_fingerprint, n_iter, cv, model_filename,
+                                         compact, feature_params)
+
+    def run_ingest(record):
+        combined_training_df, combined_validation_df = load_inputs()
+        record['training_rows'] = len(combined_training_df) if combined_training_df is not None else 0
+        record['validation_rows'] = len(combined_validation_df) if combined_validation_df is not None else 0
+        if combined_training_df is None:
+            raise _NoTrainingData()
+        return {'training': combined_training_df, 'validation': combined_validation_df}
+
+    def run_features(record):
+        training_df = get('ingest')['training']
+        # Apply advanced preprocessing and feature engineering to training data
+        processed_df = engineer_time_series_features(training_df, **feature_params, compact=compact)
+        record['input_rows'] = len(training_df)
+
+        dropna_start = time.perf_counter()
+        X_train_full, y_train_full = select_features_and_target(processed_df, COLUMNS_TO_DROP, compact=compact)
+        record['dropna_seconds'] = time.perf_counter() - dropna_start
+        record['rows'], record['features'] = X_train_full.shape
+        record['dropped_rows'] = len(processed_df) - len(X_train_full)
+
+        print(f"\nFeatures (X_train_full) shape after preparation: {X_train_full.shape}")
+        print(f"Target (y_train_full) shape after preparation: {y_train_full.shape}")
+
+        if X_train_full.shape[0] != y_train_full.shape[0]:
+            print("Error: Number of samples in training features (X_train_full) and target (y_train_full) do not match. Please check data preparation.")
+            raise _NoTrainingData()
+        return {'X': X_train_full, 'y': y_train_full}
+
+    def run_validation_features(record):
+        validation_df = get('ingest')['validation']
+        if validation_df is None:
+            return {'X': None, 'y': None}
+        # Apply advanced preprocessing and feature engineering to validation data
+        X_new_processed, y_new_processed = preprocess_and_engineer_features(
+            validation_df,
+            COLUMNS_TO_DROP,
+            **feature_params,
+            compact=compact
+        )
+        record['input_rows'] = len(validation_df)
+        record['rows'] = len(X_new_processed)
+        return {'X': X_new_processed, 'y': y_new_processed}
+
+    def run_split(record):
+        n_rows = len(get('features')['X'])
+        # Same shuffle as splitting (X, y) directly; only the row positions need to be stored
+        train_index, test_index = train_test_split(np.arange(n_rows), test_size=TEST_SIZE, random_state=RANDOM_STATE)
+        record['train_rows'], record['test_rows'] = len(train_index), len(test_index)
+        return {'train_index': train_index, 'test_index': test_index}
+
+    def split_rows(subset):
+        features, split = get('features'), get('split')
+        index = split[f'{subset}_index']
+        return features['X'].iloc[index], features['y'].iloc[index]
+
+    # Child processes of the search are not covered by the stage's CPU time or RSS, only its wall time
+    def run_search(record):
+        X_train, y_train = split_rows('train')
+        print("\nTraining Data Split Complete:")
+        print(f"X_train shape: {X_train.shape}")
+        print(f"y_train shape: {y_train.shape}")
 
-        print("\n--- Validation Scoring with New Data ---")
+        search = tune_model(X_train, y_train, n_iter=n_iter, cv=cv,
+                            candidates_path=checkpoints.candidates_path(),
+                            search_fingerprint=fingerprints['search'], scheduler=scheduler)
+        record['rows'], record['features'] = X_train.shape
+        record['candidates'], record['folds'] = n_iter, cv
+        record['fits'] = n_iter * cv
+        record['resumed_candidates'] = search['resumed_candidates']
+        record['scheduler'] = search['utilization']
+        return search
+
+    # Same hyperparameters and training rows as the fleet model; the test split calibrates the interval
+    def run_quantiles(record):
+        X_train, y_train = split_rows('train')
+        X_test, y_test = split_rows('test')
+        quantile_model = train_quantile_model(X_train, y_train, X_test, y_test, get('search')['best_params'])
+        record['rows'], record['calibration_rows'] = len(X_train), len(X_test)
+        record['margin'] = quantile_model['margin']
+        return quantile_model
+
+    def run_evaluate(record):
+        search = get('search')
+        best_model = search['model']
+        quantile_model = get('quantiles')
+        metrics = {'best_params': search['best_params']}
 
-        all_validation_dataframes = []
+        print("\n--- Model Evaluation on Internal Test Set ---")
+        X_test, y_test = split_rows('test')
+        metrics['test'] = evaluate_model(best_model, X_test, y_test, 'Test Set')
+        # Calibrated on this split, so it covers at least the nominal level of it by construction
+        metrics['test_interval'] = evaluate_interval(quantile_model, X_test, y_test, 'Test Set')
+        record['rows'] = len(X_test)
 
-        print(f"Loading validation data from: {validation_folder_path}")
-        for filename in os.listdir(validation_folder_path):
-            if filename.endswith('.csv'):
-                file_path = os.path.join(validation_folder_path, filename)
-                try:
-                    df_new = pd.read_csv(file_path)
-                    all_validation_dataframes.append(df_new)
-                    print(f"Loaded {filename} for validation.")
-                except Exception as e:
-                    print(f"Error reading {filename} for validation: {e}")
-
-        if all_validation_dataframes:
-            combined_validation_df = pd.concat(all_validation_dataframes, ignore_index=True)
-            print(f"Successfully combined {len(all_validation_dataframes)} validation CSV files.")
-            print(f"Combined Validation DataFrame shape: {combined_validation_df.shape}")
-
-            # Apply advanced preprocessing and feature engineering to validation data
-            X_new_processed, y_new_processed = preprocess_and_engineer_features(
-                combined_validation_df,
-                columns_to_drop,
-                lags=3,
-                rolling_windows=[5, 10, 20],
-                diff_periods=[1, 3],
-                ewma_spans=[10, 20]
-            )
-
-            # Align columns of X_new_processed with X_train to ensure consistent feature order and presence
-            X_new_aligned = X_new_processed.reindex(columns=X_train.columns, fill_value=0)
+        print("\n--- Validation Scoring with New Data ---")
+        validation = get('validation_features')
+        if validation['X'] is not None:
+            # Align columns of the validation features with the training features to ensure consistent feature order and presence
+            X_new_aligned = validation['X'].reindex(columns=best_model.get_booster().feature_names, fill_value=0)
+            if compact:
+                X_new_aligned = X_new_aligned.astype(COMPACT_FLOAT_DTYPE, copy=False)
+            y_new_processed = validation['y']
+            record['validation_rows'] = len(X_new_aligned)
 
             if not X_new_aligned.empty and not y_new_processed.empty:
                 # Make predictions on the new data using the best found model
-                y_pred_new = best_model.predict(X_new_aligned)
-
-                r2_new = r2_score(y_new_processed, y_pred_new)
-                print(f"R-squared (R^2) on New Data: {r2_new:.4f}")
-
-                mae_new = mean_absolute_error(y_new_processed, y_pred_new)
-                print(f"Mean Absolute Error (MAE) on New Data: {mae_new:.4f} hours")
-
-                mse_new = mean_squared_error(y_new_processed, y_pred_new)
-                print(f"Mean Squared Error (MSE) on New Data: {mse_new:.4f} (hours^2)")
-
-                rmse_new = np.sqrt(mse_new)
-                print(f"Root Mean Squared Error (RMSE) on New Data: {rmse_new:.4f} hours")
+                metrics['validation'] = evaluate_model(best_model, X_new_aligned, y_new_processed, 'New Data')
+                metrics['validation_interval'] = evaluate_interval(quantile_model, X_new_aligned, y_new_processed, 'New Data')
             else:
                 print("No valid data found in the validation CSV files after preprocessing and feature engineering.")
         else:
+            print("No validation data provided.")
+        return metrics
+
+    # Drift reference: constant-size sketches of every raw training row, per tractor cohort
+    def run_sensor_sketches(record):
+        sketches = SensorSketches().update(get('ingest')['training'])
+        record['rows'] = sketches.rows()
+        return sketches.to_dict()
+
+    def run_export(record):
+        save_model(get('search')['model'], model_filename)
+        save_model(get('quantiles'), quantile_model_path(model_filename))
+        save_feature_config(feature_params, model_filename)
+        SensorSketches.from_dict(get('sensor_sketches')).save(drift_reference_path(model_filename))
+        record['model_bytes'] = os.path.getsize(model_filename) if os.path.exists(model_filename) else None
+        return {'model_file': model_filename}
+
+    stage_functions = {
+        'ingest': run_ingest,
+        'features': run_features,
+        'validation_features': run_validation_features,
+        'split': run_split,
+        'search': run_search,
+        'quantiles': run_quantiles,
+        'evaluate': run_evaluate,
+        'sensor_sketches': run_sensor_sketches,
+        'export': run_export
+    }
+
+    outputs = {}
+
+    def get(stage):
+        """Output of `stage`: its checkpoint when still valid, otherwise computed (after its inputs) and saved."""
+        if stage in outputs:
+            return outputs[stage]
+        up_to_date = checkpoints.is_valid(stage, fingerprints[stage])
+        # The export checkpoint only counts while the exported files are still there
+        if stage == 'export':
+            exported_files = [model_filename, quantile_model_path(model_filename), drift_reference_path(model_filename)]
+            if not all(os.path.exists(path) for path in exported_files):
+                up_to_date = False
+        if up_to_date:
+            print(f"Stage '{stage}' is up to date; reusing its checkpoint.")
+            outputs[stage] = checkpoints.load(stage)
+            return outputs[stage]
+
+        # Inputs are resolved first so a stage's timings never include another stage
+        for input_stage in STAGE_INPUTS[stage]:
+            get(input_stage)
+        with _stage(profiler, stage) as record:
+            output = stage_functions[stage](record)
+            checkpoints.save(stage, fingerprints[stage], output)
+        outputs[stage] = output
+        return output
+
+    try:
+        metrics = get('evaluate')
+        if model_filename:
+            get('export')
+    except _NoTrainingData:
+        return None, None
+    return get('search')['model'], metrics
+
+
+def train_model(combined_training_df, combined_validation_df=None, n_iter=6, cv=5, profiler=None, compact=False,
+                feature_params=None):
+    """
+    Runs the training pipeline on in-memory DataFrames (e.g. from load_data_folder or
+    generate_synthetic_data.generate_fleet) without checkpoints or export.
+    Pass a stage_profiler.StageProfiler as `profiler` to record time and memory of every stage.
+    Returns the best model and a dict of evaluation metrics, or (None, None) if the data could not be prepared.
+    """
+    return run_training_pipeline(lambda: (combined_training_df, combined_validation_df),
+                                 n_iter=n_iter, cv=cv, profiler=profiler, compact=compact,
+                                 feature_params=feature_params)
+
+
+def feature_config_path(model_filename=MODEL_FILENAME):
+    """Feature config saved next to a model: mae_403.joblib -> mae_403.features.json."""
+    return os.path.splitext(model_filename)[0] + '.features.json'
+
+
+def save_feature_config(feature_params, model_filename=MODEL_FILENAME):
+    with open(feature_config_path(model_filename), 'w') as f:
+        json.dump(feature_params, f, indent=2)
+
+
+def load_feature_params(model_filename=MODEL_FILENAME):
+    """Feature params a model was trained with: its saved feature config, or FEATURE_PARAMS for older models."""
+    config_path = feature_config_path(model_filename)
+    if not os.path.exists(config_path):
+        return dict(FEATURE_PARAMS)
+    with open(config_path) as f:
+        return json.load(f)
+
+
+def quantile_model_path(model_filename=MODEL_FILENAME):
+    """Quantile model saved next to a model: mae_403.joblib -> mae_403.quantiles.joblib."""
+    return os.path.splitext(model_filename)[0] + '.quantiles.joblib'
+
+
+def load_quantile_model(model_filename=MODEL_FILENAME):
+    """The quantile model exported with a model (see train_quantile_model), or None for older models."""
+    path = quantile_model_path(model_filename)
+    if not os.path.exists(path):
+        return None
+    return joblib.load(path)
+
+
+def save_model(model, model_filename=MODEL_FILENAME):
+    try:
+        joblib.dump(model, model_filename)
+        print(f"Model saved successfully to {model_filename}")
+    except Exception as e:
+        print(f"Error saving model to {model_filename}: {e}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Train the RUL XGBoost model.")
+    parser.add_argument('--synthetic-samples', type=int, default=None,
+                        help="Train on this many tractors generated in memory instead of reading training_data_csv.")
+    parser.add_argument('--seed', type=int, default=42, help="Seed for --synthetic-samples.")
+    parser.add_argument('--n-iter', type=int, default=6, help="Hyperparameter candidates tried by the search.")
+    parser.add_argument('--cv', type=int, default=5, help="Cross-validation folds per candidate.")
+    parser.add_argument('--checkpoint-dir', default=CHECKPOINT_DIR,
+                        help="Where stage outputs and finished search candidates are checkpointed.")
+    parser.add_argument('--no-checkpoint', action='store_true', help="Run every stage in memory without checkpoints.")
+    parser.add_argument('--restart', action='store_true', help="Ignore existing checkpoints and rerun every stage.")
+    parser.add_argument('--feature-config', default=None,
+                        help="JSON feature config (e.g. from prune_features.py) to train with instead of FEATURE_PARAMS.")
+    parser.add_argument('--compact', action='store_true',
+                        help="Engineer float32 features with small-integer flags (about half the memory).")
+    parser.add_argument('--profile', action='store_true',
+                        help="Record wall time, CPU time and memory of every stage and write a JSON run report.")
+    parser.add_argument('--profile-report', default='training_profile.json', help="Where --profile writes its report.")
+    parser.add_argument('--tracemalloc', action='store_true',
+                        help="With --profile, also track Python allocations (slows the run down).")
+    parser.add_argument('--cprofile', default=None, metavar='PATH',
+                        help="With --profile, run stages under cProfile and dump the slowest stage's stats to PATH.")
+    parser.add_argument('--cores', type=int, default=None,
+                        help="Cores the hyperparameter search may use (default: every core available to the process).")
+    parser.add_argument('--memory-gb', type=float, default=None,
+                        help="Memory the search's concurrent fits may use (default: the available memory).")
+    args = parser.parse_args(argv)
+
+    profiler = None
+    if args.profile:
+        from stage_profiler import StageProfiler
+        profiler = StageProfiler(track_allocations=args.tracemalloc, cprofile=args.cprofile is not None)
+
+    # Fingerprints describe the inputs without loading them, so a resumed run can skip ingestion entirely
+    validation_files = list_data_files(validation_folder_path)
+    validation_fingerprint = files_fingerprint(validation_files)
+    if args.synthetic_samples:
+        training_fingerprint = fingerprint('synthetic', args.synthetic_samples, args.seed)
+    else:
+        training_fingerprint = files_fingerprint(list_data_files(training_folder_path))
+
+    feature_params = None
+    if args.feature_config:
+        with open(args.feature_config) as f:
+            feature_params = json.load(f)
+
+    def load_inputs():
+        if args.synthetic_samples:
+            from generate_synthetic_data import generate_fleet
+            print(f"Generating {args.synthetic_samples} synthetic tractors in memory (seed={args.seed})...")
+            combined_training_df = next(generate_fleet(args.synthetic_samples, seed=args.seed, batch_size=args.synthetic_samples))
+            print(f"Combined Training DataFrame shape: {combined_training_df.shape}")
+        else:
+            combined_training_df = load_data_folder(training_folder_path, 'training')
+            if combined_training_df is None:
+                print(f"No CSV files found in the training folder: {training_folder_path}")
+
+        combined_validation_df = None
+        if validation_files:
+            combined_validation_df = load_data_folder(validation_folder_path, 'validation')
+        if combined_validation_df is None:
             print(f"No CSV files found in the validation folder: {validation_folder_path}")
-        
-        model_filename = 'mae_403.joblib'
-        try:
-            joblib.dump(best_model, model_filename)
-            print(f"Model saved successfully to {model_filename}")
-        except Exception as e:
-            print(f"Error saving model to {model_filename}: {e}")
+        return combined_training_df, combined_validation_df
+
+    best_model, metrics = run_training_pipeline(
+        load_inputs, training_fingerprint, validation_fingerprint,
+        checkpoint_dir=None if args.no_checkpoint else args.checkpoint_dir,
+        n_iter=args.n_iter, cv=args.cv, model_filename=MODEL_FILENAME,
+        profiler=profiler, restart=args.restart, compact=args.compact, feature_params=feature_params,
+        scheduler=FitScheduler(cores=args.cores,
+                               memory_bytes=args.memory_gb * 1024 ** 3 if args.memory_gb else None)
+    )
+
+    if profiler is not None:
+        profiler.print_summary()
+        if args.cprofile:
+            profiler.dump_hottest_profile(args.cprofile)
+        profiler.write_report(args.profile_report, metrics=metrics, model_file=MODEL_FILENAME)
+        print(f"Profile report written to {args.profile_report}")
 
 
-else:
-    print(f"No CSV files found in the training folder: {training_folder_path}")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,249 @@
+import os
+import time
+import shutil
+import argparse
+import threading
+from collections import OrderedDict
+
+import joblib
+import numpy as np
+
+# Lazily loaded models for routing requests by product line or fleet segment.
+# A model directory holds one model per route, saved as <route>.joblib with its sidecar files next to it
+# (<route>.features.json, <route>.quantiles.joblib, ...; see mae_403.py). ModelRegistry loads a route's model
+# on its first request and keeps the loaded models in a least-recently-used cache bounded by memory: each model
+# is charged the size of its files, which for pickled boosters and arrays is close to their size in memory.
+# Requests arriving while a route is being loaded wait for that load instead of starting their own, so a burst
+# of first requests reads and unpickles the model once. Hits, loads, waits, load time and evictions are counted
+# per route. The directory listing is cached; looking up a route missing from it lists the directory again (at
+# most every ROUTES_REFRESH_SECONDS), so installed models are found without listing it on every request.
+
+MODEL_EXTENSION = '.joblib'
+
+# Memory the loaded models of one process may take
+DEFAULT_MAX_BYTES = 1024 ** 3
+
+# Shortest time between two listings of the model directory caused by lookups of unknown routes
+ROUTES_REFRESH_SECONDS = 5.0
+
+# Requests and threads simulated by `python model_registry.py benchmark`
+BENCHMARK_REQUESTS = 2000
+BENCHMARK_THREADS = 8
+
+
+def route_name(value):
+    """Route of a product line or segment as sent by the frontend: 'X9 1000' -> 'x9-1000'."""
+    return str(value).strip().lower().replace(' ', '-')
+
+
+def model_files(model_dir, name):
+    """The model file of route `name` and its sidecars (files named <name>.<anything>)."""
+    prefix = name + '.'
+    return sorted(os.path.join(model_dir, filename) for filename in os.listdir(model_dir) if filename.startswith(prefix))
+
+
+class _PendingLoad:
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class ModelRegistry:
+    """
+    Route name -> loaded model, loaded on first use from `model_dir` by `loader(path)` (default joblib.load):
+
+        registry = ModelRegistry('models', max_bytes=512 * 1024 ** 2)
+        model = registry.get('x9-1000')      # loads models/x9-1000.joblib, or returns the cached model
+        registry.stats()                     # per-route hits, loads, load time, evictions
+
+    Routes are the <name>.joblib files of the directory whose name has no other dot. Loaded models are evicted
+    least recently used first once their files exceed `max_bytes`; the model just loaded always stays.
+    """
+
+    def __init__(self, model_dir, loader=joblib.load, max_bytes=DEFAULT_MAX_BYTES):
+        self.model_dir = model_dir
+        self.loader = loader
+        self.max_bytes = max_bytes
+        self._models = OrderedDict()
+        self._bytes = {}
+        self._loading = {}
+        self._metrics = {}
+        self._lock = threading.Lock()
+        self._routes = None
+        self._routes_listed = 0.0
+
+    def refresh_routes(self):
+        """Lists the directory again; returns the names of its models."""
+        if not self.model_dir or not os.path.isdir(self.model_dir):
+            routes = []
+        else:
+            routes = sorted(filename[:-len(MODEL_EXTENSION)] for filename in os.listdir(self.model_dir)
+                            if filename.endswith(MODEL_EXTENSION) and '.' not in filename[:-len(MODEL_EXTENSION)])
+        self._routes, self._routes_listed = frozenset(routes), time.monotonic()
+        return routes
+
+    def routes(self):
+        """Names of the models in the directory (loaded or not), as last listed."""
+        if self._routes is None:
+            return self.refresh_routes()
+        return sorted(self._routes)
+
+    def __contains__(self, name):
+        if self._routes is None:
+            self.refresh_routes()
+        if name in self._routes:
+            return True
+        if time.monotonic() - self._routes_listed < ROUTES_REFRESH_SECONDS:
+            return False
+        return name in self.refresh_routes()
+
+    def _route_metrics(self, name):
+        if name not in self._metrics:
+            self._metrics[name] = {'hits': 0, 'loads': 0, 'waits': 0, 'load_errors': 0, 'evictions': 0,
+                                   'load_seconds': 0.0, 'last_load_seconds': None}
+        return self._metrics[name]
+
+    def get(self, name):
+        """The model of route `name`, loading it if needed; KeyError for routes without a model file."""
+        with self._lock:
+            if name in self._models:
+                self._models.move_to_end(name)
+                self._route_metrics(name)['hits'] += 1
+                return self._models[name]
+            pending = self._loading.get(name)
+            owner = pending is None
+            if owner:
+                pending = self._loading[name] = _PendingLoad()
+            else:
+                self._route_metrics(name)['waits'] += 1
+
+        if not owner:
+            pending.done.wait()
+            if pending.error is not None:
+                raise pending.error
+            return pending.value
+
+        try:
+            if name not in self:
+                raise KeyError(f"No model for route {name!r} in {self.model_dir}")
+            start = time.perf_counter()
+            value = self.loader(os.path.join(self.model_dir, name + MODEL_EXTENSION))
+            seconds = time.perf_counter() - start
+            size = sum(os.path.getsize(path) for path in model_files(self.model_dir, name))
+        except Exception as e:
+            pending.error = e
+            with self._lock:
+                del self._loading[name]
+                self._route_metrics(name)['load_errors'] += 1
+            pending.done.set()
+            raise
+
+        with self._lock:
+            metrics = self._route_metrics(name)
+            metrics['loads'] += 1
+            metrics['load_seconds'] += seconds
+            metrics['last_load_seconds'] = seconds
+            self._models[name] = value
+            self._bytes[name] = size
+            self._evict()
+            del self._loading[name]
+        pending.value = value
+        pending.done.set()
+        return value
+
+    def _evict(self):
+        """Drops least recently used models until the loaded ones fit in max_bytes (called with the lock held)."""
+        while len(self._models) > 1 and sum(self._bytes.values()) > self.max_bytes:
+            name, _ = self._models.popitem(last=False)
+            del self._bytes[name]
+            self._route_metrics(name)['evictions'] += 1
+            print(f"Evicted model {name!r} to stay within {self.max_bytes / 1024 ** 2:.0f} MB")
+
+    def stats(self):
+        """Loaded routes (least recently used first), their memory and every route's counters."""
+        with self._lock:
+            return {
+                'model_dir': self.model_dir,
+                'max_bytes': self.max_bytes,
+                'loaded_bytes': sum(self._bytes.values()),
+                'loaded': list(self._models),
+                'loading': list(self._loading),
+                'metrics': {name: dict(metrics, loaded=name in self._models, bytes=self._bytes.get(name))
+                           for name, metrics in sorted(self._metrics.items())}
+            }
+
+
+def install_model(model_path, model_dir, name):
+    """Copies a trained model and its sidecars into `model_dir` as route `name`; returns the copied paths."""
+    os.makedirs(model_dir, exist_ok=True)
+    source_dir = os.path.dirname(os.path.abspath(model_path))
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    copied = []
+    for path in model_files(source_dir, stem):
+        destination = os.path.join(model_dir, route_name(name) + os.path.basename(path)[len(stem):])
+        shutil.copyfile(path, destination)
+        copied.append(destination)
+    return copied
+
+
+def _benchmark(model_dir, max_bytes, requests, threads, seed):
+    """Concurrent requests over the directory's routes, a few of them popular (Zipf-like); prints the counters."""
+    registry = ModelRegistry(model_dir, max_bytes=max_bytes)
+    routes = registry.routes()
+    if not routes:
+        print(f"No models in {model_dir}")
+        return
+    # Unpickling the first booster imports XGBoost; keep that out of the load times
+    import xgboost  # noqa: F401
+    weights = 1.0 / np.arange(1, len(routes) + 1)
+    picks = np.random.default_rng(seed).choice(len(routes), size=requests, p=weights / weights.sum())
+    chunks = np.array_split(picks, threads)
+
+    def worker(chunk):
+        for route in chunk:
+            registry.get(routes[route])
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(chunk,)) for chunk in chunks]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    stats = registry.stats()
+    print(f"{requests} requests over {len(routes)} routes from {threads} threads in {elapsed:.2f} s; "
+          f"{len(stats['loaded'])} models loaded, {stats['loaded_bytes'] / 1024 ** 2:.1f} MB of "
+          f"{max_bytes / 1024 ** 2:.0f} MB.")
+    print(f"{'route':>16} {'hits':>6} {'loads':>6} {'waits':>6} {'evictions':>10} {'load ms':>8}")
+    for name, metrics in stats['metrics'].items():
+        mean_load = 1000 * metrics['load_seconds'] / metrics['loads'] if metrics['loads'] else 0.0
+        print(f"{name:>16} {metrics['hits']:>6} {metrics['loads']:>6} {metrics['waits']:>6} "
+              f"{metrics['evictions']:>10} {mean_load:>8.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage and exercise the per-route model directory.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    install = subparsers.add_parser('install', help="Copy a trained model and its sidecars in as a route.")
+    install.add_argument('--model', required=True, help="Trained model, e.g. mae_403.joblib.")
+    install.add_argument('--name', required=True, help="Product line or segment, e.g. 'X9 1000'.")
+    install.add_argument('--model-dir', default='models', help="Model directory served with RUL_MODEL_DIR.")
+    benchmark = subparsers.add_parser('benchmark', help="Concurrent requests over the routes of a model directory.")
+    benchmark.add_argument('--model-dir', default='models', help="Model directory to load from.")
+    benchmark.add_argument('--max-mb', type=float, default=DEFAULT_MAX_BYTES / 1024 ** 2, help="Cache budget in MB.")
+    benchmark.add_argument('--requests', type=int, default=BENCHMARK_REQUESTS, help="Requests to simulate.")
+    benchmark.add_argument('--threads', type=int, default=BENCHMARK_THREADS, help="Concurrent request threads.")
+    benchmark.add_argument('--seed', type=int, default=0, help="Seed of the request sequence.")
+    args = parser.parse_args(argv)
+
+    if args.command == 'install':
+        for path in install_model(args.model, args.model_dir, args.name):
+            print(f"Installed {path}")
+    else:
+        _benchmark(args.model_dir, int(args.max_mb * 1024 ** 2), args.requests, args.threads, args.seed)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,237 @@
+import io
+import json
+import time
+import argparse
+import warnings
+import contextlib
+
+import numpy as np
+import pandas as pd
+from xgboost import XGBRegressor
+
+from mae_403 import (
+    COLUMNS_TO_DROP, FEATURE_PARAMS, engineer_time_series_features, feature_family, load_data_folder,
+    preprocess_and_engineer_features, select_features_and_target, training_folder_path
+)
+from evaluate_fleet import compute_metrics
+
+# Cost-aware feature pruning. Every numeric column is expanded into feature families (lags, each rolling
+# statistic, diffs, EWMAs; see mae_403.FEATURE_FAMILIES). This script measures what each 'column:family' costs
+# to compute and how much gain the booster gets from it, ranks families by gain per second, and retrains with
+# the best-ranked families covering decreasing shares of the total gain. For each configuration it reports
+# held-out accuracy, feature engineering time and single-tractor prediction latency, and writes the cheapest
+# configuration within --max-mae-increase of the full feature set as a feature config that
+# `mae_403.py --feature-config` trains with and the backend serves with.
+
+# Fixed hyperparameters so configurations differ only in their features
+PRUNING_MODEL_PARAMS = {
+    'n_estimators': 300,
+    'max_depth': 6,
+    'learning_rate': 0.1,
+    'subsample': 0.9,
+    'colsample_bytree': 0.9,
+    'random_state': 42,
+    'n_jobs': -1
+}
+
+# Share of the total gain kept by each pruned configuration
+DEFAULT_GAIN_COVERAGES = [0.99, 0.95, 0.9, 0.8, 0.6]
+
+# A pruned configuration may be at most this much worse (relative validation MAE) than the full feature set
+DEFAULT_MAX_MAE_INCREASE = 0.02
+
+# Tractors whose latest months are scored one request at a time, as the backend does
+DEFAULT_LATENCY_TRACTORS = 20
+HISTORY_WINDOW_MONTHS = 30
+
+
+def _quiet():
+    stack = contextlib.ExitStack()
+    stack.enter_context(contextlib.redirect_stdout(io.StringIO()))
+    stack.enter_context(warnings.catch_warnings())
+    warnings.simplefilter('ignore', pd.errors.PerformanceWarning)
+    return stack
+
+
+def family_gains(model):
+    """Total gain of the booster per 'column:family' (input columns count as 'column:raw')."""
+    gains = {}
+    for feature, gain in model.get_booster().get_score(importance_type='total_gain').items():
+        col, kind = feature_family(feature)
+        key = f'{col}:{kind}'
+        gains[key] = gains.get(key, 0.0) + gain
+    return gains
+
+
+def rank_families(gains, costs):
+    """Engineered families sorted by gain per second of feature engineering (unused families last)."""
+    ranking = []
+    for key, seconds in costs.items():
+        gain = gains.get(key, 0.0)
+        ranking.append({'family': key, 'gain': gain, 'seconds': seconds,
+                        'gain_per_second': gain / seconds if seconds > 0 else float('inf')})
+    ranking.sort(key=lambda entry: entry['gain_per_second'], reverse=True)
+    return ranking
+
+
+def families_for_coverage(ranking, coverage):
+    """{column: [family, ...]} of the best-ranked families whose gain adds up to `coverage` of the total."""
+    total_gain = sum(entry['gain'] for entry in ranking)
+    families, kept_gain = {}, 0.0
+    for entry in ranking:
+        if kept_gain >= coverage * total_gain or entry['gain'] <= 0:
+            break
+        col, kind = entry['family'].rsplit(':', 1)
+        families.setdefault(col, []).append(kind)
+        kept_gain += entry['gain']
+    return families
+
+
+def _keeps(feature, families):
+    col, kind = feature_family(feature)
+    return kind == 'raw' or kind in families.get(col, [])
+
+
+def latency_histories(validation_df, max_tractors=DEFAULT_LATENCY_TRACTORS):
+    """Latest HISTORY_WINDOW_MONTHS of up to `max_tractors` validation tractors, one frame per request."""
+    histories = []
+    for _, history in validation_df.groupby('sample_id', sort=False):
+        histories.append(history.tail(HISTORY_WINDOW_MONTHS).reset_index(drop=True))
+        if len(histories) >= max_tractors:
+            break
+    return histories
+
+
+def evaluate_configuration(name, families, X_train, y_train, X_val, y_val, validation_df, histories,
+                           feature_params=FEATURE_PARAMS, model_params=PRUNING_MODEL_PARAMS):
+    """Retrains on the features kept by `families` (None = all) and measures accuracy, feature time and latency."""
+    columns = list(X_train.columns) if families is None else [col for col in X_train.columns if _keeps(col, families)]
+    model = XGBRegressor(**model_params)
+    model.fit(X_train[columns], y_train)
+    validation = compute_metrics(y_val, model.predict(X_val[columns]))
+
+    # Feature engineering of the whole validation set with only the kept families
+    feature_start = time.perf_counter()
+    with _quiet():
+        preprocess_and_engineer_features(validation_df, COLUMNS_TO_DROP, **feature_params, families=families)
+    feature_seconds = time.perf_counter() - feature_start
+
+    # One request per tractor: features of its latest months, then one prediction, as in backend /predict
+    latencies = []
+    for history in histories:
+        request_start = time.perf_counter()
+        with _quiet():
+            X_history, _ = preprocess_and_engineer_features(history, COLUMNS_TO_DROP, **feature_params, families=families)
+        if len(X_history):
+            model.predict(X_history.tail(1).reindex(columns=columns, fill_value=0))
+        latencies.append(time.perf_counter() - request_start)
+
+    predict_start = time.perf_counter()
+    model.predict(X_val[columns])
+    batch_predict_seconds = time.perf_counter() - predict_start
+
+    return {
+        'name': name,
+        'features': len(columns),
+        'families': families,
+        'validation': validation,
+        'feature_seconds': feature_seconds,
+        'request_p50_ms': float(np.percentile(np.asarray(latencies) * 1000, 50)) if latencies else None,
+        'batch_predict_ms_per_1000_rows': batch_predict_seconds * 1000 / max(len(X_val), 1) * 1000
+    }
+
+
+def run_pruning(training_df, validation_df, coverages=DEFAULT_GAIN_COVERAGES, feature_params=FEATURE_PARAMS,
+                max_mae_increase=DEFAULT_MAX_MAE_INCREASE, latency_tractors=DEFAULT_LATENCY_TRACTORS):
+    """Ranks feature families, evaluates the full and pruned configurations and picks one; returns the report."""
+    print("Engineering the full feature set and timing every feature family...")
+    costs = {}
+    with _quiet():
+        processed_df = engineer_time_series_features(training_df, **feature_params, timings=costs)
+        X_train, y_train = select_features_and_target(processed_df, COLUMNS_TO_DROP)
+        X_val, y_val = preprocess_and_engineer_features(validation_df, COLUMNS_TO_DROP, **feature_params)
+    del processed_df
+    X_val = X_val.reindex(columns=X_train.columns, fill_value=0)
+    histories = latency_histories(validation_df, latency_tractors)
+
+    print("Ranking families by gain per second of feature engineering...")
+    reference = XGBRegressor(**PRUNING_MODEL_PARAMS).fit(X_train, y_train)
+    ranking = rank_families(family_gains(reference), costs)
+
+    configurations = [evaluate_configuration('full', None, X_train, y_train, X_val, y_val, validation_df,
+                                             histories, feature_params)]
+    for coverage in coverages:
+        families = families_for_coverage(ranking, coverage)
+        configurations.append(evaluate_configuration(f'gain_{coverage:g}', families, X_train, y_train, X_val, y_val,
+                                                     validation_df, histories, feature_params))
+    for configuration in configurations:
+        print(f"{configuration['name']:<10} {configuration['features']:>5} features  "
+              f"MAE {configuration['validation']['mae']:>8.1f} h  FE {configuration['feature_seconds']:>6.2f} s  "
+              f"request p50 {configuration['request_p50_ms']:>7.1f} ms")
+
+    # Cheapest request latency among the configurations accurate enough
+    full_mae = configurations[0]['validation']['mae']
+    acceptable = [c for c in configurations if c['validation']['mae'] <= full_mae * (1 + max_mae_increase)]
+    chosen = min(acceptable, key=lambda c: c['request_p50_ms'])
+
+    return {
+        'training_rows': int(len(X_train)),
+        'validation_rows': int(len(X_val)),
+        'max_mae_increase': max_mae_increase,
+        'ranking': ranking,
+        'configurations': configurations,
+        'chosen': chosen['name']
+    }, chosen
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Rank feature families by gain and cost and pick a pruned feature config.")
+    parser.add_argument('--synthetic-samples', type=int, default=None,
+                        help="Use this many tractors generated in memory instead of reading training_data_csv.")
+    parser.add_argument('--seed', type=int, default=42, help="Seed for --synthetic-samples.")
+    parser.add_argument('--validation-fraction', type=float, default=0.2, help="Share of tractors held out.")
+    parser.add_argument('--coverages', default=','.join(str(c) for c in DEFAULT_GAIN_COVERAGES),
+                        help="Comma-separated shares of the total gain kept by the pruned configurations.")
+    parser.add_argument('--max-mae-increase', type=float, default=DEFAULT_MAX_MAE_INCREASE,
+                        help="Relative validation MAE increase over the full feature set a chosen config may have.")
+    parser.add_argument('--latency-tractors', type=int, default=DEFAULT_LATENCY_TRACTORS,
+                        help="Tractors scored one request at a time for the latency measurement.")
+    # Not next to the current model: it was trained on the full feature set, which serving must keep using
+    parser.add_argument('--output', default='feature_config.json', help="Where to write the chosen feature config.")
+    parser.add_argument('--report', default='pruning_report.json', help="Where to write the JSON report.")
+    args = parser.parse_args(argv)
+
+    if args.synthetic_samples:
+        from generate_synthetic_data import generate_fleet
+        fleet_df = next(generate_fleet(args.synthetic_samples, seed=args.seed, batch_size=args.synthetic_samples))
+    else:
+        fleet_df = load_data_folder(training_folder_path, 'training')
+        if fleet_df is None:
+            print(f"No CSV files found in the training folder: {training_folder_path}")
+            return
+
+    sample_ids = fleet_df['sample_id'].unique()
+    n_validation = max(1, int(len(sample_ids) * args.validation_fraction))
+    is_validation = fleet_df['sample_id'].isin(sample_ids[len(sample_ids) - n_validation:])
+
+    report, chosen = run_pruning(
+        fleet_df[~is_validation], fleet_df[is_validation],
+        coverages=[float(c) for c in args.coverages.split(',') if c],
+        max_mae_increase=args.max_mae_increase, latency_tractors=args.latency_tractors
+    )
+
+    feature_config = dict(FEATURE_PARAMS)
+    if chosen['families'] is not None:
+        feature_config['families'] = chosen['families']
+    with open(args.output, 'w') as f:
+        json.dump(feature_config, f, indent=2)
+    print(f"\nChose '{chosen['name']}' ({chosen['features']} features); feature config written to {args.output}")
+    print(f"Train with it: python mae_403.py --feature-config {args.output}")
+
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {args.report}")
+
+
+if __name__ == '__main__':
+    main()
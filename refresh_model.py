@@ -0,0 +1,253 @@
+import os
+import json
+import time
+import shutil
+import argparse
+
+import joblib
+import numpy as np
+import pandas as pd
+from xgboost import XGBRegressor
+
+from mae_403 import (
+    CHECKPOINT_DIR, MODEL_FILENAME, calibrate_interval, load_feature_params, load_quantile_model, quantile_model_path,
+    run_training_pipeline, save_feature_config
+)
+from evaluate_fleet import (
+    compute_metrics, engineer_fleet, list_history_files, read_file_batch
+)
+from generate_synthetic_data import SENSOR_BASELINES
+from training_checkpoints import files_fingerprint
+
+# Incremental refresh: instead of retraining from scratch, continue boosting the saved model on the most
+# recent months of every tractor. Each tractor's engineered rows are split by age:
+#
+#   [ ... reference history ... | refresh window (--window-months) | holdout (--holdout-months) ]
+#
+# The holdout (freshest months) is never trained on; the current and the refreshed model are both scored on it.
+# The refresh is rejected in favour of a full retrain (mae_403.run_training_pipeline on the full histories)
+# when the sensors of the window drift too far from the reference history, when the current model's holdout
+# error is already too high, or when the refreshed model is worse than the current one on the holdout.
+
+DEFAULT_WINDOW_MONTHS = 12
+DEFAULT_HOLDOUT_MONTHS = 3
+
+# Boosting rounds appended to the existing ensemble per refresh, and their learning rate. The window only
+# covers the end of each history, so added trees at the tuned learning rate overfit it and hurt the holdout.
+DEFAULT_EXTRA_ROUNDS = 50
+DEFAULT_REFRESH_LEARNING_RATE = 0.01
+
+# Largest allowed shift of a sensor's window mean from its reference mean, in reference standard deviations
+DEFAULT_DRIFT_THRESHOLD = 1.0
+
+# The refreshed model may be at most this much worse (relative holdout MAE) than the current one
+DEFAULT_TOLERANCE = 0.05
+
+REFRESH_METADATA_COLUMNS = ['sample_id', 'date']
+
+
+def split_by_age(metadata, window_months=DEFAULT_WINDOW_MONTHS, holdout_months=DEFAULT_HOLDOUT_MONTHS):
+    """Boolean masks (reference, window, holdout) over the rows, by months before each tractor's latest row."""
+    months_from_end = metadata.groupby(['source_file', 'sample_id'], sort=False).cumcount(ascending=False).to_numpy()
+    holdout = months_from_end < holdout_months
+    window = ~holdout & (months_from_end < holdout_months + window_months)
+    reference = months_from_end >= holdout_months + window_months
+    return reference, window, holdout
+
+
+def sensor_drift(X_reference, X_window, sensors=tuple(SENSOR_BASELINES)):
+    """
+    Shift of each sensor's mean between the reference rows and the refresh window, in reference standard
+    deviations. Returns {sensor: score}, or an empty dict when there is no reference history.
+    """
+    if len(X_reference) < 2 or len(X_window) == 0:
+        return {}
+    drift = {}
+    for sensor in sensors:
+        if sensor not in X_reference.columns:
+            continue
+        reference_std = X_reference[sensor].std()
+        if not reference_std or np.isnan(reference_std):
+            continue
+        drift[sensor] = float(abs(X_window[sensor].mean() - X_reference[sensor].mean()) / reference_std)
+    return drift
+
+
+def continue_boosting(model, X, y, extra_rounds=DEFAULT_EXTRA_ROUNDS, learning_rate=DEFAULT_REFRESH_LEARNING_RATE):
+    """New XGBRegressor with the saved model's trees plus `extra_rounds` more fitted on (X, y) at `learning_rate`."""
+    params = model.get_params()
+    params['n_estimators'] = extra_rounds
+    params['learning_rate'] = learning_rate
+    refreshed = XGBRegressor(**params)
+    refreshed.fit(X, y, xgb_model=model.get_booster())
+    return refreshed
+
+
+def refresh_model(model_path, paths, output_path=None, window_months=DEFAULT_WINDOW_MONTHS,
+                  holdout_months=DEFAULT_HOLDOUT_MONTHS, extra_rounds=DEFAULT_EXTRA_ROUNDS,
+                  learning_rate=DEFAULT_REFRESH_LEARNING_RATE, drift_threshold=DEFAULT_DRIFT_THRESHOLD, max_holdout_mae=None, tolerance=DEFAULT_TOLERANCE,
+                  allow_full_retrain=True, checkpoint_dir=CHECKPOINT_DIR, n_iter=6, cv=5, workers=None):
+    """
+    Refreshes the model at `model_path` with the recent months of the tractor histories under `paths` and
+    writes the result to `output_path` (default: overwrite `model_path`). Returns a JSON-serializable report
+    whose 'decision' is 'refreshed', 'full_retrain' or 'kept' (fallback needed but disabled).
+    """
+    output_path = output_path or model_path
+    files = list_history_files(paths)
+    if not files:
+        raise ValueError(f"No .csv or .parquet files found in {paths}")
+
+    start_time = time.perf_counter()
+    model = joblib.load(model_path)
+    model_features = model.get_booster().feature_names
+    feature_params = load_feature_params(model_path)
+
+    X, y, metadata, _, errors = engineer_fleet(files, REFRESH_METADATA_COLUMNS, feature_params, workers)
+    X = X.reindex(columns=model_features, fill_value=0)
+    reference, window, holdout = split_by_age(metadata, window_months, holdout_months)
+    feature_seconds = time.perf_counter() - start_time
+
+    drift = sensor_drift(X[reference], X[window])
+    max_drift = max(drift.values()) if drift else None
+    current_holdout = compute_metrics(y[holdout], model.predict(X[holdout]))
+
+    report = {
+        'model': model_path,
+        'output': output_path,
+        'files': len(files),
+        'rows': {'reference': int(reference.sum()), 'window': int(window.sum()), 'holdout': int(holdout.sum())},
+        'settings': {
+            'window_months': window_months,
+            'holdout_months': holdout_months,
+            'extra_rounds': extra_rounds,
+            'learning_rate': learning_rate,
+            'drift_threshold': drift_threshold,
+            'max_holdout_mae': max_holdout_mae,
+            'tolerance': tolerance
+        },
+        'drift': drift,
+        'max_drift': max_drift,
+        'current_holdout': current_holdout,
+        'refreshed_holdout': None,
+        'reasons': [],
+        'errors': errors
+    }
+
+    if max_drift is not None and max_drift > drift_threshold:
+        drifted = sorted(sensor for sensor, score in drift.items() if score > drift_threshold)
+        report['reasons'].append(f"sensor drift above {drift_threshold}: {', '.join(drifted)}")
+    if max_holdout_mae is not None and current_holdout['mae'] is not None and current_holdout['mae'] > max_holdout_mae:
+        report['reasons'].append(f"current holdout MAE {current_holdout['mae']:.1f} above {max_holdout_mae}")
+
+    refresh_seconds = None
+    if not report['reasons']:
+        if not window.any():
+            raise ValueError("The refresh window is empty; the histories are shorter than --holdout-months")
+        refresh_start = time.perf_counter()
+        refreshed = continue_boosting(model, X[window], y[window], extra_rounds, learning_rate)
+        refresh_seconds = time.perf_counter() - refresh_start
+        report['refreshed_holdout'] = compute_metrics(y[holdout], refreshed.predict(X[holdout]))
+
+        before, after = current_holdout['mae'], report['refreshed_holdout']['mae']
+        if before is not None and after is not None and after > before * (1 + tolerance):
+            report['reasons'].append(f"refreshed holdout MAE {after:.1f} worse than current {before:.1f}")
+        else:
+            if os.path.abspath(output_path) == os.path.abspath(model_path):
+                shutil.copyfile(model_path, f'{model_path}.previous')
+            joblib.dump(refreshed, output_path)
+            save_feature_config(feature_params, output_path)
+            quantile_model = load_quantile_model(model_path)
+            if quantile_model is not None:
+                # The intervals get the same extra rounds and are recalibrated on the holdout
+                quantile_model['model'] = continue_boosting(quantile_model['model'], X[window], y[window],
+                                                            extra_rounds, learning_rate)
+                quantile_model = calibrate_interval(quantile_model, X[holdout], y[holdout])
+                joblib.dump(quantile_model, quantile_model_path(output_path))
+                report['refreshed_interval_margin'] = quantile_model['margin']
+            report['decision'] = 'refreshed'
+
+    full_retrain_seconds = None
+    if report['reasons']:
+        if not allow_full_retrain:
+            report['decision'] = 'kept'
+        else:
+            print(f"Falling back to a full retrain: {'; '.join(report['reasons'])}")
+            retrain_start = time.perf_counter()
+            combined, _ = read_file_batch(files)
+            combined = combined.drop(columns=['source_file', 'original_sample_id'])
+            retrained, metrics = run_training_pipeline(
+                lambda: (combined, None), training_fingerprint=files_fingerprint(files),
+                checkpoint_dir=checkpoint_dir, n_iter=n_iter, cv=cv, model_filename=output_path,
+                feature_params=feature_params
+            )
+            full_retrain_seconds = time.perf_counter() - retrain_start
+            report['decision'] = 'full_retrain'
+            report['full_retrain_metrics'] = metrics
+
+    report['timing'] = {
+        'feature_seconds': feature_seconds,
+        'refresh_seconds': refresh_seconds,
+        'full_retrain_seconds': full_retrain_seconds,
+        'total_seconds': time.perf_counter() - start_time
+    }
+    return report
+
+
+def print_refresh_report(report):
+    rows = report['rows']
+    print(f"Rows: {rows['reference']} reference, {rows['window']} refresh window, {rows['holdout']} holdout.")
+    if report['max_drift'] is not None:
+        worst = max(report['drift'], key=report['drift'].get)
+        print(f"Largest sensor drift: {worst} at {report['max_drift']:.2f} reference standard deviations.")
+    print(f"Current model holdout MAE: {report['current_holdout']['mae']:.1f} hours")
+    if report['refreshed_holdout'] is not None:
+        print(f"Refreshed model holdout MAE: {report['refreshed_holdout']['mae']:.1f} hours "
+              f"({report['settings']['extra_rounds']} extra rounds in {report['timing']['refresh_seconds']:.2f} s)")
+    for reason in report['reasons']:
+        print(f"Rejected incremental refresh: {reason}")
+    print(f"Decision: {report['decision']} -> {report['output']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Continue boosting the saved RUL model on newly arrived months.")
+    parser.add_argument('paths', nargs='+', help="Folders of per-tractor .csv/.parquet histories, or individual files.")
+    parser.add_argument('--model', default=MODEL_FILENAME, help="Saved model to refresh.")
+    parser.add_argument('--output', default=None, help="Where to write the new model (default: overwrite --model).")
+    parser.add_argument('--window-months', type=int, default=DEFAULT_WINDOW_MONTHS,
+                        help="Most recent months per tractor (before the holdout) used to continue boosting.")
+    parser.add_argument('--holdout-months', type=int, default=DEFAULT_HOLDOUT_MONTHS,
+                        help="Freshest months per tractor held back to evaluate the current and refreshed model.")
+    parser.add_argument('--extra-rounds', type=int, default=DEFAULT_EXTRA_ROUNDS, help="Boosting rounds to add.")
+    parser.add_argument('--learning-rate', type=float, default=DEFAULT_REFRESH_LEARNING_RATE,
+                        help="Learning rate of the added rounds.")
+    parser.add_argument('--drift-threshold', type=float, default=DEFAULT_DRIFT_THRESHOLD,
+                        help="Sensor mean shift (in reference standard deviations) that forces a full retrain.")
+    parser.add_argument('--max-holdout-mae', type=float, default=None,
+                        help="Current-model holdout MAE (hours) above which a full retrain is forced.")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help="Relative holdout MAE increase of the refreshed model that forces a full retrain.")
+    parser.add_argument('--no-full-retrain', action='store_true',
+                        help="Keep the current model instead of retraining when the refresh is rejected.")
+    parser.add_argument('--n-iter', type=int, default=6, help="Search candidates of a full retrain.")
+    parser.add_argument('--cv', type=int, default=5, help="Cross-validation folds of a full retrain.")
+    parser.add_argument('--checkpoint-dir', default=CHECKPOINT_DIR, help="Checkpoints of a full retrain.")
+    parser.add_argument('--workers', type=int, default=None, help="Feature engineering processes (default: all cores).")
+    parser.add_argument('--report', default='refresh_report.json', help="Where to write the JSON report.")
+    args = parser.parse_args(argv)
+
+    report = refresh_model(
+        args.model, args.paths, output_path=args.output, window_months=args.window_months,
+        holdout_months=args.holdout_months, extra_rounds=args.extra_rounds,
+        learning_rate=args.learning_rate, drift_threshold=args.drift_threshold,
+        max_holdout_mae=args.max_holdout_mae, tolerance=args.tolerance, allow_full_retrain=not args.no_full_retrain,
+        checkpoint_dir=args.checkpoint_dir, n_iter=args.n_iter, cv=args.cv, workers=args.workers
+    )
+    print_refresh_report(report)
+
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport written to {args.report}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+import os
+import io
+import json
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+# Measures wall time, CPU time and memory of named pipeline stages.
+# Python-side allocations (pandas/numpy buffers included) are tracked with tracemalloc.
+# Native allocations made by XGBoost are invisible to tracemalloc, so the process RSS is also sampled
+# in a background thread while a stage runs to catch its peak.
+# With cprofile=True every stage also runs under cProfile, and the stats of the slowest stage can be dumped.
+
+RSS_SAMPLE_INTERVAL_SECONDS = 0.01
+
+
+def current_rss_bytes():
+    """Resident set size of this process, or None where /proc is not available."""
+    try:
+        with open('/proc/self/statm') as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class _RSSSampler(threading.Thread):
+    def __init__(self, interval=RSS_SAMPLE_INTERVAL_SECONDS):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak = current_rss_bytes()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            rss = current_rss_bytes()
+            if rss is not None and (self.peak is None or rss > self.peak):
+                self.peak = rss
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        rss = current_rss_bytes()
+        if rss is not None and (self.peak is None or rss > self.peak):
+            self.peak = rss
+        return self.peak
+
+
+class StageProfiler:
+    """
+    Collects one record per stage:
+
+        profiler = StageProfiler()
+        with profiler.stage('features') as record:
+            X, y = preprocess_and_engineer_features(...)
+            record['rows'], record['features'] = X.shape
+
+    Records hold wall_seconds, cpu_seconds, tracemalloc peak/net allocated bytes, RSS before/peak/after,
+    plus anything the caller adds to the yielded dict.
+    """
+
+    def __init__(self, track_allocations=True, sample_rss=True, cprofile=False):
+        self.track_allocations = track_allocations
+        self.sample_rss = sample_rss
+        self.cprofile = cprofile
+        self.stages = []
+        self._profiles = {}
+
+    @contextmanager
+    def stage(self, name, **extra):
+        record = {'stage': name, **extra}
+        started_tracing = False
+        if self.track_allocations:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+            allocated_before = tracemalloc.get_traced_memory()[0]
+        sampler = None
+        if self.sample_rss:
+            record['rss_before_bytes'] = current_rss_bytes()
+            sampler = _RSSSampler()
+            sampler.start()
+
+        profile = None
+        if self.cprofile:
+            profile = cProfile.Profile()
+            profile.enable()
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        finally:
+            record['wall_seconds'] = time.perf_counter() - wall_start
+            record['cpu_seconds'] = time.process_time() - cpu_start
+            if profile is not None:
+                profile.disable()
+                self._profiles[name] = profile
+            if sampler is not None:
+                record['rss_peak_bytes'] = sampler.stop()
+                record['rss_after_bytes'] = current_rss_bytes()
+            if self.track_allocations:
+                allocated_after, peak = tracemalloc.get_traced_memory()
+                record['python_peak_bytes'] = peak - allocated_before
+                record['python_allocated_bytes'] = allocated_after - allocated_before
+                if started_tracing:
+                    tracemalloc.stop()
+            self.stages.append(record)
+
+    def get(self, name):
+        for record in self.stages:
+            if record['stage'] == name:
+                return record
+        return None
+
+    def hottest_stage(self):
+        """Name of the stage with the largest wall time, or None before any stage ran."""
+        if not self.stages:
+            return None
+        return max(self.stages, key=lambda record: record['wall_seconds'])['stage']
+
+    def dump_hottest_profile(self, output_path, top=20):
+        """Writes the cProfile stats of the slowest stage to `output_path` and prints its top functions."""
+        profiled = [record for record in self.stages if record['stage'] in self._profiles]
+        if not profiled:
+            return None
+        hottest = max(profiled, key=lambda record: record['wall_seconds'])['stage']
+        profile = self._profiles[hottest]
+        profile.dump_stats(output_path)
+
+        stream = io.StringIO()
+        pstats.Stats(profile, stream=stream).sort_stats('cumulative').print_stats(top)
+        print(f"\n--- cProfile of hottest stage '{hottest}' (saved to {output_path}) ---")
+        print(stream.getvalue())
+        return hottest
+
+    def write_report(self, output_path, **extra):
+        """Writes the stage records (plus `extra` top-level fields) as JSON."""
+        report = {
+            **extra,
+            'total_wall_seconds': sum(record['wall_seconds'] for record in self.stages),
+            'total_cpu_seconds': sum(record['cpu_seconds'] for record in self.stages),
+            'hottest_stage': self.hottest_stage(),
+            'stages': self.stages
+        }
+        with open(output_path, 'w') as f:
+            json.dump(report, f, indent=2, default=str)
+        return report
+
+    def print_summary(self):
+        print(f"\n{'stage':<20} {'wall s':>9} {'cpu s':>9} {'py peak MB':>11} {'rss peak MB':>12}")
+        for record in self.stages:
+            py_peak = record.get('python_peak_bytes')
+            rss_peak = record.get('rss_peak_bytes')
+            print(f"{record['stage']:<20} {record['wall_seconds']:>9.3f} {record['cpu_seconds']:>9.3f} "
+                  f"{(py_peak / 1e6 if py_peak is not None else float('nan')):>11.1f} "
+                  f"{(rss_peak / 1e6 if rss_peak is not None else float('nan')):>12.1f}")
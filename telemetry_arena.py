@@ -0,0 +1,347 @@
+import os
+import json
+import time
+import fcntl
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from mae_403 import list_data_files, training_folder_path
+from evaluate_fleet import read_history_file
+
+# Shared, memory-mapped telemetry arena. Monthly records of every tractor live in one append-only file of
+# float64 rows (records.bin), and index.bin maps each sample_id to the contiguous extent holding its records.
+# Backend workers map both files read-only, so a tractor's history is a zero-copy NumPy view into the page
+# cache, paid once per node rather than once per worker.
+#   - One writer at a time appends, holding an exclusive lock on writer.lock.
+#   - Every extent has spare capacity. A full one is copied to a new extent of twice the size at the end of the
+#     file, and the old rows are never overwritten, so views handed out earlier stay valid.
+#   - Each index entry carries a sequence number that the writer makes odd while it updates the entry
+#     (a seqlock), so readers never combine the offset of one version with the length of another.
+# Only numeric columns are stored (the features are built from those), plus 'date' as days since 1970-01-01, which
+# history_frame turns back into the 'YYYY-MM-DD' strings of the history files.
+
+ARENA_CONFIG_FILENAME = 'arena.json'
+RECORDS_FILENAME = 'records.bin'
+INDEX_FILENAME = 'index.bin'
+WRITER_LOCK_FILENAME = 'writer.lock'
+
+ARENA_MAGIC = 0x52554C41
+SAMPLE_ID_BYTES = 32
+INDEX_HEADER_BYTES = 64
+INDEX_ENTRY_DTYPE = np.dtype([
+    ('sample_id', f'S{SAMPLE_ID_BYTES}'), ('seq', '<i8'), ('offset', '<i8'), ('length', '<i8'), ('capacity', '<i8')
+])
+# Header fields: magic, entries in use, rows in use
+INDEX_HEADER_FIELDS = 3
+
+# Non-numeric column stored as epoch days
+DATE_COLUMN = 'date'
+DATE_FORMAT = '%Y-%m-%d'
+
+# Smallest extent given to a tractor, and the rows / entries the files grow by at least
+MIN_EXTENT_ROWS = 32
+RECORDS_GROWTH_ROWS = 65536
+INDEX_GROWTH_ENTRIES = 4096
+
+
+def _key(sample_id):
+    key = str(sample_id).encode()
+    if len(key) > SAMPLE_ID_BYTES:
+        raise ValueError(f"sample_id {sample_id!r} is longer than {SAMPLE_ID_BYTES} bytes")
+    return key
+
+
+def _extent_rows(rows):
+    """Capacity of a new extent for `rows` records: the next power of two, at least MIN_EXTENT_ROWS."""
+    return max(MIN_EXTENT_ROWS, 1 << int(np.ceil(np.log2(max(rows, 1)))))
+
+
+def arena_columns(df):
+    """Columns an arena stores for records shaped like `df`: its numeric columns and date, without sample_id."""
+    columns = [column for column in df.select_dtypes(include='number').columns if column != 'sample_id']
+    return columns + [DATE_COLUMN] if DATE_COLUMN in df.columns and DATE_COLUMN not in columns else columns
+
+
+def create_arena(path, columns):
+    """Creates an empty arena in the folder `path` for records with the given numeric columns."""
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, ARENA_CONFIG_FILENAME), 'w') as f:
+        json.dump({'columns': list(columns)}, f, indent=2)
+    with open(os.path.join(path, RECORDS_FILENAME), 'wb') as f:
+        f.truncate(RECORDS_GROWTH_ROWS * len(columns) * 8)
+    with open(os.path.join(path, INDEX_FILENAME), 'wb') as f:
+        f.write(np.array([ARENA_MAGIC, 0, 0], dtype='<i8').tobytes().ljust(INDEX_HEADER_BYTES, b'\0'))
+        f.truncate(INDEX_HEADER_BYTES + INDEX_GROWTH_ENTRIES * INDEX_ENTRY_DTYPE.itemsize)
+    open(os.path.join(path, WRITER_LOCK_FILENAME), 'a').close()
+
+
+def arena_exists(path):
+    return os.path.exists(os.path.join(path, ARENA_CONFIG_FILENAME))
+
+
+class TelemetryArena:
+    """Read-only view of an arena. Maps are refreshed whenever the writer has grown the files."""
+
+    mode = 'r'
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, ARENA_CONFIG_FILENAME)) as f:
+            self.columns = json.load(f)['columns']
+        self.slots = {}
+        self._map()
+
+    def _map(self):
+        row_bytes = len(self.columns) * 8
+        records_path = os.path.join(self.path, RECORDS_FILENAME)
+        index_path = os.path.join(self.path, INDEX_FILENAME)
+        self.records = np.memmap(records_path, dtype='<f8', mode=self.mode,
+                                 shape=(os.path.getsize(records_path) // row_bytes, len(self.columns)))
+        self.header = np.memmap(index_path, dtype='<i8', mode=self.mode, shape=(INDEX_HEADER_FIELDS,))
+        self.entries = np.memmap(index_path, dtype=INDEX_ENTRY_DTYPE, mode=self.mode, offset=INDEX_HEADER_BYTES,
+                                 shape=((os.path.getsize(index_path) - INDEX_HEADER_BYTES) // INDEX_ENTRY_DTYPE.itemsize,))
+        if self.header[0] != ARENA_MAGIC:
+            raise ValueError(f"{index_path} is not a telemetry arena index")
+
+    def _refresh_slots(self):
+        """Picks up tractors the writer added since the last lookup."""
+        count = int(self.header[1])
+        if count > len(self.entries):
+            self._map()
+        for slot in range(len(self.slots), count):
+            self.slots[bytes(self.entries['sample_id'][slot])] = slot
+
+    def _slot(self, sample_id):
+        key = str(sample_id).encode()
+        if len(key) > SAMPLE_ID_BYTES:
+            # append rejects such ids, so they are never stored
+            return None
+        if key not in self.slots:
+            self._refresh_slots()
+        return self.slots.get(key)
+
+    def sample_ids(self):
+        self._refresh_slots()
+        return [key.decode() for key in self.slots]
+
+    def _extent(self, slot):
+        """(offset, length) of a tractor's records, read consistently with the writer's updates."""
+        entries = self.entries
+        while True:
+            seq = int(entries['seq'][slot])
+            offset, length = int(entries['offset'][slot]), int(entries['length'][slot])
+            if seq % 2 == 0 and int(entries['seq'][slot]) == seq:
+                return offset, length
+            time.sleep(0)
+
+    def versioned_history(self, sample_id, months=None):
+        """
+        (zero-copy read-only view (records x columns) of the latest `months` records of `sample_id` (all of them by
+        default), records stored so far), or (None, 0) for an unknown tractor. The count changes with every append.
+        """
+        slot = self._slot(sample_id)
+        if slot is None:
+            return None, 0
+        offset, length = self._extent(slot)
+        if offset + length > len(self.records):
+            self._map()
+        start = offset + length - min(length, months) if months is not None else offset
+        return self.records[start:offset + length], length
+
+    def history(self, sample_id, months=None):
+        return self.versioned_history(sample_id, months)[0]
+
+    def version(self, sample_id):
+        return self.versioned_history(sample_id, 0)[1]
+
+    def history_frame(self, sample_id, months=None):
+        """versioned_history with the records as a DataFrame (a copy) of the arena's columns and `sample_id`."""
+        view, version = self.versioned_history(sample_id, months)
+        if view is None:
+            return None, 0
+        frame = pd.DataFrame(np.asarray(view), columns=self.columns, copy=False).assign(sample_id=sample_id)
+        if DATE_COLUMN in self.columns:
+            frame[DATE_COLUMN] = pd.to_datetime(frame[DATE_COLUMN], unit='D').dt.strftime(DATE_FORMAT)
+        return frame, version
+
+
+class ArenaWriter(TelemetryArena):
+    """
+    The arena's single writer: `with ArenaWriter(path) as writer: writer.append(sample_id, records)`.
+    Entering blocks until no other process is writing.
+    """
+
+    mode = 'r+'
+
+    def __enter__(self):
+        self.lock_file = open(os.path.join(self.path, WRITER_LOCK_FILENAME), 'a')
+        fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        # Another writer may have grown the files or added tractors since this one mapped them
+        self._map()
+        self._refresh_slots()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.records.flush()
+        self.entries.flush()
+        self.header.flush()
+        fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        self.lock_file.close()
+
+    def _grow(self, filename, size):
+        with open(os.path.join(self.path, filename), 'r+b') as f:
+            f.truncate(size)
+        self._map()
+
+    def _allocate(self, rows):
+        """Offset of `rows` new rows at the end of the records file, growing it if needed."""
+        offset = int(self.header[2])
+        if offset + rows > len(self.records):
+            new_rows = max(2 * len(self.records), offset + rows, RECORDS_GROWTH_ROWS)
+            self._grow(RECORDS_FILENAME, new_rows * len(self.columns) * 8)
+        self.header[2] = offset + rows
+        return offset
+
+    def rows_of(self, records):
+        """
+        A DataFrame or list of record dicts as float64 rows in the arena's column order (missing columns NaN, dates
+        as epoch days).
+        """
+        df = records if isinstance(records, pd.DataFrame) else pd.DataFrame.from_records(records)
+        df = df.reindex(columns=self.columns)
+        if DATE_COLUMN in self.columns:
+            df[DATE_COLUMN] = (pd.to_datetime(df[DATE_COLUMN], errors='coerce') - pd.Timestamp(0)).dt.days
+        try:
+            return df.to_numpy(dtype=np.float64)
+        except (TypeError, ValueError):
+            return df.apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+
+    def append(self, sample_id, records):
+        """Appends `records` (DataFrame, record dicts or float64 rows) to `sample_id`; returns its record count."""
+        rows = records if isinstance(records, np.ndarray) else self.rows_of(records)
+        key = _key(sample_id)
+        slot = self._slot(sample_id)
+        entries = self.entries
+        if slot is None:
+            capacity = _extent_rows(len(rows))
+            offset = self._allocate(capacity)
+            self.records[offset:offset + len(rows)] = rows
+            slot = int(self.header[1])
+            if slot >= len(entries):
+                self._grow(INDEX_FILENAME, INDEX_HEADER_BYTES + (len(entries) + INDEX_GROWTH_ENTRIES) * INDEX_ENTRY_DTYPE.itemsize)
+                entries = self.entries
+            entries[slot] = (key, 0, offset, len(rows), capacity)
+            # Publishing the count makes the complete entry visible to readers
+            self.header[1] = slot + 1
+            self.slots[key] = slot
+            return len(rows)
+
+        offset, length = int(entries['offset'][slot]), int(entries['length'][slot])
+        capacity = int(entries['capacity'][slot])
+        if length + len(rows) <= capacity:
+            # Rows past the published length are invisible to readers until the length grows
+            self.records[offset + length:offset + length + len(rows)] = rows
+            entries['seq'][slot] += 1
+            entries['length'][slot] = length + len(rows)
+            entries['seq'][slot] += 1
+            return length + len(rows)
+
+        # Relocate to an extent twice as large; the old rows stay in place for views still using them
+        new_capacity = _extent_rows(2 * (length + len(rows)))
+        new_offset = self._allocate(new_capacity)
+        self.records[new_offset:new_offset + length] = self.records[offset:offset + length]
+        self.records[new_offset + length:new_offset + length + len(rows)] = rows
+        entries['seq'][slot] += 1
+        entries['offset'][slot] = new_offset
+        entries['length'][slot] = length + len(rows)
+        entries['capacity'][slot] = new_capacity
+        entries['seq'][slot] += 1
+        return length + len(rows)
+
+
+def ingest_files(arena_path, paths):
+    """Appends every tractor of the monthly history files `paths` to the arena, creating it if needed."""
+    if not paths:
+        return 0
+    first = read_history_file(paths[0])
+    if not arena_exists(arena_path):
+        create_arena(arena_path, arena_columns(first))
+    histories = 0
+    with ArenaWriter(arena_path) as writer:
+        for position, path in enumerate(paths):
+            df = first if position == 0 else read_history_file(path)
+            for sample_id, history in df.groupby('sample_id', sort=False):
+                writer.append(sample_id, history)
+                histories += 1
+    return histories
+
+
+def _private_bytes():
+    """Memory of this process not shared with others (Private_Clean + Private_Dirty), from /proc."""
+    total = 0
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            if line.startswith(('Private_Clean:', 'Private_Dirty:')):
+                total += int(line.split()[1]) * 1024
+    return total
+
+
+def _worker_memory(arena_path, source):
+    """Private memory a worker gains by holding every history, read from the arena or loaded from CSV files."""
+    before = _private_bytes()
+    if source == 'arena':
+        arena = TelemetryArena(arena_path)
+        histories = [arena.history(sample_id) for sample_id in arena.sample_ids()]
+        checksum = float(sum(np.nansum(history) for history in histories))
+    else:
+        frames = [read_history_file(path) for path in list_data_files(source)]
+        histories = [history for frame in frames for _, history in frame.groupby('sample_id', sort=False)]
+        checksum = float(sum(np.nansum(history.select_dtypes(include='number').to_numpy()) for history in histories))
+    return _private_bytes() - before, len(histories), checksum
+
+
+def measure_sharing(arena_path, csv_folder, workers):
+    """Private memory per worker holding all histories: mapped from the arena vs loaded from the CSV files."""
+    results = {}
+    for source in ('arena', csv_folder):
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            measured = list(pool.map(_worker_memory, [arena_path] * workers, [source] * workers))
+        results['arena' if source == 'arena' else 'csv'] = {
+            'histories': measured[0][1],
+            'private_mb_per_worker': float(np.mean([private for private, _, _ in measured])) / 2 ** 20
+        }
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build a shared telemetry arena and measure its memory sharing.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    ingest = subparsers.add_parser('ingest', help="Append monthly history files to an arena.")
+    ingest.add_argument('folder', nargs='?', default=training_folder_path, help="Folder of monthly CSV/Parquet files.")
+    ingest.add_argument('--arena', default='telemetry_arena', help="Arena folder (created if missing).")
+
+    sharing = subparsers.add_parser('sharing', help="Compare per-worker memory of arena views and CSV loading.")
+    sharing.add_argument('folder', nargs='?', default=training_folder_path, help="Folder the arena was built from.")
+    sharing.add_argument('--arena', default='telemetry_arena', help="Arena folder.")
+    sharing.add_argument('--workers', type=int, default=4, help="Worker processes.")
+    args = parser.parse_args(argv)
+
+    if args.command == 'ingest':
+        start = time.perf_counter()
+        histories = ingest_files(args.arena, list_data_files(args.folder))
+        arena = TelemetryArena(args.arena)
+        print(f"Appended {histories} tractor histories to {args.arena} in {time.perf_counter() - start:.2f} s "
+              f"({int(arena.header[2])} rows allocated for {len(arena.sample_ids())} tractors).")
+    else:
+        results = measure_sharing(args.arena, args.folder, args.workers)
+        for source, result in results.items():
+            print(f"{source:>6}: {result['histories']} histories, "
+                  f"{result['private_mb_per_worker']:.1f} MB private memory per worker")
+
+
+if __name__ == '__main__':
+    main()
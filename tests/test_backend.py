@@ -0,0 +1,45 @@
+import contextlib
+import importlib
+import io
+import os
+import sys
+
+import joblib
+import pandas as pd
+import pytest
+import xgboost
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_CSV = os.path.join(REPO_ROOT, 'frontend', 'public', 'sample_0_data.csv')
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.join(REPO_ROOT, 'backend'))
+
+from mae_403 import COLUMNS_TO_DROP, preprocess_and_engineer_features
+
+
+@pytest.fixture(scope='module')
+def client(tmp_path_factory):
+    """Test client of a backend serving a small model trained on the sample history."""
+    with contextlib.redirect_stdout(io.StringIO()):
+        X, y = preprocess_and_engineer_features(pd.read_csv(SAMPLE_CSV), COLUMNS_TO_DROP)
+    model = xgboost.XGBRegressor(n_estimators=20, max_depth=3).fit(X, y)
+    model_path = str(tmp_path_factory.mktemp('model') / 'mae_403.joblib')
+    joblib.dump(model, model_path)
+
+    os.environ['RUL_MODEL_PATH'] = model_path
+    os.environ['RUL_COMPONENT_MODELS_PATH'] = model_path + '.missing'
+    os.environ['RUL_TRAJECTORY_INDEX_PATH'] = model_path + '.missing'
+    with contextlib.redirect_stdout(io.StringIO()):
+        backend = importlib.import_module('backend')
+    return backend.app.test_client()
+
+
+def test_predict_matches_predict_batch_for_string_sample_id(client):
+    # Constant string ids used to let the sample_id sort shuffle the months of a single tractor
+    records = pd.read_csv(SAMPLE_CSV).head(40).drop(columns=['sample_id']).to_dict('records')
+    assert client.post('/telemetry', json={'sample_id': 't1', 'records': records}).status_code == 200
+
+    single = client.post('/predict', json={'sample_id': 't1'}).get_json()
+    batch = client.post('/predict_batch', json={'sample_ids': ['t1']}).get_json()
+
+    assert single['hours_until_failure'] == batch['predictions']['t1']['hours_until_failure']
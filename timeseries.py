@@ -0,0 +1,174 @@
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+from generate_failure_logs import MONTHLY_SENSOR_COLUMNS
+
+# Server-side downsampling of sensor time series for the frontend charts. A chart needs a few hundred points,
+# whatever the length of the history behind it (monthly records or the daily logs of generate_failure_logs.py),
+# so the backend reduces every series to a target point count before sending it:
+#   - 'lttb' (Largest-Triangle-Three-Buckets) keeps, per bucket, the point spanning the largest triangle with
+#     its neighbours, which preserves the visual shape of the line;
+#   - 'minmax' keeps the minimum and maximum of every bucket, so no spike disappears.
+# Both keep the first and last points and return indices into the original series, in time order.
+
+DOWNSAMPLING_ALGORITHMS = ('lttb', 'minmax')
+
+DEFAULT_SERIES_POINTS = 500
+MAX_SERIES_POINTS = 5000
+
+# Prefix of the sensor columns in the daily logs written by generate_failure_logs.py
+DAILY_TELEMETRY_PREFIX = 'telemetry_'
+
+# Columns of the monthly and daily schemas that are not sensor readings
+NON_SENSOR_COLUMNS = {
+    'sample_id', 'tractor_id', 'date', 'month', 'year', 'cumulative_hours', 'monthly_operating_hours',
+    'driver_experience_years', 'was_regular_maintenance_followed', 'failure_occurred', 'failure_imminent',
+    'type_of_failure', 'remaining_useful_life_hours', 'operating_hours_today', 'cumulative_operating_hours',
+    'is_failure', 'failed_component', 'time_until_next_failure_hours'
+}
+
+
+def lttb_indices(x, y, points):
+    """Indices of the `points` samples Largest-Triangle-Three-Buckets keeps from the series (x, y)."""
+    n = len(x)
+    if points >= n:
+        return np.arange(n)
+    if points < 3:
+        return np.array([0, n - 1][:max(points, 0)], dtype=np.int64)
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # The n - 2 inner samples split into points - 2 buckets; each contributes one sample
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    sizes = np.diff(edges)
+    mean_x = np.add.reduceat(x[1:n - 1], edges[:-1] - 1) / sizes
+    mean_y = np.add.reduceat(y[1:n - 1], edges[:-1] - 1) / sizes
+    # The triangle's third corner is the average of the next bucket, or the last sample after the last bucket
+    next_x = np.append(mean_x[1:], x[-1])
+    next_y = np.append(mean_y[1:], y[-1])
+
+    indices = np.empty(points, dtype=np.int64)
+    indices[0], indices[-1] = 0, n - 1
+    selected = 0
+    for bucket in range(points - 2):
+        start, end = edges[bucket], edges[bucket + 1]
+        areas = np.abs((x[selected] - next_x[bucket]) * (y[start:end] - y[selected])
+                       - (x[selected] - x[start:end]) * (next_y[bucket] - y[selected]))
+        selected = start + int(np.argmax(areas))
+        indices[bucket + 1] = selected
+    return indices
+
+
+def minmax_indices(x, y, points):
+    """Indices of the minimum and maximum of each of points // 2 equal-count buckets, plus the first and last samples."""
+    n = len(x)
+    if points >= n:
+        return np.arange(n)
+    if points < 4:
+        # No room for a bucket's minimum and maximum next to the first and last samples
+        return np.array([0, n - 1][:max(points, 0)], dtype=np.int64)
+    y = np.asarray(y, dtype=np.float64)
+    buckets = points // 2 - 1
+    bucket_of = np.arange(n) * buckets // n
+    # Within each bucket, samples sorted by value: the first is the minimum, the last the maximum
+    order = np.lexsort((y, bucket_of))
+    starts = np.searchsorted(bucket_of[order], np.arange(buckets))
+    ends = np.append(starts[1:], n)
+    return np.unique(np.concatenate([[0, n - 1], order[starts], order[ends - 1]]))
+
+
+def downsample(x, y, points=DEFAULT_SERIES_POINTS, algorithm='lttb'):
+    """(x, y) reduced to at most `points` samples (slightly fewer for 'minmax') in time order."""
+    if algorithm not in DOWNSAMPLING_ALGORITHMS:
+        raise ValueError(f"Unknown downsampling algorithm {algorithm!r}; expected one of {DOWNSAMPLING_ALGORITHMS}")
+    select = lttb_indices if algorithm == 'lttb' else minmax_indices
+    indices = select(x, y, points)
+    return x[indices], y[indices]
+
+
+def _sensor_name(column):
+    """Monthly-schema name of a daily log column ('telemetry_engine_oil_pressure_psi' -> 'oil_pressure_psi')."""
+    if not column.startswith(DAILY_TELEMETRY_PREFIX):
+        return column
+    sensor = column[len(DAILY_TELEMETRY_PREFIX):]
+    return MONTHLY_SENSOR_COLUMNS.get(sensor, sensor)
+
+
+def series_frame(df):
+    """
+    Sensor readings of one tractor's monthly or daily records as a DataFrame indexed by timestamp, in time order.
+    Daily log sensors are named like the monthly schema's (MONTHLY_SENSOR_COLUMNS), so a chart asks for the same
+    sensor whichever history the tractor has; daily sensors without a monthly column only lose their 'telemetry_'
+    prefix.
+    """
+    if 'date' in df.columns:
+        timestamps = pd.to_datetime(df['date'])
+    else:
+        timestamps = pd.to_datetime(pd.DataFrame({'year': df['year'], 'month': df['month'], 'day': 1}))
+    sensors = df[[column for column in df.columns if column not in NON_SENSOR_COLUMNS]]
+    sensors = sensors.select_dtypes(include='number').rename(columns=_sensor_name)
+    sensors.index = pd.DatetimeIndex(timestamps.to_numpy())
+    return sensors.sort_index(kind='stable')
+
+
+def sensor_series(frame, sensor, start=None, end=None, points=DEFAULT_SERIES_POINTS, algorithm='lttb'):
+    """
+    {'timestamps' (epoch milliseconds), 'values', 'raw_points'} of `sensor` between `start` and `end` (inclusive
+    dates or timestamps, None for open-ended), downsampled to `points`. Missing readings are skipped.
+    """
+    column = frame[sensor]
+    if start is not None or end is not None:
+        column = column.loc[start:end]
+    column = column.dropna()
+    x = column.index.asi8 // 1_000_000
+    x, y = downsample(x, column.to_numpy(dtype=np.float64), points, algorithm)
+    return {'timestamps': x.tolist(), 'values': y.tolist(), 'raw_points': int(len(column))}
+
+
+def daily_log_paths(folder):
+    """{tractor_id: path} of the daily telemetry CSVs written by generate_failure_logs.py in `folder`."""
+    paths = {}
+    if not folder or not os.path.isdir(folder):
+        return paths
+    for filename in sorted(os.listdir(folder)):
+        if not filename.endswith('.csv'):
+            continue
+        path = os.path.join(folder, filename)
+        first_row = pd.read_csv(path, usecols=lambda column: column == 'tractor_id', nrows=1)
+        if len(first_row):
+            paths[str(first_row['tractor_id'].iloc[0])] = path
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure downsampled chart payloads and latency by history length.")
+    parser.add_argument('--days', type=int, nargs='+', default=[365, 3 * 365, 10 * 365, 30 * 365],
+                        help="History lengths (daily readings) to measure.")
+    parser.add_argument('--points', type=int, default=DEFAULT_SERIES_POINTS, help="Target points per series.")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic sensor readings.")
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    print(f"{'days':>8} {'algorithm':>9} {'points':>7} {'raw KB':>8} {'chart KB':>9} {'ms':>7}")
+    for days in args.days:
+        # A noisy daily reading with a seasonal swing and a late drift, like an oil pressure before a failure
+        t = np.arange(days)
+        values = 50 + 5 * np.sin(2 * np.pi * t / 365) + rng.normal(0, 3, days) - 10 * (t > 0.9 * days) * (t - 0.9 * days) / (0.1 * days)
+        frame = pd.DataFrame({'oil_pressure_psi': np.round(values, 2)},
+                             index=pd.date_range('2000-01-01', periods=days, freq='D'))
+        raw_kb = len(json.dumps(sensor_series(frame, 'oil_pressure_psi', points=days))) / 1024
+        for algorithm in DOWNSAMPLING_ALGORITHMS:
+            start = time.perf_counter()
+            series = sensor_series(frame, 'oil_pressure_psi', points=args.points, algorithm=algorithm)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            chart_kb = len(json.dumps(series)) / 1024
+            print(f"{days:>8} {algorithm:>9} {len(series['values']):>7} {raw_kb:>8.1f} {chart_kb:>9.1f} {elapsed_ms:>7.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,201 @@
+import os
+import json
+import time
+import hashlib
+
+import joblib
+import numpy as np
+from sklearn.base import clone
+from sklearn.metrics import check_scoring
+from sklearn.model_selection import ParameterSampler, check_cv
+
+from training_scheduler import FitScheduler, estimate_fit_bytes
+
+# Checkpoints for the staged training pipeline in mae_403.py.
+# Every stage output is stored as <stage>.joblib next to a manifest.json holding the fingerprint of the
+# stage's inputs (upstream fingerprint + the configuration the stage depends on). A rerun recomputes the
+# fingerprints up front and resumes from the first stage whose fingerprint changed or whose artifact is gone.
+# Hyperparameter search candidates are appended to search_candidates.jsonl as they finish, so a search that
+# was killed part-way only runs the candidates that are missing.
+
+MANIFEST_FILENAME = 'manifest.json'
+SEARCH_CANDIDATES_FILENAME = 'search_candidates.jsonl'
+
+
+def fingerprint(*parts):
+    """Short, stable hash of JSON-serialisable `parts` (non-JSON values are hashed through str())."""
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def files_fingerprint(paths):
+    """Fingerprint of data files by name, size and modification time (their contents are not read)."""
+    entries = []
+    for path in paths:
+        stat = os.stat(path)
+        entries.append([os.path.basename(path), stat.st_size, stat.st_mtime_ns])
+    return fingerprint(entries)
+
+
+def _atomic_write_json(path, data):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+class CheckpointStore:
+    """
+    Stage outputs keyed by name, persisted under `directory` (or only kept in memory when it is None):
+
+        checkpoints = CheckpointStore('training_checkpoints')
+        if not checkpoints.is_valid('features', features_fingerprint):
+            checkpoints.save('features', features_fingerprint, {'X': X, 'y': y})
+        X = checkpoints.load('features')['X']
+
+    Loaded and saved outputs are cached, so each artifact is read from disk at most once per run.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self.manifest = {}
+        self._cache = {}
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            manifest_path = os.path.join(directory, MANIFEST_FILENAME)
+            if os.path.exists(manifest_path):
+                with open(manifest_path) as f:
+                    self.manifest = json.load(f)
+
+    def _artifact_path(self, stage):
+        return os.path.join(self.directory, f'{stage}.joblib')
+
+    def is_valid(self, stage, stage_fingerprint):
+        entry = self.manifest.get(stage)
+        if entry is None or entry['fingerprint'] != stage_fingerprint:
+            return False
+        return self.directory is None or os.path.exists(self._artifact_path(stage))
+
+    def load(self, stage):
+        if stage not in self._cache:
+            self._cache[stage] = joblib.load(self._artifact_path(stage))
+        return self._cache[stage]
+
+    def save(self, stage, stage_fingerprint, output, **info):
+        self._cache[stage] = output
+        self.manifest[stage] = {
+            'fingerprint': stage_fingerprint,
+            'completed_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            **info
+        }
+        if self.directory is None:
+            return
+        # Write the artifact before the manifest so a crash in between leaves the stage marked incomplete
+        artifact_path = self._artifact_path(stage)
+        joblib.dump(output, f'{artifact_path}.tmp')
+        os.replace(f'{artifact_path}.tmp', artifact_path)
+        _atomic_write_json(os.path.join(self.directory, MANIFEST_FILENAME), self.manifest)
+
+    def clear(self):
+        """Forgets every checkpoint and search candidate, so the next run starts from scratch."""
+        self.manifest = {}
+        self._cache = {}
+        if self.directory is None:
+            return
+        _atomic_write_json(os.path.join(self.directory, MANIFEST_FILENAME), self.manifest)
+        if os.path.exists(self.candidates_path()):
+            os.remove(self.candidates_path())
+
+    def candidates_path(self):
+        if self.directory is None:
+            return None
+        return os.path.join(self.directory, SEARCH_CANDIDATES_FILENAME)
+
+
+def _load_candidates(candidates_path, search_fingerprint):
+    """Completed candidates of the search identified by `search_fingerprint`, keyed by candidate index."""
+    completed = {}
+    if candidates_path is None or not os.path.exists(candidates_path):
+        return completed
+    with open(candidates_path) as f:
+        for line in f:
+            try:
+                candidate = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # the line being written when the process was killed
+            if candidate.get('fingerprint') == search_fingerprint:
+                completed[candidate['index']] = candidate
+    return completed
+
+
+def run_resumable_search(estimator, param_distributions, X, y, n_iter, cv, scoring, random_state=42,
+                         scheduler=None, candidates_path=None, search_fingerprint=None):
+    """
+    Randomized hyperparameter search that can be resumed. Candidates are drawn with the same ParameterSampler
+    and scored with the same unshuffled K-fold split as RandomizedSearchCV(random_state=random_state), so the
+    chosen parameters match it; each finished candidate is appended to `candidates_path`.
+    The fits of all missing candidates run through `scheduler` (a training_scheduler.FitScheduler, by default
+    one planned for this machine), which picks the concurrent fits and threads per fit.
+    The best candidate is refit on (X, y) with every core of the scheduler. Returns a dict with model,
+    best_params, best_score, candidates, resumed_candidates and the scheduler's utilization report.
+    """
+    scheduler = scheduler or FitScheduler()
+    sampled = list(ParameterSampler(param_distributions, n_iter, random_state=random_state))
+    completed = _load_candidates(candidates_path, search_fingerprint)
+    if candidates_path is not None:
+        # Drop candidates of other searches (older data or settings) so the file only describes this one
+        with open(candidates_path, 'w') as f:
+            for candidate in completed.values():
+                f.write(json.dumps(candidate) + '\n')
+
+    candidates = [None] * len(sampled)
+    pending = []
+    for index, params in enumerate(sampled):
+        params = {key: (value.item() if isinstance(value, np.generic) else value) for key, value in params.items()}
+        candidate = completed.get(index)
+        if candidate is not None and candidate['params'] == params:
+            print(f"[candidate {index + 1}/{n_iter}] resumed: mean score {candidate['mean_score']:.4f}")
+            candidates[index] = candidate
+        else:
+            pending.append((index, params))
+    resumed = len(sampled) - len(pending)
+
+    folds = list(check_cv(cv, y).split(X, y))
+    tasks = [(clone(estimator).set_params(**params), train, test) for _, params in pending for train, test in folds]
+    scheduler.plan_fits(len(tasks), estimate_fit_bytes(X, param_distributions, len(folds)) if tasks else None)
+    results = scheduler.run(tasks, X, y, check_scoring(estimator, scoring=scoring))
+    # Fits come back in task order, so the folds of each candidate arrive together and candidates finish in order
+    for index, params in pending:
+        fold_results = [next(results) for _ in folds]
+        fold_scores = [result['score'] for result in fold_results]
+        candidate = {
+            'fingerprint': search_fingerprint,
+            'index': index,
+            'params': params,
+            'fold_scores': fold_scores,
+            'mean_score': float(np.mean(fold_scores)),
+            'seconds': max(result['end'] for result in fold_results) - min(result['start'] for result in fold_results)
+        }
+        print(f"[candidate {index + 1}/{n_iter}] {params} mean score {candidate['mean_score']:.4f} "
+              f"({candidate['seconds']:.1f} s)")
+        if candidates_path is not None:
+            with open(candidates_path, 'a') as f:
+                f.write(json.dumps(candidate) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+        candidates[index] = candidate
+
+    # Ties go to the earliest candidate, as in RandomizedSearchCV
+    best = max(candidates, key=lambda candidate: candidate['mean_score'])
+    model = clone(estimator).set_params(**best['params'], n_jobs=scheduler.cores)
+    model.fit(X, y)
+    # The exported model keeps the estimator's own thread setting for prediction
+    model.set_params(n_jobs=estimator.get_params()['n_jobs'])
+    return {
+        'model': model,
+        'best_params': best['params'],
+        'best_score': best['mean_score'],
+        'candidates': candidates,
+        'resumed_candidates': resumed,
+        'utilization': scheduler.report()
+    }
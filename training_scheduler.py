@@ -0,0 +1,294 @@
+import io
+import os
+import math
+import time
+import argparse
+import warnings
+import contextlib
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed, parallel_config
+from sklearn.base import clone
+
+# Resource-aware scheduling of the hyperparameter search's model fits.
+# Nesting XGBRegressor(n_jobs=-1) inside a search with n_jobs=-1 starts one fit per core, each with a thread per
+# core: cores^2 threads fighting over the caches and memory bandwidth of `cores` cores, plus one copy of the fold
+# data and XGBoost histograms per fit. FitScheduler instead looks at the usable cores and available memory
+# (including container limits), estimates the peak memory of one fit, and picks how many fits run at once and
+# how many XGBoost threads each gets so that concurrent fits x threads per fit never exceeds the cores and the
+# fits fit in memory. Among those splits it picks the one with the shortest estimated search time, modelling
+# XGBoost's thread scaling with Amdahl's law. Every fit records its wall and CPU time, from which report()
+# derives how well the cores were used.
+
+# Share of a fit's work that XGBoost spreads over its threads (Amdahl's law); the rest runs on one thread
+XGBOOST_PARALLEL_FRACTION = 0.8
+
+# Share of the available memory that concurrent fits may use
+MEMORY_BUDGET_FRACTION = 0.8
+
+# Memory of a worker process with pandas, scikit-learn and XGBoost imported, before it receives any data
+WORKER_OVERHEAD_BYTES = 150 * 1024 ** 2
+
+# Bytes per histogram bin: a double gradient and hessian sum
+HISTOGRAM_BIN_BYTES = 16
+
+# Rows sampled to count the distinct values (and so histogram bins) of every feature
+BIN_SAMPLE_ROWS = 20000
+
+# Machine sizes planned by `python training_scheduler.py` next to the detected one
+PLANNED_CORE_COUNTS = [4, 8, 16, 32]
+
+
+def _cgroup_value(path):
+    """First number in a cgroup v2 file, or None when it is missing or unlimited ('max')."""
+    try:
+        with open(path) as f:
+            value = f.read().split()[0]
+    except (OSError, IndexError):
+        return None
+    return None if value == 'max' else int(value)
+
+
+def machine_resources():
+    """Usable cores (CPU affinity and cgroup quota) and available memory in bytes (None where unknown)."""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cores = os.cpu_count() or 1
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()[:2]
+        if quota != 'max':
+            cores = min(cores, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+
+    memory_bytes = None
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    memory_bytes = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if memory_bytes is None and hasattr(os, 'sysconf'):
+        try:
+            memory_bytes = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+        except (ValueError, OSError):
+            pass
+    limit = _cgroup_value('/sys/fs/cgroup/memory.max')
+    if limit is not None:
+        container_free = limit - (_cgroup_value('/sys/fs/cgroup/memory.current') or 0)
+        memory_bytes = container_free if memory_bytes is None else min(memory_bytes, container_free)
+    return {'cores': cores, 'memory_bytes': memory_bytes}
+
+
+def _largest(param_distributions, name, default):
+    values = param_distributions.get(name)
+    return max(values) if isinstance(values, (list, tuple)) else default
+
+
+def _smallest(param_distributions, name, default):
+    values = param_distributions.get(name)
+    return min(values) if isinstance(values, (list, tuple)) else default
+
+
+def estimate_fit_bytes(X, param_distributions, cv, max_bin=256):
+    """
+    Peak memory of one cross-validation fit of an XGBoost hist model on X, for the deepest candidate:
+    the fold's copies of X, XGBoost's float32 copy and binned matrix of the training rows, and one histogram
+    (every feature's bins) per node that can be split, on top of the worker process itself.
+    Deliberately on the high side: shallow trees or few rows per leaf rarely reach every node.
+    """
+    rows, features = X.shape
+    train_rows = rows - rows // cv
+    values = X.to_numpy() if isinstance(X, pd.DataFrame) else np.asarray(X)
+    sample = pd.DataFrame(values[:BIN_SAMPLE_ROWS])
+    bins = int(np.minimum(sample.nunique().to_numpy(), max_bin).sum())
+
+    max_depth = _largest(param_distributions, 'max_depth', 6)
+    min_child_weight = _smallest(param_distributions, 'min_child_weight', 1)
+    split_nodes = max(1, min(2 ** max_depth - 1, train_rows // (2 * max(min_child_weight, 1))))
+
+    data_bytes = values.nbytes + train_rows * features * (4 + 1)
+    return int(WORKER_OVERHEAD_BYTES + data_bytes + split_nodes * bins * HISTOGRAM_BIN_BYTES)
+
+
+def plan_parallelism(n_fits, cores, memory_bytes, fit_bytes, parallel_fraction=XGBOOST_PARALLEL_FRACTION):
+    """
+    Fits run at once and XGBoost threads per fit for `n_fits` fits of about `fit_bytes` each: the split of
+    `cores` with the shortest estimated time that keeps the concurrent fits within the memory budget.
+    Ties go to fewer concurrent fits, which need less memory.
+    """
+    memory_limit = n_fits
+    if memory_bytes is not None and fit_bytes:
+        memory_limit = max(1, int(memory_bytes * MEMORY_BUDGET_FRACTION // fit_bytes))
+
+    best = None
+    for concurrent in range(1, max(1, min(n_fits, cores, memory_limit)) + 1):
+        threads = cores // concurrent
+        makespan = math.ceil(max(n_fits, 1) / concurrent) * ((1 - parallel_fraction) + parallel_fraction / threads)
+        if best is None or makespan < best['relative_time'] - 1e-9:
+            best = {'concurrent_fits': concurrent, 'threads_per_fit': threads, 'relative_time': makespan}
+    best.update({
+        'fits': n_fits,
+        'cores': cores,
+        'memory_bytes': memory_bytes,
+        'estimated_fit_bytes': fit_bytes,
+        'memory_limited': memory_limit < min(n_fits, cores),
+        'fits_exceed_memory': (memory_bytes is not None and fit_bytes is not None and
+                               fit_bytes * best['concurrent_fits'] > memory_bytes)
+    })
+    return best
+
+
+def _fit_and_score(estimator, X, y, train, test, scorer):
+    """Fits on the train rows and scores the test rows; runs in a worker process."""
+    start, cpu_start = time.time(), time.process_time()
+    estimator.fit(X.iloc[train], y.iloc[train])
+    score = scorer(estimator, X.iloc[test], y.iloc[test])
+    return {'score': float(score), 'start': start, 'end': time.time(), 'cpu_seconds': time.process_time() - cpu_start}
+
+
+class FitScheduler:
+    """
+    Runs scikit-learn style fits with the parallelism planned for this machine:
+
+        scheduler = FitScheduler()
+        scheduler.plan_fits(len(tasks), estimate_fit_bytes(X, PARAM_DIST, cv=5))
+        for result in scheduler.run(tasks, X, y, scorer):   # tasks: (estimator, train_rows, test_rows)
+            ...
+        print_utilization(scheduler.report())
+
+    `cores` and `memory_bytes` default to what machine_resources() finds. `concurrent_fits` and
+    `threads_per_fit` fix the split instead of planning it (e.g. to reproduce nested n_jobs=-1 for comparison).
+    """
+
+    def __init__(self, cores=None, memory_bytes=None, parallel_fraction=XGBOOST_PARALLEL_FRACTION,
+                 concurrent_fits=None, threads_per_fit=None):
+        resources = machine_resources()
+        self.cores = cores or resources['cores']
+        self.memory_bytes = memory_bytes or resources['memory_bytes']
+        self.parallel_fraction = parallel_fraction
+        self.concurrent_fits = concurrent_fits
+        self.threads_per_fit = threads_per_fit
+        self.plan = None
+        self.results = []
+
+    def plan_fits(self, n_fits, fit_bytes):
+        """Plans the next run() of `n_fits` fits; its report() starts over."""
+        self.results = []
+        self.plan = plan_parallelism(n_fits, self.cores, self.memory_bytes, fit_bytes, self.parallel_fraction)
+        if self.concurrent_fits or self.threads_per_fit:
+            self.plan['concurrent_fits'] = self.concurrent_fits or self.plan['concurrent_fits']
+            self.plan['threads_per_fit'] = self.threads_per_fit or self.plan['threads_per_fit']
+            self.plan['memory_limited'] = False
+            self.plan['fits_exceed_memory'] = (self.memory_bytes is not None and fit_bytes is not None and
+                                               fit_bytes * self.plan['concurrent_fits'] > self.memory_bytes)
+        if self.plan['fits_exceed_memory']:
+            print(f"Warning: {self.plan['concurrent_fits']} fit(s) of about {fit_bytes / 1024 ** 3:.1f} GB may "
+                  f"not fit in the {self.memory_bytes / 1024 ** 3:.1f} GB available")
+        return self.plan
+
+    def run(self, tasks, X, y, scorer):
+        """Fits every (estimator, train, test) task; yields their results (score, times) in task order."""
+        tasks = list(tasks)
+        if self.plan is None:
+            self.plan_fits(len(tasks), None)
+        concurrent, threads = self.plan['concurrent_fits'], self.plan['threads_per_fit']
+        with parallel_config(backend='loky', inner_max_num_threads=threads):
+            results = Parallel(n_jobs=concurrent, return_as='generator')(
+                delayed(_fit_and_score)(clone(estimator).set_params(n_jobs=threads), X, y, train, test, scorer)
+                for estimator, train, test in tasks
+            )
+            for result in results:
+                self.results.append(result)
+                yield result
+
+    def report(self):
+        """The plan plus the measured wall time, CPU time and core utilization of the fits run so far."""
+        report = dict(self.plan or {}, completed_fits=len(self.results))
+        if not self.results:
+            return report
+        starts = np.array([result['start'] for result in self.results])
+        ends = np.array([result['end'] for result in self.results])
+        wall = float(ends.max() - starts.min())
+        cpu = float(sum(result['cpu_seconds'] for result in self.results))
+        threads = self.plan['threads_per_fit']
+        # Sweep over fit start (+1) and end (-1) events; ends sort first at equal times
+        events = sorted([(end, -1) for end in ends] + [(start, 1) for start in starts])
+        report.update({
+            'wall_seconds': wall,
+            'cpu_seconds': cpu,
+            'cpu_utilization': cpu / (self.cores * wall) if wall else None,
+            'thread_utilization': float((ends - starts).sum()) * threads / (self.cores * wall) if wall else None,
+            'peak_concurrent_fits': int(np.cumsum([change for _, change in events]).max())
+        })
+        return report
+
+
+def print_utilization(report):
+    if not report.get('fits'):
+        print("Scheduler: no fits to run.")
+        return
+    memory = report.get('memory_bytes')
+    memory_text = f"{memory / 1024 ** 3:.1f} GB available" if memory else "unknown memory"
+    print(f"Scheduler: {report['cores']} cores, {memory_text}, about "
+          f"{(report['estimated_fit_bytes'] or 0) / 1024 ** 2:.0f} MB per fit -> {report['concurrent_fits']} "
+          f"concurrent fit(s) x {report['threads_per_fit']} thread(s)"
+          f"{' (limited by memory)' if report['memory_limited'] else ''}.")
+    if report.get('wall_seconds'):
+        print(f"Scheduler: {report['completed_fits']} fits in {report['wall_seconds']:.1f} s, "
+              f"{report['cpu_seconds']:.1f} CPU s; CPU utilization {report['cpu_utilization']:.0%}, "
+              f"thread slots busy {report['thread_utilization']:.0%}, peak {report['peak_concurrent_fits']} "
+              f"concurrent fits.")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Plan the training search's parallelism for this machine.")
+    parser.add_argument('--synthetic-samples', type=int, default=40, help="Synthetic tractors whose features size the fits.")
+    parser.add_argument('--seed', type=int, default=42, help="Seed of the synthetic tractors.")
+    parser.add_argument('--n-iter', type=int, default=6, help="Hyperparameter candidates of the search.")
+    parser.add_argument('--cv', type=int, default=5, help="Cross-validation folds per candidate.")
+    parser.add_argument('--core-counts', type=int, nargs='+', default=PLANNED_CORE_COUNTS,
+                        help="Machine sizes to plan for besides the detected one.")
+    parser.add_argument('--run', action='store_true',
+                        help="Also run the search nested (n_jobs=-1 twice) and scheduled, and compare them.")
+    args = parser.parse_args(argv)
+
+    from generate_synthetic_data import generate_fleet
+    from mae_403 import COLUMNS_TO_DROP, FEATURE_PARAMS, PARAM_DIST, preprocess_and_engineer_features
+
+    fleet_df = next(generate_fleet(args.synthetic_samples, seed=args.seed, batch_size=args.synthetic_samples))
+    with warnings.catch_warnings(), contextlib.redirect_stdout(io.StringIO()):
+        warnings.simplefilter('ignore', pd.errors.PerformanceWarning)
+        X, y = preprocess_and_engineer_features(fleet_df, COLUMNS_TO_DROP, **FEATURE_PARAMS)
+
+    n_fits = args.n_iter * args.cv
+    fit_bytes = estimate_fit_bytes(X, PARAM_DIST, args.cv)
+    resources = machine_resources()
+    print(f"{X.shape[0]} rows x {X.shape[1]} features, {n_fits} fits, about {fit_bytes / 1024 ** 2:.0f} MB per fit.")
+    print(f"{'cores':>6} {'concurrent':>11} {'threads':>8} {'nested threads':>15} {'memory limited':>15}")
+    for cores in [resources['cores']] + [count for count in args.core_counts if count != resources['cores']]:
+        plan = plan_parallelism(n_fits, cores, resources['memory_bytes'], fit_bytes)
+        # Nested n_jobs=-1: RandomizedSearchCV hands all n_iter x cv fits to one joblib pool of `cores` workers, so
+        # min(n_fits, cores) fits run at once, each with XGBoost's `cores` threads
+        nested_threads = min(n_fits, cores) * cores
+        print(f"{cores:>6} {plan['concurrent_fits']:>11} {plan['threads_per_fit']:>8} {nested_threads:>15} "
+              f"{str(plan['memory_limited']):>15}")
+
+    if args.run:
+        from mae_403 import tune_model
+        cores = resources['cores']
+        nested = FitScheduler(concurrent_fits=min(n_fits, cores), threads_per_fit=cores)
+        for name, scheduler in [('nested', nested), ('scheduled', FitScheduler())]:
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                search = tune_model(X, y, n_iter=args.n_iter, cv=args.cv, scheduler=scheduler)
+            print(f"{name}: {time.perf_counter() - start:.1f} s, best score {search['best_score']:.1f}")
+            print_utilization(search['utilization'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,307 @@
+import time
+import argparse
+import warnings
+
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import KDTree
+
+from mae_403 import load_data_folder, training_folder_path
+from generate_synthetic_data import SENSOR_BASELINES, TYPES_OF_FAILURES
+
+# Nearest-neighbour search over the degradation trajectories of historical tractors. Every tractor-month is
+# embedded from its last TRAJECTORY_MONTHS months of raw telemetry: per sensor the latest reading, its mean and
+# its change over the window (as positions in the sensor's SENSOR_BASELINES range), plus the tractor's age.
+# The first build fits a linear projection to EMBEDDING_DIMS dimensions, small enough for KD-trees to prune
+# well: the features are standardised, weighted by their correlation with log RUL (sensor noise dominates the
+# unweighted variance, so plain PCA keeps noise) and reduced by PCA.
+# The index grows as labelled months arrive: new cases land in a small buffer that is searched exhaustively,
+# and full buffers become KD-tree segments that are merged whenever two have similar sizes (a logarithmic
+# method), so every case is re-indexed O(log n) times and a query visits O(log n) trees.
+# Months with a missing sensor reading are not indexed (their embedding would not be finite); a query with one
+# is embedded with that feature at the index's mean, so the missing sensor does not move it.
+
+TRAJECTORY_INDEX_FILENAME = 'trajectory_index.joblib'
+
+TRAJECTORY_MONTHS = 6
+EMBEDDING_DIMS = 8
+
+# Cumulative hours per unit of the age feature, comparable to a full range of one sensor
+AGE_SCALE = 5000.0
+
+# Cases kept in the exhaustively searched buffer before it becomes a KD-tree segment
+BUFFER_ROWS = 256
+LEAF_SIZE = 40
+
+DEFAULT_NEIGHBORS = 5
+
+SENSORS = list(SENSOR_BASELINES)
+FAILURE_NAMES = {index: name for name, index in TYPES_OF_FAILURES.items()}
+
+
+def trajectory_features(df):
+    """
+    Raw trajectory features of every row of `df` (monthly records with sample_id, in time order per tractor),
+    computed over each tractor's previous TRAJECTORY_MONTHS months; shape (rows, 3 * sensors + 1).
+    Missing sensor columns or readings give NaN features.
+    """
+    lows = np.array([SENSOR_BASELINES[sensor][0] for sensor in SENSORS])
+    widths = np.array([SENSOR_BASELINES[sensor][1] - SENSOR_BASELINES[sensor][0] for sensor in SENSORS])
+    sensors = df.reindex(columns=SENSORS).apply(pd.to_numeric, errors='coerce')
+    positions = pd.DataFrame((sensors.to_numpy(dtype=np.float64) - lows) / widths, index=df.index)
+    grouped = positions.groupby(df['sample_id'].to_numpy(), sort=False)
+    window_mean = grouped.rolling(TRAJECTORY_MONTHS, min_periods=1).mean().reset_index(level=0, drop=True)
+    change = positions - grouped.shift(TRAJECTORY_MONTHS - 1)
+    return np.column_stack([
+        positions.to_numpy(),
+        window_mean.loc[df.index].to_numpy(),
+        change.fillna(0.0).to_numpy(),
+        pd.to_numeric(df['cumulative_hours'], errors='coerce').to_numpy(dtype=np.float64) / AGE_SCALE
+    ])
+
+
+def latest_trajectory_features(history):
+    """trajectory_features of the latest month of one tractor's `history` (in time order), without pandas grouping."""
+    lows = np.array([SENSOR_BASELINES[sensor][0] for sensor in SENSORS])
+    widths = np.array([SENSOR_BASELINES[sensor][1] - SENSOR_BASELINES[sensor][0] for sensor in SENSORS])
+    window = history.tail(TRAJECTORY_MONTHS)
+    sensors = window.reindex(columns=SENSORS).apply(pd.to_numeric, errors='coerce')
+    positions = (sensors.to_numpy(dtype=np.float64) - lows) / widths
+    change = positions[-1] - positions[0] if len(positions) == TRAJECTORY_MONTHS else np.zeros(len(SENSORS))
+    with warnings.catch_warnings():
+        # A sensor missing from every month of the window has a NaN mean, which embed() treats as missing
+        warnings.simplefilter('ignore', RuntimeWarning)
+        window_mean = np.nanmean(positions, axis=0)
+    return np.concatenate([
+        positions[-1], window_mean, np.nan_to_num(change),
+        [float(pd.to_numeric(window['cumulative_hours'], errors='coerce').iloc[-1]) / AGE_SCALE]
+    ])
+
+
+def _empty_cases():
+    return {'sample_id': np.empty(0, dtype=object), 'cumulative_hours': np.empty(0),
+            'remaining_useful_life_hours': np.empty(0), 'type_of_failure': np.empty(0, dtype=np.int64)}
+
+
+def _concat_cases(cases):
+    return {field: np.concatenate([part[field] for part in cases]) for field in cases[0]}
+
+
+class TrajectoryIndex:
+    """Incrementally built KD-tree index of embedded tractor-months and their RUL outcomes."""
+
+    def __init__(self, mean, components):
+        self.mean = mean
+        self.components = components
+        # Each segment: {'tree': KDTree, 'cases': {field: array}}; the buffer holds cases not yet in a tree
+        self.segments = []
+        self.buffer_vectors = np.empty((0, components.shape[1]))
+        self.buffer_cases = _empty_cases()
+
+    @classmethod
+    def fit(cls, df, dims=EMBEDDING_DIMS):
+        """Index of the labelled months of `df`, with the embedding's projection fitted on them."""
+        features = trajectory_features(df)
+        outcome = pd.to_numeric(df['remaining_useful_life_hours'], errors='coerce').to_numpy(dtype=np.float64)
+        labelled = np.isfinite(outcome) & np.isfinite(features).all(axis=1)
+        fit_features = features[labelled]
+        log_rul = np.log1p(np.clip(outcome[labelled], 0, None))
+        mean = fit_features.mean(axis=0)
+        scale = fit_features.std(axis=0)
+        scale[scale == 0] = 1.0
+        standardized = (fit_features - mean) / scale
+        # Correlation of every standardised feature with log RUL (features that never vary get no weight)
+        centered_rul = log_rul - log_rul.mean()
+        weights = np.abs(standardized.T @ centered_rul) / (len(log_rul) * (centered_rul.std() or 1.0))
+        _, _, vt = np.linalg.svd(standardized * weights, full_matrices=False)
+        index = cls(mean, (weights / scale)[:, None] * vt[:dims].T)
+        return index.add(df, features)
+
+    def embed(self, features):
+        """Embedding of trajectory features; non-finite features count as the index's mean."""
+        centered = features - self.mean
+        return np.where(np.isfinite(centered), centered, 0.0) @ self.components
+
+    def __len__(self):
+        return sum(len(segment['tree'].data) for segment in self.segments) + len(self.buffer_vectors)
+
+    def add(self, df, features=None):
+        """
+        Adds the months of `df` that have a remaining_useful_life_hours label and finite trajectory features.
+        `df` should start TRAJECTORY_MONTHS - 1 months before the first month to add; `features` can pass its
+        trajectory_features.
+        """
+        features = trajectory_features(df) if features is None else features
+        outcome = pd.to_numeric(df['remaining_useful_life_hours'], errors='coerce').to_numpy(dtype=np.float64)
+        labelled = np.isfinite(outcome) & np.isfinite(features).all(axis=1)
+        if not labelled.any():
+            return self
+        failure = (pd.to_numeric(df['type_of_failure'], errors='coerce') if 'type_of_failure' in df
+                   else pd.Series(np.nan, index=df.index))
+        cases = {
+            'sample_id': df['sample_id'].to_numpy(dtype=object)[labelled],
+            'cumulative_hours': pd.to_numeric(df['cumulative_hours'], errors='coerce').to_numpy(dtype=np.float64)[labelled],
+            'remaining_useful_life_hours': outcome[labelled],
+            'type_of_failure': failure.fillna(-1).to_numpy(dtype=np.int64)[labelled]
+        }
+        self.buffer_vectors = np.vstack([self.buffer_vectors, self.embed(features[labelled])])
+        self.buffer_cases = _concat_cases([self.buffer_cases, cases])
+        if len(self.buffer_vectors) >= BUFFER_ROWS:
+            self._flush()
+        return self
+
+    def _flush(self):
+        """Turns the buffer into a segment, merging it with the newest segments while they are at most twice its size."""
+        vectors, cases = self.buffer_vectors, self.buffer_cases
+        while self.segments and len(self.segments[-1]['tree'].data) <= 2 * len(vectors):
+            segment = self.segments.pop()
+            vectors = np.vstack([np.asarray(segment['tree'].data), vectors])
+            cases = _concat_cases([segment['cases'], cases])
+        self.segments.append({'tree': KDTree(vectors, leaf_size=LEAF_SIZE), 'cases': cases})
+        self.buffer_vectors = np.empty((0, self.components.shape[1]))
+        self.buffer_cases = _empty_cases()
+
+    def _nearest(self, vector, k):
+        """(distances, cases) of the k nearest cases over all segments and the buffer, nearest first."""
+        distances, cases = [], []
+        for segment in self.segments:
+            found_distances, found = segment['tree'].query(vector[None, :], k=min(k, len(segment['tree'].data)))
+            distances.append(found_distances[0])
+            cases.append({field: values[found[0]] for field, values in segment['cases'].items()})
+        if len(self.buffer_vectors):
+            buffer_distances = np.linalg.norm(self.buffer_vectors - vector, axis=1)
+            nearest = np.argsort(buffer_distances)[:k]
+            distances.append(buffer_distances[nearest])
+            cases.append({field: values[nearest] for field, values in self.buffer_cases.items()})
+        if not cases:
+            return np.empty(0), _empty_cases()
+        distances = np.concatenate(distances)
+        order = np.argsort(distances, kind='stable')[:k]
+        return distances[order], {field: values[order] for field, values in _concat_cases(cases).items()}
+
+    def query(self, history, k=DEFAULT_NEIGHBORS, exclude_sample_id=None, distinct_tractors=True):
+        """
+        The k historical cases closest to the latest month of `history` (one tractor's records in time order),
+        as a list of dicts nearest first. Cases of `exclude_sample_id` are skipped and, with `distinct_tractors`,
+        only the closest month of every tractor is returned.
+        """
+        return self.query_vector(self.embed(latest_trajectory_features(history)), k, exclude_sample_id,
+                                 distinct_tractors)
+
+    def query_vector(self, vector, k=DEFAULT_NEIGHBORS, exclude_sample_id=None, distinct_tractors=True):
+        """query for an already embedded tractor-month."""
+        # Neighbouring months of one tractor are usually close to each other, so fetch a few per tractor
+        fetch = k * TRAJECTORY_MONTHS if distinct_tractors else k + 1
+        while True:
+            distances, cases = self._nearest(vector, fetch)
+            keep = np.ones(len(distances), dtype=bool)
+            sample_ids = cases['sample_id'].astype(str)
+            if exclude_sample_id is not None:
+                keep &= sample_ids != str(exclude_sample_id)
+            if distinct_tractors:
+                first = np.zeros(len(distances), dtype=bool)
+                first[np.unique(sample_ids, return_index=True)[1]] = True
+                keep &= first
+            if keep.sum() >= k or fetch >= len(self):
+                break
+            fetch *= 4
+        selected = np.flatnonzero(keep)[:k]
+        # numpy scalars (ids read from CSV) as plain Python values for JSON
+        sample_ids = [getattr(sample_id, 'item', lambda: sample_id)() for sample_id in cases['sample_id'][selected]]
+        return [
+            {
+                'sample_id': sample_ids[position],
+                'cumulative_hours': float(cases['cumulative_hours'][i]),
+                'remaining_useful_life_hours': float(cases['remaining_useful_life_hours'][i]),
+                'failure': FAILURE_NAMES.get(int(cases['type_of_failure'][i])),
+                'distance': float(distances[i])
+            }
+            for position, i in enumerate(selected)
+        ]
+
+    def save(self, path=TRAJECTORY_INDEX_FILENAME):
+        # Plain state rather than the instance, so the file loads wherever the class is imported from
+        joblib.dump({
+            'mean': self.mean, 'components': self.components, 'segments': self.segments,
+            'buffer_vectors': self.buffer_vectors, 'buffer_cases': self.buffer_cases
+        }, path)
+
+    @classmethod
+    def load(cls, path=TRAJECTORY_INDEX_FILENAME):
+        state = joblib.load(path)
+        index = cls(state['mean'], state['components'])
+        index.segments = state['segments']
+        index.buffer_vectors, index.buffer_cases = state['buffer_vectors'], state['buffer_cases']
+        return index
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the similar-trajectory index and measure its queries.")
+    parser.add_argument('--synthetic-samples', type=int, default=None,
+                        help="Index this many tractors generated in memory instead of reading training_data_csv.")
+    parser.add_argument('--seed', type=int, default=42, help="Seed for --synthetic-samples.")
+    parser.add_argument('--queries', type=int, default=200,
+                        help="Held-out tractor-months queried to measure latency and the neighbours' RUL error.")
+    parser.add_argument('--k', type=int, default=DEFAULT_NEIGHBORS, help="Neighbours per query.")
+    parser.add_argument('--output', default=TRAJECTORY_INDEX_FILENAME, help="Where to write the index.")
+    args = parser.parse_args(argv)
+
+    if args.synthetic_samples:
+        from generate_synthetic_data import generate_fleet
+        fleet_df = next(generate_fleet(args.synthetic_samples, seed=args.seed, batch_size=args.synthetic_samples))
+    else:
+        fleet_df = load_data_folder(training_folder_path, 'training')
+        if fleet_df is None:
+            print(f"No CSV files found in the training folder: {training_folder_path}")
+            return
+
+    # Tractors are added in chunks, the way months arrive, and a tenth are held out as queries
+    sample_ids = pd.unique(fleet_df['sample_id'])
+    rng = np.random.default_rng(args.seed)
+    held_out = set(rng.choice(sample_ids, size=max(1, len(sample_ids) // 10), replace=False))
+    indexed = fleet_df[~fleet_df['sample_id'].isin(held_out)]
+    indexed_ids = pd.unique(indexed['sample_id'])
+    chunks = np.array_split(indexed_ids, min(10, len(indexed_ids)))
+
+    start = time.perf_counter()
+    index = TrajectoryIndex.fit(indexed[indexed['sample_id'].isin(chunks[0])])
+    for chunk in chunks[1:]:
+        index.add(indexed[indexed['sample_id'].isin(chunk)])
+    print(f"Indexed {len(index)} tractor-months of {len(indexed_ids)} tractors in {time.perf_counter() - start:.2f} s "
+          f"({len(index.segments)} segments, {len(index.buffer_vectors)} buffered).")
+
+    queries = fleet_df[fleet_df['sample_id'].isin(held_out)]
+    query_rows = rng.choice(len(queries), size=min(args.queries, len(queries)), replace=False)
+    histories = [queries.iloc[:row + 1][queries['sample_id'].iloc[:row + 1] == queries['sample_id'].iloc[row]]
+                 for row in query_rows]
+
+    start = time.perf_counter()
+    vectors = [index.embed(latest_trajectory_features(history)) for history in histories]
+    embed_ms = (time.perf_counter() - start) * 1000 / len(histories)
+
+    start = time.perf_counter()
+    results = [index.query_vector(vector, k=args.k) for vector in vectors]
+    query_ms = (time.perf_counter() - start) * 1000 / len(histories)
+
+    # Exhaustive search over the same embeddings, for comparison
+    all_vectors = np.vstack([np.asarray(segment['tree'].data) for segment in index.segments] + [index.buffer_vectors])
+    start = time.perf_counter()
+    for vector in vectors:
+        np.argpartition(np.linalg.norm(all_vectors - vector, axis=1), args.k)[:args.k]
+    brute_ms = (time.perf_counter() - start) * 1000 / len(histories)
+
+    actual = np.array([history['remaining_useful_life_hours'].iloc[-1] for history in histories])
+    neighbour_rul = np.array([np.median([case['remaining_useful_life_hours'] for case in cases]) for cases in results])
+    fleet_median = indexed['remaining_useful_life_hours'].median()
+    print(f"Embedding: {embed_ms:.2f} ms per query. Search for k={args.k}: {query_ms:.2f} ms with the index, "
+          f"{brute_ms:.2f} ms exhaustive.")
+    print(f"Median neighbour RUL vs actual on {len(histories)} held-out months: "
+          f"MAE {np.mean(np.abs(neighbour_rul - actual)):.0f} h (fleet median RUL: {np.mean(np.abs(fleet_median - actual)):.0f} h).")
+
+    index.save(args.output)
+    print(f"Trajectory index saved to {args.output}")
+
+
+if __name__ == '__main__':
+    main()